@@ -0,0 +1,322 @@
+"""Benchmark html2md fetch, convert and export hot paths.
+
+Serves a versioned HTML corpus from a local stub origin and measures:
+
+* per-stage latency percentiles (fetch, decode, convert per engine),
+* end-to-end ``html2md --batch`` pages/sec and peak RSS,
+* ``html2md-log-export`` rows/sec and peak RSS on generated JSONL.
+
+Results are written as JSON so runs can be compared across releases::
+
+    python benchmarks/run.py --out bench.json
+    python benchmarks/run.py --export-mb 4096 --skip-cli   # multi-GB export
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'src'))
+
+from html2md import __version__  # noqa: E402  # pylint: disable=wrong-import-position
+from html2md.convert import ENGINES, get_engine  # noqa: E402  # pylint: disable=wrong-import-position
+
+CORPUS_VERSION = 'v1'
+CORPUS_DIR = Path(__file__).resolve().parent / 'corpus' / CORPUS_VERSION
+# Just under the CLI's 10 MB download limit, so the page is still converted.
+WORST_CASE_BYTES = 10 * 1024 * 1024 - 64 * 1024
+
+
+def load_corpus(worst_case: bool = True) -> Dict[str, bytes]:
+    """Return the corpus pages by name, plus the generated worst case."""
+    pages = {path.stem: path.read_bytes() for path in sorted(CORPUS_DIR.glob('*.html'))}
+    if worst_case:
+        pages['worst_case_10mb'] = build_worst_case(pages['article'])
+    return pages
+
+
+def build_worst_case(article: bytes) -> bytes:
+    """Repeat the article body into a deterministic ~10 MB single page."""
+    start = article.index(b'<article>')
+    end = article.index(b'</article>') + len(b'</article>')
+    body = article[start:end]
+    head = b'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Worst case</title></head><body>'
+    tail = b'</body></html>'
+    copies = (WORST_CASE_BYTES - len(head) - len(tail)) // len(body)
+    return head + body * copies + tail
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Serve corpus pages at ``/<name>`` with a fixed Content-Length."""
+
+    pages: Dict[str, bytes] = {}
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve one page or 404."""
+        body = self.pages.get(self.path.lstrip('/').split('?')[0])
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keep benchmark output quiet."""
+
+
+@contextlib.contextmanager
+def stub_origin(pages: Dict[str, bytes]) -> Iterator[str]:
+    """Serve ``pages`` on an ephemeral localhost port and yield the base URL."""
+    handler = type('Handler', (_StubHandler,), {'pages': pages})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summarize latency samples (seconds) as millisecond percentiles."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        'count': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'p50_ms': pick(0.50),
+        'p90_ms': pick(0.90),
+        'p99_ms': pick(0.99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+def _max_rss_kb(rusage) -> Optional[int]:
+    """Normalize ``ru_maxrss`` to KiB (macOS reports bytes)."""
+    if rusage is None:
+        return None
+    rss = rusage.ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def _self_rss_kb() -> Optional[int]:
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:  # Windows
+        return None
+    return _max_rss_kb(resource.getrusage(resource.RUSAGE_SELF))
+
+
+def _run_child(cmd: List[str]) -> Dict[str, object]:
+    """Run ``cmd`` and return its exit code, wall time and peak RSS."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(ROOT / 'src'), env.get('PYTHONPATH')]))
+    started = time.perf_counter()
+    with tempfile.TemporaryFile() as errfile:
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=errfile, env=env)
+        rusage = None
+        if hasattr(os, 'wait4'):
+            _, status, rusage = os.wait4(proc.pid, 0)
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            proc.returncode = code
+        else:
+            code = proc.wait()
+        errfile.seek(0)
+        stderr = errfile.read()
+    return {
+        'exit_code': code,
+        'wall_s': round(time.perf_counter() - started, 4),
+        'peak_rss_kb': _max_rss_kb(rusage),
+        'stderr_tail': stderr.decode('utf-8', 'replace')[-500:] if code else '',
+    }
+
+
+def bench_stages(base_url: str, pages: Dict[str, bytes], iterations: int,
+                 engines: List[str]) -> Dict[str, object]:
+    """Time fetch, decode and convert separately for every corpus page."""
+    import requests  # pylint: disable=import-outside-toplevel
+
+    converters = {name: get_engine(name) for name in engines}
+    session = requests.Session()
+    results: Dict[str, object] = {}
+    for name, body in pages.items():
+        fetch, decode, convert = [], [], {engine: [] for engine in engines}
+        runs = iterations if len(body) < 1024 * 1024 else max(1, iterations // 10)
+        for _ in range(runs):
+            started = time.perf_counter()
+            response = session.get(f'{base_url}/{name}', timeout=30, stream=True)
+            content = b''.join(response.iter_content(chunk_size=8192))
+            response.close()
+            fetched = time.perf_counter()
+            html = content.decode(response.encoding or 'utf-8', errors='replace')
+            fetch.append(fetched - started)
+            decode.append(time.perf_counter() - fetched)
+            for engine, converter in converters.items():
+                started = time.perf_counter()
+                converter.convert(html)
+                convert[engine].append(time.perf_counter() - started)
+        results[name] = {
+            'bytes': len(body),
+            'fetch': percentiles(fetch),
+            'decode': percentiles(decode),
+            'convert': {engine: percentiles(s) for engine, s in convert.items()},
+        }
+    session.close()
+    return results
+
+
+def bench_cli(base_url: str, pages: Dict[str, bytes], repeat: int, engines: List[str],
+              jobs: int) -> Dict[str, object]:
+    """Run ``html2md --batch`` end to end against the stub origin.
+
+    ``--no-cache`` keeps an inherited ``HTML2MD_CACHE_DIR`` from turning the
+    timed conversions into cache hits.
+    """
+    results: Dict[str, object] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        batch = Path(tmp) / 'urls.txt'
+        urls = [f'{base_url}/{name}?r={i}' for i in range(repeat) for name in pages]
+        batch.write_text('\n'.join(urls) + '\n', encoding='utf-8')
+        for engine in engines:
+            outdir = Path(tmp) / f'out-{engine}'
+            run = _run_child([sys.executable, '-m', 'html2md', '--batch', str(batch),
+                              '--outdir', str(outdir), '--engine', engine,
+                              '--jobs', str(jobs), '--no-cache'])
+            run['pages'] = len(urls)
+            run['pages_per_s'] = round(len(urls) / run['wall_s'], 2) if run['wall_s'] else None
+            results[engine] = run
+    return results
+
+
+def generate_jsonl(path: Path, target_bytes: int, seed: int = 0) -> int:
+    """Write synthetic html2md run-log records until ``target_bytes``. Returns rows."""
+    rng = random.Random(seed)
+    statuses = ['ok'] * 8 + ['error', 'skipped']
+    reasons = ['', 'timeout', 'http 503', 'too large', '=cmd|calc']
+    rows = 0
+    written = 0
+    with path.open('w', encoding='utf-8', newline='\n') as f:
+        while written < target_bytes:
+            lines = []
+            for _ in range(1000):
+                rows += 1
+                lines.append(json.dumps({
+                    'ts': f'2024-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00Z',
+                    'input': f'https://host{rng.randint(1, 500)}.example.com/page/{rows}',
+                    'output': f'out/page{rows}.md',
+                    'status': rng.choice(statuses),
+                    'reason': rng.choice(reasons),
+                    'bytes': rng.randint(500, 2_000_000),
+                }))
+            chunk = '\n'.join(lines) + '\n'
+            f.write(chunk)
+            written += len(chunk)
+    return rows
+
+
+def bench_export(size_mb: int, workers: int = 1) -> Dict[str, object]:
+    """Export ``size_mb`` of generated JSONL to CSV with html2md-log-export."""
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / 'run.jsonl'
+        rows = generate_jsonl(src, size_mb * 1024 * 1024)
+        run = _run_child([sys.executable, '-m', 'html2md.log_export',
+                          '--in', str(src), '--out', str(Path(tmp) / 'run.csv'),
+                          '--workers', str(workers)])
+        run['rows'] = rows
+        run['input_bytes'] = src.stat().st_size
+        run['rows_per_s'] = round(rows / run['wall_s'], 1) if run['wall_s'] else None
+        run['mb_per_s'] = round(run['input_bytes'] / 1048576 / run['wall_s'], 2) if run['wall_s'] else None
+    return run
+
+
+def main(argv=None):
+    """Run the benchmark suite and write JSON results."""
+    ap = argparse.ArgumentParser(
+        prog='html2md-bench',
+        description='Benchmark html2md fetch, convert and export hot paths.'
+    )
+    ap.add_argument('--out', help='Write JSON results here (default: stdout)')
+    ap.add_argument('--iterations', type=int, default=20,
+                    help='Samples per page for stage latencies (default: 20)')
+    ap.add_argument('--engines', default=','.join(sorted(ENGINES)),
+                    help='Comma-separated engines to benchmark (default: all)')
+    ap.add_argument('--cli-repeat', type=int, default=5,
+                    help='How many times each page appears in the CLI batch (default: 5)')
+    ap.add_argument('--jobs', type=int, default=1, help='--jobs passed to the CLI (default: 1)')
+    ap.add_argument('--export-mb', type=int, default=128,
+                    help='Size of the generated JSONL log for the export benchmark (default: 128)')
+    ap.add_argument('--export-workers', type=int, default=1,
+                    help='--workers passed to html2md-log-export (default: 1)')
+    ap.add_argument('--no-worst-case', action='store_true',
+                    help='Skip the generated 10 MB worst-case page')
+    ap.add_argument('--skip-stages', action='store_true', help='Skip the stage benchmark')
+    ap.add_argument('--skip-cli', action='store_true', help='Skip the CLI benchmark')
+    ap.add_argument('--skip-export', action='store_true', help='Skip the export benchmark')
+    args = ap.parse_args(argv)
+
+    engines = [e.strip() for e in args.engines.split(',') if e.strip()]
+    unknown = [e for e in engines if e not in ENGINES]
+    if unknown:
+        print(f"Error: unknown engine(s): {', '.join(unknown)}", file=sys.stderr)
+        return 1
+
+    pages = load_corpus(worst_case=not args.no_worst_case)
+    results: Dict[str, object] = {
+        'schema': 1,
+        'html2md_version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'corpus': {
+            'version': CORPUS_VERSION,
+            'pages': {name: {'bytes': len(body), 'sha256': hashlib.sha256(body).hexdigest()}
+                      for name, body in pages.items()},
+        },
+        'settings': vars(args),
+    }
+
+    with stub_origin(pages) as base_url:
+        if not args.skip_stages:
+            results['stages'] = bench_stages(base_url, pages, args.iterations, engines)
+            results['stages_peak_rss_kb'] = _self_rss_kb()
+        if not args.skip_cli:
+            results['cli'] = bench_cli(base_url, pages, args.cli_repeat, engines, args.jobs)
+    if not args.skip_export:
+        results['export'] = bench_export(args.export_mb, args.export_workers)
+
+    payload = json.dumps(results, indent=2, sort_keys=True)
+    if args.out:
+        Path(args.out).write_text(payload + '\n', encoding='utf-8')
+    else:
+        print(payload)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,14 +1,236 @@
-"""Flask application for html2md."""
+"""Flask application for html2md.
 
+``/convert`` turns a URL or posted HTML into Markdown inside the long-lived
+server process, so requests do not pay interpreter startup, the converter
+import or a fresh TLS handshake. The upstream session and the conversion
+engine are created once per worker process at import time.
+
+Recommended gunicorn settings (``pip install html2md-cli[deploy]``)::
+
+    gunicorn html2md.app:app --worker-class gthread \\
+        --workers "$(nproc)" --threads 8 --timeout 60 --keep-alive 5
+
+- ``--workers``: one per CPU core. Conversion is CPU bound and holds the
+  GIL, so only processes add conversion throughput.
+- ``--threads``: fetching is I/O bound; threads let one worker overlap
+  several upstream downloads. Keep ``HTML2MD_POOL_SIZE`` (default 8) equal
+  to ``--threads`` so every thread has a pooled connection.
+- ``--timeout``: above the 30 s upstream timeout plus conversion time.
+- ``--preload`` is safe and shares the imported converter between workers
+  copy-on-write. No connection is opened before the fork.
+
+``HTML2MD_ENGINE`` selects the conversion engine (default: markdownify).
+
+Batches too large for one request go through ``POST /jobs``. Their URLs are
+converted by ``HTML2MD_JOB_WORKERS`` (default 2) background threads per
+worker process. At most ``HTML2MD_JOB_QUEUE`` (default 1000) URLs may wait;
+beyond that, new jobs get ``429``. Jobs and results live in the SQLite file
+``HTML2MD_JOB_DB``, which all workers of one host share, so any worker can
+answer ``GET /jobs/<id>``. A restarted worker's unfinished jobs are picked
+up again by the workers still running, and jobs are deleted
+``HTML2MD_JOB_RETENTION_DAYS`` (default 7) days after they were created.
+
+``/metrics`` serves request counts, latency histograms, byte counters,
+size-limit rejections, in-flight conversions and connection-pool usage in
+the Prometheus text format. Under several workers, set
+``HTML2MD_METRICS_DIR`` to a local directory that all workers share and that
+is emptied on deploy; see :mod:`html2md.metrics`.
+"""
+from __future__ import annotations
+
+import json
 import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
 
-from flask import Flask, jsonify
+import requests
+from flask import Flask, Response, g, jsonify, request
 
-from html2md import __version__
+from html2md import __version__, metrics
+from html2md.cli import ALLOWED_SCHEMES, MAX_DOWNLOAD_BYTES, REQUEST_HEADERS
+from html2md.convert import DEFAULT_ENGINE, get_engine
+from html2md.jobs import JobRunner, JobStore, QueueFull
 
 DEFAULT_PORT = 10000
+DEFAULT_POOL_SIZE = 8
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_JOB_QUEUE = 1000
+DEFAULT_JOB_RETENTION_DAYS = 7
+MAX_JOB_URLS = 1000
 
 app = Flask(__name__)
+# Posted HTML has the same size cap as downloads; Flask answers 413 above it.
+app.config['MAX_CONTENT_LENGTH'] = MAX_DOWNLOAD_BYTES
+
+
+class ConvertError(Exception):
+    """A /convert failure reported to the client with an HTTP status."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+def _build_session():
+    """Return a requests session with a connection pool per upstream host."""
+    pooled = requests.Session()
+    pooled.headers.update(REQUEST_HEADERS)
+    pool_size = _env_int('HTML2MD_POOL_SIZE', DEFAULT_POOL_SIZE)
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    pooled.mount('http://', adapter)
+    pooled.mount('https://', adapter)
+    return pooled
+
+
+session = _build_session()
+registry = metrics.Registry()
+registry.add_collector(metrics.pool_collector(session))
+engine = get_engine(os.environ.get('HTML2MD_ENGINE', DEFAULT_ENGINE))
+# Run one conversion so lazily imported parser internals are loaded now
+# rather than on the first request.
+engine.convert('<p>warm-up</p>')
+
+
+def fetch_html(url):
+    """Download ``url`` under the CLI's scheme and size limits."""
+    scheme = urlparse(url).scheme
+    if scheme not in ALLOWED_SCHEMES:
+        raise ConvertError(f"Unsupported URL scheme '{scheme}'. "
+                           "Only http and https are allowed.", 400)
+    start = time.perf_counter()
+    chunks = []
+    total = 0
+    try:
+        response = session.get(url, timeout=30, stream=True)
+        try:
+            response.raise_for_status()
+            try:
+                if int(response.headers.get('Content-Length', 0)) > MAX_DOWNLOAD_BYTES:
+                    registry.inc('html2md_size_limit_rejections_total')
+                    raise ConvertError('Content-Length exceeds maximum allowed size '
+                                       f'({MAX_DOWNLOAD_BYTES} bytes).', 413)
+            except ValueError:
+                # Non-numeric Content-Length: the loop below still enforces the cap.
+                pass
+            for chunk in response.iter_content(chunk_size=8192):
+                total += len(chunk)
+                if total > MAX_DOWNLOAD_BYTES:
+                    registry.inc('html2md_size_limit_rejections_total')
+                    raise ConvertError('Downloaded content exceeds maximum allowed size '
+                                       f'({MAX_DOWNLOAD_BYTES} bytes).', 413)
+                chunks.append(chunk)
+            encoding = response.encoding if isinstance(response.encoding, str) else 'utf-8'
+        finally:
+            response.close()
+            registry.inc('html2md_bytes_in_total', total)
+    except requests.RequestException as e:
+        raise ConvertError(f'Network error: {e}', 502) from e
+    registry.observe('html2md_fetch_seconds', time.perf_counter() - start)
+    return b''.join(chunks).decode(encoding, errors='replace')
+
+
+def convert_html(html):
+    """Convert ``html`` with the warm engine; raises ConvertError on failure."""
+    registry.inc('html2md_conversions_in_flight')
+    start = time.perf_counter()
+    try:
+        markdown = engine.convert(html)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        raise ConvertError(f'Conversion failed: {e}', 500) from e
+    finally:
+        registry.inc('html2md_conversions_in_flight', -1)
+    registry.observe('html2md_convert_seconds', time.perf_counter() - start)
+    registry.inc('html2md_bytes_out_total', len(markdown.encode('utf-8')))
+    return markdown
+
+
+def convert_url(url):
+    """Fetch ``url`` and return its Markdown; raises ConvertError on failure."""
+    return convert_html(fetch_html(url))
+
+
+_job_runner = None
+_job_runner_pid = None
+_job_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    """Return this process's job runner, starting its threads on first use.
+
+    Threads are started lazily rather than at import: with ``--preload``
+    the module is imported before gunicorn forks, and threads do not
+    survive a fork.
+    """
+    global _job_runner, _job_runner_pid  # pylint: disable=global-statement
+    with _job_runner_lock:
+        if _job_runner is None or _job_runner_pid != os.getpid():
+            db_path = os.environ.get('HTML2MD_JOB_DB') or os.path.join(
+                tempfile.gettempdir(), 'html2md-jobs.sqlite3')
+            _job_runner = JobRunner(
+                JobStore(Path(db_path)), convert_url,
+                workers=_env_int('HTML2MD_JOB_WORKERS', DEFAULT_JOB_WORKERS),
+                max_pending=_env_int('HTML2MD_JOB_QUEUE', DEFAULT_JOB_QUEUE),
+                retention=_env_int('HTML2MD_JOB_RETENTION_DAYS',
+                                   DEFAULT_JOB_RETENTION_DAYS) * 24 * 3600.0,
+            )
+            _job_runner_pid = os.getpid()
+        return _job_runner
+
+
+def _request_input():
+    """Return ``(url, html)`` from a JSON body, form fields, raw HTML or ?url=."""
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            raise ConvertError('JSON body must be an object with "url" or "html".', 400)
+        return payload.get('url'), payload.get('html')
+    if request.form:
+        return request.form.get('url'), request.form.get('html')
+    if request.method == 'POST' and request.mimetype in ('text/html', 'text/plain'):
+        charset = request.mimetype_params.get('charset', 'utf-8')
+        try:
+            return None, request.get_data().decode(charset, errors='replace')
+        except LookupError:
+            return None, request.get_data().decode('utf-8', errors='replace')
+    return request.args.get('url'), None
+
+
+@app.before_request
+def _start_request():
+    g.request_start = time.perf_counter()
+    directory = os.environ.get('HTML2MD_METRICS_DIR')
+    if directory:
+        registry.share(Path(directory))
+
+
+@app.after_request
+def _count_request(response):
+    endpoint = request.endpoint or 'unknown'
+    registry.inc('html2md_requests_total', endpoint=endpoint, status=str(response.status_code))
+    start = g.get('request_start')
+    if start is not None:
+        registry.observe('html2md_request_seconds', time.perf_counter() - start,
+                         endpoint=endpoint)
+    return response
+
+
+@app.errorhandler(413)
+def _too_large(_error):
+    registry.inc('html2md_size_limit_rejections_total')
+    return jsonify({'error': 'Request body exceeds maximum allowed size '
+                             f'({MAX_DOWNLOAD_BYTES} bytes).'}), 413
 
 
 @app.route('/health')
@@ -17,6 +239,71 @@ def health():
     return jsonify({'status': 'ok', 'service': 'html2md', 'version': __version__})
 
 
+@app.route('/convert', methods=['GET', 'POST'])
+def convert():
+    """Convert a URL or posted HTML document to Markdown."""
+    try:
+        url, html = _request_input()
+        if isinstance(html, str) and html:
+            registry.inc('html2md_bytes_in_total', request.content_length or 0)
+            markdown = convert_html(html)
+        elif isinstance(url, str) and url:
+            markdown = convert_url(url)
+        else:
+            raise ConvertError('Provide a "url" or an "html" document.', 400)
+    except ConvertError as e:
+        return jsonify({'error': str(e)}), e.status
+    return Response(markdown, mimetype='text/markdown')
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose service metrics in the Prometheus text format."""
+    return Response(metrics.render(metrics.collect(registry)),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a batch of URLs for background conversion."""
+    payload = request.get_json(silent=True)
+    urls = payload.get('urls') if isinstance(payload, dict) else None
+    if (not isinstance(urls, list) or not urls
+            or not all(isinstance(u, str) and u for u in urls)):
+        return jsonify({'error': 'Body must be a JSON object with a non-empty "urls" list.'}), 400
+    if len(urls) > MAX_JOB_URLS:
+        return jsonify({'error': f'A job may contain at most {MAX_JOB_URLS} URLs.'}), 413
+    try:
+        job_id = get_job_runner().submit(urls)
+    except QueueFull as e:
+        resp = jsonify({'error': f'Job queue is full: {e}'})
+        resp.headers['Retry-After'] = '30'
+        return resp, 429
+    resp = jsonify({'id': job_id, 'status': 'queued', 'total': len(urls)})
+    resp.headers['Location'] = f'/jobs/{job_id}'
+    return resp, 202
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report progress and per-URL results of a job."""
+    status = get_job_runner().store.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job.'}), 404
+    return jsonify(status)
+
+
+@app.route('/jobs/<job_id>/output')
+def job_output(job_id):
+    """Stream the finished results of a job as JSON lines, including Markdown."""
+    store = get_job_runner().store
+    if store.status(job_id) is None:
+        return jsonify({'error': 'Unknown job.'}), 404
+    lines = (json.dumps(result, ensure_ascii=False) + '\n'
+             for result in store.outputs(job_id))
+    return Response(lines, mimetype='application/x-ndjson')
+
+
 def get_host_port():
     """Get host and port from environment variables."""
     default_port = 10000
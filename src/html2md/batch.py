@@ -0,0 +1,226 @@
+"""Concurrent batch execution helpers for html2md."""
+from __future__ import annotations
+
+import heapq
+import io
+import itertools
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+# A batch worker processes one URL, writing progress to ``out``/``err``,
+# and returns the per-URL exit code (0 on success, 1 on error).
+Worker = Callable[[str, TextIO, TextIO], int]
+# The rest of a deferred URL's work: resume(out, err) -> exit code.
+Resume = Callable[[TextIO, TextIO], int]
+
+# URLs of a --batch source read ahead of the workers.
+DEFAULT_READAHEAD = 1024
+# How often run_concurrent checks a slow URL source while URLs are in flight.
+_POLL = 0.05
+_EOF = object()
+
+
+class RetryLater(Exception):
+    """Raised by a batch worker to continue a URL after ``delay`` seconds.
+
+    :func:`run_concurrent` (and :func:`~html2md.pipeline.run_pipeline`, for
+    a fetch stage) calls ``resume(out, err)`` once the delay has passed.
+    The worker thread is released in the meantime, so a URL waiting out a
+    backoff does not hold up URLs of other hosts.
+    """
+
+    def __init__(self, delay: float, resume: Resume):
+        super().__init__(f'retry in {delay:.1f}s')
+        self.delay = delay
+        self.resume = resume
+
+
+class HostLimiter:
+    """Cap the number of in-flight requests per host.
+
+    Semaphores are reference-counted so a batch touching many distinct
+    hosts does not keep one semaphore alive per host for the whole run.
+    ``limits(host)``, if given, overrides ``per_host`` for individual hosts.
+    """
+
+    def __init__(self, per_host: int, limits: Optional[Callable[[str], int]] = None):
+        if per_host < 1:
+            raise ValueError("per_host must be >= 1")
+        self.per_host = per_host
+        self._limits = limits
+        self._lock = threading.Lock()
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._users: Dict[str, int] = {}
+
+    @contextmanager
+    def slot(self, host: Optional[str]) -> Iterator[None]:
+        """Hold one of ``per_host`` slots for ``host`` while the block runs."""
+        key = (host or "").lower()
+        with self._lock:
+            sem = self._slots.get(key)
+            if sem is None:
+                limit = self._limits(key) if self._limits else self.per_host
+                sem = threading.BoundedSemaphore(limit)
+                self._slots[key] = sem
+            self._users[key] = self._users.get(key, 0) + 1
+        sem.acquire()
+        try:
+            yield
+        finally:
+            sem.release()
+            with self._lock:
+                self._users[key] -= 1
+                if not self._users[key]:
+                    del self._users[key]
+                    del self._slots[key]
+
+
+class UrlFeed:
+    """Non-blank lines of ``stream``, read on a background thread into a bounded queue.
+
+    At most ``maxsize`` URLs are buffered, so memory stays flat for any
+    input size, and the first URL is available as soon as its line
+    arrives. This lets ``--batch`` read from stdin or a named pipe fed by
+    a slower producer. Read errors are raised by the iterator once the
+    URLs before them have been consumed.
+    """
+
+    def __init__(self, stream: Iterable[str], maxsize: int = DEFAULT_READAHEAD):
+        self._queue: "queue.Queue[object]" = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(target=self._read, args=(stream,),
+                                        name='html2md-feed', daemon=True)
+        self._thread.start()
+
+    def _read(self, stream: Iterable[str]) -> None:
+        try:
+            for line in stream:
+                url = line.strip()
+                if url and not self._put(url):
+                    return
+        except (OSError, ValueError) as e:
+            self._put(e)
+        self._put(_EOF)
+
+    def _put(self, item: object) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=_POLL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self) -> Iterator[str]:
+        while not self._done:
+            item = self._queue.get()
+            if item is _EOF:
+                self._done = True
+            elif isinstance(item, BaseException):
+                self._done = True
+                raise item
+            else:
+                yield item  # type: ignore[misc]
+
+    def ready(self) -> bool:
+        """Return True if the next URL (or the end of input) is available without blocking."""
+        return self._done or not self._queue.empty()
+
+    def close(self) -> None:
+        """Stop the reader thread; URLs not consumed yet are dropped."""
+        self._stop.set()
+        self._thread.join(timeout=2 * _POLL)
+
+
+def run_concurrent(urls: Iterable[str], worker: Worker, jobs: int,
+                   ready: Optional[Callable[[], bool]] = None) -> int:
+    """Run ``worker`` over ``urls`` on ``jobs`` threads and OR the exit codes.
+
+    Each URL's progress output is buffered and written to the real
+    stdout/stderr in one piece when the URL finishes, so lines from
+    different URLs never interleave. At most ``2 * jobs`` URLs are pending
+    at any time, which keeps memory flat for very large batch files.
+    A worker may raise :class:`RetryLater` to have the URL resumed after a
+    delay; deferred URLs do not count towards the pending limit.
+
+    ``ready()``, if given, says whether ``urls`` can yield without blocking
+    (see :meth:`UrlFeed.ready`). While it is False and URLs are in flight,
+    results and due retries are handled instead of waiting for input.
+    """
+    out_lock = threading.Lock()
+
+    def task(url: str, run: Resume) -> Tuple[int, Optional[RetryLater]]:
+        out = io.StringIO()
+        err = io.StringIO()
+        later = None
+        code = 0
+        try:
+            code = run(out, err)
+        except RetryLater as e:
+            later = e
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"Error processing {url}: {e}", file=err)
+            code = 1
+        with out_lock:
+            if out.tell():
+                sys.stdout.write(out.getvalue())
+                sys.stdout.flush()
+            if err.tell():
+                sys.stderr.write(err.getvalue())
+                sys.stderr.flush()
+        return code, later
+
+    exit_code = 0
+    max_pending = 2 * jobs
+    pending: Dict[Future, str] = {}
+    # (ready_at, seq, url, resume) of URLs waiting out a RetryLater delay.
+    deferred: List[Tuple[float, int, str, Resume]] = []
+    seq = itertools.count()
+    remaining = iter(urls)
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='html2md') as pool:
+        while True:
+            now = time.monotonic()
+            if len(pending) < max_pending and deferred and deferred[0][0] <= now:
+                _, _, url, resume = heapq.heappop(deferred)
+                pending[pool.submit(task, url, resume)] = url
+                continue
+            idle = not (pending or deferred)
+            if len(pending) < max_pending and not exhausted and (
+                    ready is None or idle or ready()):
+                url = next(remaining, None)
+                if url is None:
+                    exhausted = True
+                else:
+                    pending[pool.submit(task, url, _bind(worker, url))] = url
+                continue
+            polling = ready is not None and not exhausted
+            if not pending:
+                if not deferred:
+                    break
+                delay = max(0.0, deferred[0][0] - now)
+                time.sleep(min(delay, _POLL) if polling else delay)
+                continue
+            timeout = max(0.0, deferred[0][0] - now) if deferred else None
+            if polling:
+                timeout = _POLL if timeout is None else min(timeout, _POLL)
+            done, _ = wait(set(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                url = pending.pop(fut)
+                code, later = fut.result()
+                if later is not None:
+                    heapq.heappush(deferred, (time.monotonic() + later.delay, next(seq),
+                                              url, later.resume))
+                else:
+                    exit_code |= code
+    return exit_code
+
+
+def _bind(worker: Worker, url: str) -> Resume:
+    return lambda out, err: worker(url, out, err)
@@ -0,0 +1,218 @@
+"""On-disk caches for html2md conversions."""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def cache_key(url: str) -> str:
+    """Return the canonical cache key for ``url``.
+
+    Scheme and host are case-insensitive and the fragment never reaches
+    the server, so they must not split one resource into several entries.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f'[{host}]'
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port in (None, _DEFAULT_PORTS.get(scheme)) else f'{host}:{port}'
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+class _SqliteStore:
+    """Size-bounded, least-recently-used SQLite table shared by worker threads."""
+
+    _SCHEMA = ''
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(self._SCHEMA)
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)')
+        row = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()
+        self._total = int(row[0])
+        self._clock = 0.0
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        with self._lock:
+            self._db.close()
+
+    def _now(self) -> float:
+        # Strictly increasing access stamps keep LRU order exact even when
+        # the wall clock is coarse (about 16 ms on some Windows builds).
+        self._clock = max(time.time(), self._clock + 1e-6)
+        return self._clock
+
+    def _touch(self, key: str) -> None:
+        self._db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (self._now(), key))
+
+    def _put(self, key: str, size: int, sql: str, params: tuple) -> None:
+        """Insert or replace ``key`` then evict until under ``max_bytes``."""
+        if size > self.max_bytes:
+            return
+        old = self._db.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+        self._db.execute(sql, params)
+        self._total += size - (old[0] if old else 0)
+        if self._total > self.max_bytes:
+            self._evict()
+
+    def _evict(self) -> None:
+        # Evict down to 90% of the cap so a full cache does not pay a
+        # DELETE on every single insert.
+        target = self.max_bytes * 9 // 10
+        self._db.execute('BEGIN')
+        try:
+            rows = self._db.execute('SELECT key, size FROM entries ORDER BY accessed')
+            victims = []
+            for key, size in rows:
+                if self._total <= target:
+                    break
+                victims.append((key,))
+                self._total -= size
+            self._db.executemany('DELETE FROM entries WHERE key = ?', victims)
+            self._db.execute('COMMIT')
+        except sqlite3.Error:
+            self._db.execute('ROLLBACK')
+            raise
+
+
+class CachedResponse(NamedTuple):
+    """Validators and converted Markdown stored for a previously fetched URL."""
+
+    etag: Optional[str]
+    last_modified: Optional[str]
+    markdown: str
+
+
+class HttpCache(_SqliteStore):
+    """Conditional-request cache keyed by canonical URL.
+
+    Stores the ``ETag``/``Last-Modified`` validators of a page together with
+    the Markdown it converted to, so a ``304 Not Modified`` reply can be
+    answered without downloading or converting the page again. ``variant``
+    identifies the converter settings; entries produced by a different
+    variant are ignored.
+    """
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS entries ('
+        ' key TEXT PRIMARY KEY, variant TEXT NOT NULL, etag TEXT,'
+        ' last_modified TEXT, markdown TEXT NOT NULL,'
+        ' size INTEGER NOT NULL, accessed REAL NOT NULL)'
+    )
+
+    def __init__(self, directory: Path, max_bytes: int, variant: str):
+        super().__init__(Path(directory) / 'http-cache.sqlite3', max_bytes)
+        self.variant = variant
+
+    def lookup(self, url: str) -> Optional[CachedResponse]:
+        """Return the cached entry for ``url`` or None."""
+        key = cache_key(url)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT etag, last_modified, markdown FROM entries'
+                ' WHERE key = ? AND variant = ?', (key, self.variant)
+            ).fetchone()
+        return CachedResponse(*row) if row else None
+
+    def conditional_headers(self, entry: Optional[CachedResponse]) -> dict:
+        """Return ``If-None-Match``/``If-Modified-Since`` headers for ``entry``."""
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def mark_used(self, url: str) -> None:
+        """Record a cache hit so LRU eviction keeps the entry."""
+        with self._lock:
+            self._touch(cache_key(url))
+
+    def store(self, url: str, etag: Optional[str], last_modified: Optional[str],
+              markdown: str) -> None:
+        """Store validators and converted Markdown for ``url``."""
+        if not etag and not last_modified:
+            return
+        key = cache_key(url)
+        size = len(markdown.encode('utf-8')) + len(key)
+        with self._lock:
+            self._put(key, size, (
+                'INSERT OR REPLACE INTO entries'
+                ' (key, variant, etag, last_modified, markdown, size, accessed)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)'
+            ), (key, self.variant, etag, last_modified, markdown, size, self._now()))
+
+
+class ConversionCache(_SqliteStore):
+    """Content-addressed store of converted Markdown.
+
+    Keys are digests of the downloaded bytes plus everything that affects
+    the conversion (see :func:`content_hasher`), so mirrors and URL variants
+    serving identical HTML are converted once.
+    """
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS entries ('
+        ' key TEXT PRIMARY KEY, markdown TEXT NOT NULL,'
+        ' size INTEGER NOT NULL, accessed REAL NOT NULL)'
+    )
+
+    def __init__(self, directory: Path, max_bytes: int):
+        super().__init__(Path(directory) / 'conversions.sqlite3', max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the Markdown stored under ``key`` and count the hit or miss."""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT markdown FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch(key)
+        return row[0]
+
+    def put(self, key: str, markdown: str) -> None:
+        """Store converted Markdown under ``key``."""
+        size = len(markdown.encode('utf-8')) + len(key)
+        with self._lock:
+            self._put(key, size, (
+                'INSERT OR REPLACE INTO entries (key, markdown, size, accessed)'
+                ' VALUES (?, ?, ?, ?)'
+            ), (key, markdown, size, self._now()))
+
+
+def content_hasher(variant: str, encoding: str) -> Any:
+    """Return a SHA-256 hasher seeded with the converter variant and encoding.
+
+    Feed it the downloaded bytes; its hex digest is the
+    :class:`ConversionCache` key. The encoding is part of the key because
+    the same bytes decode to different HTML under different charsets.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f'{variant}\0{encoding.lower()}\0'.encode('utf-8'))
+    return hasher
@@ -2,11 +2,231 @@
 
 from __future__ import annotations
 import argparse
+import functools
+import hashlib
+import itertools
 import os
+import sqlite3
 import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import ExitStack, contextmanager, nullcontext
 from pathlib import Path
+from typing import Callable, ContextManager, Iterable, Iterator, Optional, TextIO, TypeVar
 from urllib.parse import urlparse, unquote
 
+from .batch import HostLimiter, RetryLater, UrlFeed, run_concurrent
+from .cache import ConversionCache, HttpCache, content_hasher
+from .metrics import Registry, observe_record, pool_collector, summary
+from .convert import DEFAULT_ENGINE, ENGINES, convert_html, get_engine, init_worker
+from .dedupe import (DEFAULT_CAPACITY, DEFAULT_ERROR_RATE, DEFAULT_STRIP_PARAMS,
+                     MODES as DEDUPE_MODES, Deduper, canonicalize, unique_urls)
+from .formats import (FORMATS, Document, PdfWriter, parse_formats, render_markdown,
+                      render_text)
+from .images import (DEFAULT_JOBS as IMAGE_JOBS, DEFAULT_MAX_PX, DEFAULT_PAGE_BUDGET_MB,
+                     DEFAULT_QUALITY, IMAGE_DIR, ImageStore)
+from .manifest import DEFAULT_NAME as MANIFEST_NAME, Manifest
+from .pipeline import Page, run_pipeline
+from .politeness import PolicyError, RatePolicy, Throttle, interleave, load_policy, plan
+from .retry import (RETRY_STATUSES, Backoff, CircuitBreaker, CircuitOpen, is_transient_error,
+                    parse_retry_after)
+from .robots import (HEAD_SCAN_BYTES, MAX_ROBOTS_BYTES, DEFAULT_TTL as ROBOTS_TTL, ROBOTS_AGENT,
+                     RobotsCache, header_directives, page_directives, strip_links)
+from .runlog import RunLog, RunRecord
+from .sinks import DEFAULT_SHARD_MB, SINKS, ShardWriter, open_sink
+from .stream import StreamingConverter
+
+
+# Security: pages larger than this are rejected to prevent DoS (OOM).
+MAX_DOWNLOAD_BYTES = 10 * 1024 * 1024
+ALLOWED_SCHEMES = ('http', 'https')
+
+# Browser-like request headers; some sites refuse obvious non-browser clients.
+REQUEST_HEADERS = {
+    'User-Agent': (
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+        'AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/120.0.0.0 Safari/537.36'
+    ),
+    'Accept': (
+        'text/html,application/xhtml+xml,application/xml;q=0.9,'
+        'image/avif,image/webp,image/apng,*/*;q=0.8'
+    ),
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Referer': 'https://www.google.com/',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'cross-site',
+    'Sec-Fetch-User': '?1',
+}
+# Sent with --respect-robots: robots.txt groups are matched on ROBOTS_AGENT.
+ROBOTS_USER_AGENT = f"{REQUEST_HEADERS['User-Agent']} (compatible; {ROBOTS_AGENT})"
+
+
+class _StreamOutput:
+    """Destination of a ``--stream`` conversion: a file in --outdir or stdout.
+
+    File output goes to a ``.part`` sibling that only replaces the final
+    path once the whole page converted, so a download aborted half way
+    (size limit, network error) never leaves a truncated ``.md`` behind.
+    """
+
+    def __init__(self, out_path: Optional[Path], out: TextIO, encoding: str):
+        self.path = out_path
+        self._part: Optional[Path] = None
+        self._file = None
+        self._out = out
+        self._write = out.write
+        self.bytes_out = 0
+        self.hash = hashlib.sha256()
+        # Built before the file is opened: an unknown charset raises
+        # LookupError here and must not leave a .part file behind.
+        self._converter = StreamingConverter(self._counting_write, encoding)
+        if out_path is not None:
+            self._part = _part_path(out_path)
+            self._file = self._part.open('w', encoding='utf-8')
+            self._write = self._file.write
+
+    def _counting_write(self, text: str) -> None:
+        data = text.encode('utf-8')
+        self.bytes_out += len(data)
+        self.hash.update(data)
+        self._write(text)
+
+    def feed(self, chunk: bytes) -> None:
+        """Convert and write the next chunk of the response body."""
+        self._converter.feed(chunk)
+
+    def finish(self) -> None:
+        """Flush the last block and move the output into place."""
+        self._converter.close()
+        if self._file is not None:
+            self._file.close()
+            os.replace(str(self._part), str(self.path))
+        else:
+            self._out.write('\n')
+
+    def abort(self) -> None:
+        """Discard partial file output."""
+        if self._file is not None:
+            self._file.close()
+            try:
+                self._part.unlink()
+            except OSError:
+                pass
+
+
+_T = TypeVar('_T')
+
+
+def _hostname(url: str) -> Optional[str]:
+    """Return the host of ``url``, or None if it has none or cannot be parsed."""
+    try:
+        return urlparse(url).hostname
+    except ValueError:
+        return None
+
+
+def _output_name(url: str) -> str:
+    """Return the ``.md`` file name for ``url``: its last path segment, sanitized."""
+    filename = "conversion_result.md"
+    url_path = url.split('?')[0].rstrip('/')
+    if url_path:
+        base = os.path.basename(unquote(url_path))
+        # Sanitize to prevent path traversal
+        base = base.replace('/', '_').replace('\\', '_')
+        base = base.strip('. ')
+        if base:
+            filename = f"{base}.md"
+    return filename
+
+
+def _part_path(path: Path) -> Path:
+    """Return the ``.part`` sibling that ``path`` is written to by this thread.
+
+    URLs with the same last path segment map to the same output, so each
+    thread gets its own part file instead of truncating another's.
+    """
+    return path.with_name(f'{path.name}.{threading.get_ident()}.part')
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    """Write ``text`` to a sibling of ``path`` and move it into place.
+
+    A run killed mid-write never leaves a truncated file behind.
+    """
+    part = _part_path(path)
+    with part.open('w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(str(part), str(path))
+
+
+def _close_shards(shards: ShardWriter) -> int:
+    """Finish the last --sink shard; return 1 (after reporting) if that fails."""
+    try:
+        shards.close()
+    except OSError as e:
+        print(f"Error finishing output shard: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def _deduper(args: argparse.Namespace) -> Optional[Deduper]:
+    """Return the --dedupe tracker, or None when dedupe is off."""
+    if not args.dedupe:
+        return None
+    return Deduper(args.dedupe_mode, args.dedupe_capacity, args.dedupe_error_rate)
+
+
+def _unique(urls: Iterable[str], args: argparse.Namespace, deduper: Deduper) -> Iterator[str]:
+    """Canonicalize ``urls`` with the --strip-params/--sort-query rules and drop repeats."""
+    strip = tuple(p.strip() for p in args.strip_params.split(',') if p.strip())
+    return unique_urls(urls, deduper, functools.partial(
+        canonicalize, strip_params=strip, sort_query=args.sort_query))
+
+
+def _report_dedupe(deduper: Deduper) -> None:
+    print(f"Dedupe: {deduper.duplicates} duplicate URLs skipped, {deduper.unique} unique "
+          f"({deduper.structure})", file=sys.stderr)
+
+
+def _batch_source(path: str) -> ContextManager[TextIO]:
+    """Open --batch ``path``; ``-`` is standard input. Named pipes open like files."""
+    if path == '-':
+        return nullcontext(sys.stdin)
+    return open(path, 'r', encoding='utf-8')
+
+
+def dry_run(args: argparse.Namespace, policy: RatePolicy) -> int:
+    """Print the schedule of --url and --batch under ``policy`` without fetching."""
+    if not (args.url or args.batch):
+        print("Error: --dry-run needs --url or --batch.", file=sys.stderr)
+        return 1
+    try:
+        with ExitStack() as stack:
+            urls: Iterable[str] = [args.url] if args.url else []
+            if args.batch:
+                f = stack.enter_context(_batch_source(args.batch))
+                lines = (line.strip() for line in f)
+                urls = itertools.chain(urls, (u for u in lines if u))
+            deduper = _deduper(args)
+            if deduper is not None:
+                urls = _unique(urls, args, deduper)
+            for offset, key, url in plan(urls, policy, _hostname):
+                print(f"+{offset:.3f}s\t{key}\t"
+                      f"concurrency={policy.concurrency(key, args.per_host)}\t{url}")
+            if deduper is not None:
+                _report_dedupe(deduper)
+    except OSError as e:
+        print(f"Error: Cannot read batch file: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
 def main(argv=None):
     """Run the CLI."""
     ap = argparse.ArgumentParser(
@@ -15,8 +235,127 @@ def main(argv=None):
     )
     ap.add_argument('--help-only', action='store_true', help=argparse.SUPPRESS)
     ap.add_argument('--url', help='Input URL to convert')
-    ap.add_argument('--batch', help='File containing URLs to process (one per line)')
+    ap.add_argument('--batch', metavar='FILE',
+                    help='File containing URLs to process (one per line); "-" reads '
+                         'standard input, and named pipes are read as lines arrive')
     ap.add_argument('--outdir', help='Output directory to save the file')
+    ap.add_argument('--sink', choices=SINKS, default='files',
+                    help='How --outdir is written: one .md file per URL (default), or '
+                         'rolling JSONL shards, tar or zip archives')
+    ap.add_argument('--shard-max-mb', type=int, default=DEFAULT_SHARD_MB, metavar='MB',
+                    help=f'Start a new jsonl/tar/zip shard once one reaches MB megabytes '
+                         f'(default: {DEFAULT_SHARD_MB})')
+    ap.add_argument('--jobs', type=int, default=1,
+                    help='Number of batch URLs to process concurrently (default: 1)')
+    ap.add_argument('--per-host', type=int, default=2,
+                    help='Maximum in-flight requests per host when --jobs > 1 (default: 2)')
+    ap.add_argument('--dedupe', action='store_true',
+                    help='Canonicalize batch URLs (lowercase scheme/host, drop default ports, '
+                         'fragments and --strip-params) and skip repeats before fetching')
+    ap.add_argument('--strip-params', default=','.join(DEFAULT_STRIP_PARAMS), metavar='GLOBS',
+                    help='Comma-separated query parameter names (globs) removed by --dedupe; '
+                         'empty keeps every parameter (default: %(default)s)')
+    ap.add_argument('--sort-query', action='store_true',
+                    help='With --dedupe, sort query parameters so their order does not matter')
+    ap.add_argument('--dedupe-mode', choices=DEDUPE_MODES, default='auto',
+                    help='exact: in-memory set; bloom: fixed-size Bloom filter for very large '
+                         'batches (may drop a unique URL with --dedupe-error-rate probability); '
+                         'auto: exact, switching to bloom past a million URLs (default: auto)')
+    ap.add_argument('--dedupe-capacity', type=int, default=DEFAULT_CAPACITY, metavar='N',
+                    help='Unique URLs the Bloom filter is sized for (default: %(default)s)')
+    ap.add_argument('--dedupe-error-rate', type=float, default=DEFAULT_ERROR_RATE,
+                    metavar='P', help='Bloom filter false-positive rate (default: %(default)s)')
+    ap.add_argument('--rate-policy', metavar='FILE',
+                    help='YAML per-domain rate policy: token-bucket rate and burst and '
+                         'in-flight caps per domain; batch URLs are interleaved '
+                         'round-robin across hosts (see html2md.politeness)')
+    ap.add_argument('--dry-run', action='store_true',
+                    help='Print the batch schedule (start offset, domain, URL) under '
+                         '--rate-policy without fetching anything')
+    ap.add_argument('--retries', type=int, default=0,
+                    help='Retry URLs that fail with 429/5xx or a dropped connection up to N '
+                         'times, honouring Retry-After; batch URLs wait out their backoff '
+                         'without holding a worker (default: 0)')
+    ap.add_argument('--retry-backoff', type=float, default=0.5, metavar='SECONDS',
+                    help='Base of the jittered exponential backoff between retries '
+                         '(default: 0.5)')
+    ap.add_argument('--retry-max-wait', type=float, default=30.0, metavar='SECONDS',
+                    help='Longest wait before a retry; a longer Retry-After gives up on the '
+                         'URL (default: 30)')
+    ap.add_argument('--circuit-breaker', type=int, default=5, metavar='N',
+                    help='With --retries, hold back a host\'s URLs after N consecutive '
+                         'transient failures until --circuit-cooldown passes; 0 disables '
+                         '(default: 5)')
+    ap.add_argument('--circuit-cooldown', type=float, default=30.0, metavar='SECONDS',
+                    help='Seconds an open circuit waits before probing the host again '
+                         '(default: 30)')
+    ap.add_argument('--convert-workers', type=int, default=0,
+                    help='Convert batch pages in N worker processes while --jobs '
+                         'threads keep fetching (default: 0, convert in-thread)')
+    # None until validated, so --formats can tell an explicit --engine apart.
+    ap.add_argument('--engine', choices=sorted(ENGINES), default=None,
+                    help=f'Conversion engine (default: {DEFAULT_ENGINE}); "fast" renders '
+                         'parser events directly, using lxml when installed')
+    ap.add_argument('--formats', metavar='LIST',
+                    help=f'Comma-separated output formats from one parse of each page '
+                         f'({",".join(FORMATS)}); Markdown is rendered by --engine fast, pdf needs '
+                         f'--outdir and is rendered in --pdf-workers processes, and the '
+                         f'caches are not used')
+    ap.add_argument('--pdf-workers', type=int, default=1, metavar='N',
+                    help='Processes rendering --formats pdf (default: 1)')
+    ap.add_argument('--images', action='store_true',
+                    help=f'Download the images each page references into OUTDIR/{IMAGE_DIR} '
+                         f'(content-addressed, each URL fetched once per run) and link the '
+                         f'Markdown to the local copies; image requests honour --per-host, '
+                         f'--rate-policy and --respect-robots like pages; needs --outdir')
+    ap.add_argument('--image-max-px', type=int, default=DEFAULT_MAX_PX, metavar='PX',
+                    help='Downscale images larger than PX on either side (default: %(default)s)')
+    ap.add_argument('--image-quality', type=int, default=DEFAULT_QUALITY, metavar='Q',
+                    help='JPEG/WebP recompression quality, 1-95 (default: %(default)s)')
+    ap.add_argument('--image-jobs', type=int, default=IMAGE_JOBS, metavar='N',
+                    help='Concurrent image downloads (default: %(default)s)')
+    ap.add_argument('--image-workers', type=int, default=1, metavar='N',
+                    help='Processes resizing images with Pillow (default: 1)')
+    ap.add_argument('--image-budget-mb', type=int, default=DEFAULT_PAGE_BUDGET_MB, metavar='MB',
+                    help='Image bytes downloaded per page; further images keep their remote '
+                         'URL, 0 for no limit (default: %(default)s)')
+    ap.add_argument('--image-total-budget-mb', type=int, default=0, metavar='MB',
+                    help='Image bytes downloaded per run, 0 for no limit (default: 0)')
+    ap.add_argument('--stream', action='store_true',
+                    help='Convert pages incrementally while they download instead of '
+                         'buffering the whole page first (always uses the "fast" '
+                         'renderer on the stdlib parser)')
+    ap.add_argument('--cache-dir',
+                    default=os.environ.get('HTML2MD_CACHE_DIR'),
+                    help='Directory for the conditional-request (ETag/Last-Modified) and '
+                         'content-addressed conversion caches '
+                         '(default: $HTML2MD_CACHE_DIR, unset disables caching)')
+    ap.add_argument('--no-cache', action='store_true',
+                    help='Disable both caches')
+    ap.add_argument('--cache-max-mb', type=int, default=256,
+                    help='Evict least recently used entries once a cache exceeds '
+                         'this size (default: 256)')
+    ap.add_argument('--respect-robots', action='store_true',
+                    help='Skip URLs disallowed by robots.txt (fetched once per host and '
+                         'cached in --cache-dir) and pages marked noindex by a meta robots '
+                         'tag or X-Robots-Tag; nofollow pages are written without link '
+                         'targets (with --stream only X-Robots-Tag noindex applies); the '
+                         'User-Agent then names html2md, the token robots rules are matched on')
+    ap.add_argument('--robots-ttl', type=float, default=ROBOTS_TTL, metavar='SECONDS',
+                    help=f'How long fetched robots.txt rules are reused (default: {ROBOTS_TTL})')
+    ap.add_argument('--resume', action='store_true',
+                    help='Record each finished batch URL in the progress manifest and skip '
+                         'URLs an earlier run completed; failed URLs are tried again')
+    ap.add_argument('--manifest', metavar='FILE',
+                    help=f'Progress manifest (SQLite) for --resume; also records progress '
+                         f'without --resume (default: OUTDIR/{MANIFEST_NAME})')
+    ap.add_argument('--log', metavar='FILE',
+                    help='Append one JSONL record per URL (status, reason, HTTP status, '
+                         'bytes and per-stage timings) to FILE; readable by '
+                         'html2md-log-export')
+    ap.add_argument('--stats', action='store_true',
+                    help='Print URL counts, bytes, fetch/convert latency percentiles and '
+                         'connection-pool usage to stderr at the end of the run')
 
     args = ap.parse_args(argv)
 
@@ -24,36 +363,135 @@ def main(argv=None):
         ap.print_help()
         return 0
 
+    if args.jobs < 1:
+        print("Error: --jobs must be at least 1.", file=sys.stderr)
+        return 1
+    if args.per_host < 1:
+        print("Error: --per-host must be at least 1.", file=sys.stderr)
+        return 1
+    if args.retries < 0 or args.circuit_breaker < 0:
+        print("Error: --retries and --circuit-breaker must not be negative.", file=sys.stderr)
+        return 1
+    if min(args.retry_backoff, args.retry_max_wait, args.circuit_cooldown) < 0:
+        print("Error: retry and circuit-breaker times must not be negative.", file=sys.stderr)
+        return 1
+    if args.dedupe_capacity < 1 or not 0 < args.dedupe_error_rate < 1:
+        print("Error: --dedupe-capacity must be at least 1 and --dedupe-error-rate "
+              "between 0 and 1.", file=sys.stderr)
+        return 1
+    if args.sink != 'files' and not args.outdir:
+        print(f"Error: --sink {args.sink} needs --outdir.", file=sys.stderr)
+        return 1
+    if args.sink != 'files' and args.stream:
+        print("Error: --stream cannot be combined with --sink; shards take whole pages.",
+              file=sys.stderr)
+        return 1
+    if args.shard_max_mb < 1:
+        print("Error: --shard-max-mb must be at least 1.", file=sys.stderr)
+        return 1
+    if args.resume and not (args.manifest or args.outdir):
+        print("Error: --resume needs --outdir or --manifest.", file=sys.stderr)
+        return 1
+    if args.convert_workers < 0:
+        print("Error: --convert-workers must not be negative.", file=sys.stderr)
+        return 1
+    if args.stream and args.convert_workers:
+        print("Error: --stream cannot be combined with --convert-workers.", file=sys.stderr)
+        return 1
+    if args.cache_max_mb < 1:
+        print("Error: --cache-max-mb must be at least 1.", file=sys.stderr)
+        return 1
+    if args.images:
+        for flag, used in (('--stream', args.stream),
+                           (f'--sink {args.sink}', args.sink != 'files')):
+            if used:
+                print(f"Error: --images cannot be combined with {flag}.", file=sys.stderr)
+                return 1
+        if not args.outdir:
+            print("Error: --images needs --outdir.", file=sys.stderr)
+            return 1
+        if min(args.image_max_px, args.image_jobs, args.image_workers) < 1:
+            print("Error: --image-max-px, --image-jobs and --image-workers must be at "
+                  "least 1.", file=sys.stderr)
+            return 1
+        if not 1 <= args.image_quality <= 95:
+            print("Error: --image-quality must be between 1 and 95.", file=sys.stderr)
+            return 1
+        if args.image_budget_mb < 0 or args.image_total_budget_mb < 0:
+            print("Error: image budgets must not be negative.", file=sys.stderr)
+            return 1
+    formats = None
+    if args.formats is not None:
+        try:
+            formats = parse_formats(args.formats)
+        except ValueError as e:
+            print(f"Error: --formats: {e}.", file=sys.stderr)
+            return 1
+        for flag, used in (('--stream', args.stream), ('--convert-workers', args.convert_workers),
+                           (f'--sink {args.sink}', args.sink != 'files')):
+            if used:
+                print(f"Error: --formats cannot be combined with {flag}.", file=sys.stderr)
+                return 1
+        if 'pdf' in formats and not args.outdir:
+            print("Error: --formats pdf needs --outdir.", file=sys.stderr)
+            return 1
+        if args.pdf_workers < 1:
+            print("Error: --pdf-workers must be at least 1.", file=sys.stderr)
+            return 1
+        if 'md' in formats and args.engine not in (None, 'fast'):
+            print(f"Error: --formats md renders with the fast engine and cannot be combined "
+                  f"with --engine {args.engine}.", file=sys.stderr)
+            return 1
+    if args.engine is None:
+        args.engine = DEFAULT_ENGINE
+
+    policy = None
+    if args.rate_policy:
+        try:
+            policy = load_policy(Path(args.rate_policy))
+        except (OSError, PolicyError) as e:
+            print(f"Error reading rate policy '{args.rate_policy}': {e}", file=sys.stderr)
+            return 1
+
+    if args.dry_run:
+        return dry_run(args, policy or RatePolicy())
+
     if args.url or args.batch:
         try:
             import requests  # type: ignore  # pylint: disable=import-outside-toplevel
-            from markdownify import markdownify as md  # pylint: disable=import-outside-toplevel
+            engine = get_engine(args.engine)
         except ImportError as e:
             print(f"Error: Missing dependency {e.name}."
                   "Please run: pip install requests markdownify", file=sys.stderr)
             return 1
 
         session = requests.Session()
-        session.headers.update({
-            'User-Agent': (
-                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                'AppleWebKit/537.36 (KHTML, like Gecko) '
-                'Chrome/120.0.0.0 Safari/537.36'
-            ),
-            'Accept': (
-                'text/html,application/xhtml+xml,application/xml;q=0.9,'
-                'image/avif,image/webp,image/apng,*/*;q=0.8'
-            ),
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Referer': 'https://www.google.com/',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'cross-site',
-            'Sec-Fetch-User': '?1',
-        })
+        session.headers.update(REQUEST_HEADERS)
+        host_limiter = None
+        pool_size = args.jobs + (args.image_jobs if args.images else 0)
+        if pool_size > 1:
+            # Size the connection pool so concurrent workers reuse sockets
+            # instead of discarding connections when the default pool fills.
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        if args.jobs > 1:
+            host_limiter = HostLimiter(args.per_host)
+        throttle = None
+        if policy is not None:
+            throttle = Throttle(policy)
+            host_limiter = HostLimiter(
+                args.per_host, functools.partial(policy.concurrency, fallback=args.per_host))
+        backoff = Backoff(args.retry_backoff, args.retry_max_wait)
+        breaker = None
+        if args.retries and args.circuit_breaker:
+            breaker = CircuitBreaker(args.circuit_breaker, args.circuit_cooldown)
+        stats = None
+        if args.stats:
+            stats = Registry()
+            stats.add_collector(pool_collector(session))
 
         outdir_path = None
         real_outdir = None
@@ -69,114 +507,723 @@ def main(argv=None):
                 print(f"Error creating output directory '{args.outdir}': {e}", file=sys.stderr)
                 return 1
 
-        def process_url(target_url: str) -> int:
-            """Process a single URL. Returns 0 on success, 1 on error."""
+        http_cache = None
+        conversion_cache = None
+        variant = ''
+        # Cached pages come back as Markdown only, so --formats renders every page.
+        if args.cache_dir and not args.no_cache and formats is None:
+            variant = engine.variant
+            cache_bytes = args.cache_max_mb * 1024 * 1024
+            try:
+                http_cache = HttpCache(Path(args.cache_dir), cache_bytes, variant)
+                conversion_cache = ConversionCache(Path(args.cache_dir), cache_bytes)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Error opening cache directory '{args.cache_dir}': {e}", file=sys.stderr)
+                return 1
+
+        @contextmanager
+        def polite_slot(target_url: str) -> Iterator[None]:
+            """Hold the per-host slot and --rate-policy delay for a robots.txt or image fetch."""
+            host = _hostname(target_url)
+            key = policy.key(host) if policy else host
+            # Take the token first: sleeping in a slot would hold back the host.
+            if throttle:
+                throttle.wait(key)
+            with host_limiter.slot(key) if host_limiter else nullcontext():
+                yield
+
+        robots = None
+        if args.respect_robots:
+            # Name our robots product token in the UA, so sites see which
+            # User-agent group the fetches follow.
+            session.headers['User-Agent'] = ROBOTS_USER_AGENT
+
+            def fetch_robots(robots_url: str):
+                """Return (status, text) of a robots.txt; (None, '') if unreachable."""
+                try:
+                    with polite_slot(robots_url):
+                        response = session.get(robots_url, timeout=10, stream=True)
+                        try:
+                            status = response.status_code
+                            if not isinstance(status, int):
+                                return None, ''
+                            body = b''
+                            if 200 <= status < 300:
+                                for chunk in response.iter_content(chunk_size=8192):
+                                    body += chunk
+                                    if len(body) >= MAX_ROBOTS_BYTES:
+                                        break
+                            return status, body.decode('utf-8', errors='replace')
+                        finally:
+                            response.close()
+                except requests.RequestException:
+                    return None, ''
+
+            robots_db = (Path(args.cache_dir) / 'robots.sqlite3'
+                         if args.cache_dir and not args.no_cache else None)
+            try:
+                robots = RobotsCache(fetch_robots, args.robots_ttl, robots_db)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Error opening robots cache in '{args.cache_dir}': {e}", file=sys.stderr)
+                robots = RobotsCache(fetch_robots, args.robots_ttl)
+
+        run_log = None
+        manifest = None
+        shards = None
+        pdf_writer = None
+        images = None
+        opening = args.log
+        try:
+            if args.log:
+                run_log = RunLog(Path(args.log))
+            if args.resume or args.manifest:
+                opening = args.manifest or str(Path(args.outdir) / MANIFEST_NAME)
+                manifest = Manifest(Path(opening))
+            if outdir_path is not None:
+                opening = args.outdir
+                shards = open_sink(args.sink, outdir_path, args.shard_max_mb * 1024 * 1024)
+            if args.images:
+                opening = str(outdir_path / IMAGE_DIR)
+                mb = 1024 * 1024
+                images = ImageStore(outdir_path / IMAGE_DIR, session, MAX_DOWNLOAD_BYTES,
+                                    page_budget=args.image_budget_mb * mb or None,
+                                    total_budget=args.image_total_budget_mb * mb or None,
+                                    max_px=args.image_max_px, quality=args.image_quality,
+                                    jobs=args.image_jobs, workers=args.image_workers,
+                                    allowed=robots.allowed if robots else None,
+                                    slot=polite_slot)
+            if formats and 'pdf' in formats:
+                opening = 'PDF workers'
+                pdf_writer = PdfWriter(args.pdf_workers)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error opening '{opening}': {e}", file=sys.stderr)
+            for opened in (http_cache, conversion_cache, robots, run_log, manifest, images,
+                           pdf_writer):
+                if opened:
+                    opened.close()
+            if shards:
+                _close_shards(shards)
+            return 1
+
+        def fail(record: Optional[RunRecord], message: str, err: TextIO) -> None:
+            """Report a per-URL error on ``err`` and as the record's reason."""
+            print(message, file=err)
+            if record is not None:
+                record.fail(message)
+
+        def log_record(record: RunRecord, exit_code: int) -> None:
+            """Settle ``record`` and append it to --log, if enabled.
+
+            A record with a pending output is logged (and marked done for
+            --resume) from that output's done-callback instead.
+            """
+            pending, record.pending = record.pending, None
+            if pending is not None:
+                pending.add_done_callback(lambda f: log_pending(record, f, exit_code))
+                return
+            record.finish(exit_code)
+            if run_log:
+                run_log.write(record)
+            if manifest:
+                size = None
+                # Shards keep growing; only per-URL files are checked by size.
+                if record.output and record.output != '<stdout>' and shards is None:
+                    try:
+                        size = os.stat(record.output).st_size
+                    except OSError:
+                        pass
+                try:
+                    manifest.record(record.input, record.status or 'error', record.output,
+                                    size, record.sha256, record.reason)
+                except sqlite3.Error as e:
+                    print(f"Manifest error: {e}", file=sys.stderr)
+            if stats:
+                observe_record(stats, record)
+
+        def log_pending(record: RunRecord, future: Future, exit_code: int) -> None:
+            """Log ``record`` once its --formats PDF has been rendered (or has failed)."""
+            error = future.exception()
+            if error is not None:
+                fail(record, f"PDF rendering failed for {record.input}: {error}", sys.stderr)
+                exit_code = 1
+            log_record(record, exit_code)
+
+        def fetch_stage(
+            target_url: str, out: TextIO, err: TextIO,
+            stream: Optional[Callable[[str, str], Optional[_StreamOutput]]] = None,
+            record: Optional[RunRecord] = None,
+        ) -> Optional[Page]:
+            """Fetch and decode one URL. Returns the page or None on error.
+
+            With ``stream``, the body is fed chunk by chunk to the output that
+            ``stream(url, encoding)`` opens instead of being buffered, and the
+            returned page is marked ``streamed``. Status, size and timings are
+            recorded on ``record``, which travels on with the page.
+            """
+            record = record or RunRecord(target_url)
             # Fix common URL typo: trailing slash before query parameters
             if '/?' in target_url:
                 target_url = target_url.replace('/?', '?')
 
             parsed = urlparse(target_url)
-            if parsed.scheme not in ('http', 'https'):
-                print(f"Error: Unsupported URL scheme '{parsed.scheme}'. "
-                      "Only http and https are allowed.", file=sys.stderr)
-                return 1
+            if parsed.scheme not in ALLOWED_SCHEMES:
+                fail(record, f"Error: Unsupported URL scheme '{parsed.scheme}'. "
+                             "Only http and https are allowed.", err)
+                return None
+
+            print(f"Processing URL: {target_url}", file=out)
 
-            print(f"Processing URL: {target_url}")
+            if robots is not None and not robots.allowed(target_url):
+                print(f"Skipped: {target_url} is disallowed by robots.txt.", file=out)
+                record.skip('disallowed by robots.txt')
+                return Page(target_url, None, skipped=True, record=record)
 
+            sink = None
+            nofollow = False
             try:
-                print("Fetching content...")
+                print("Fetching content...", file=out)
+                host_key = policy.key(parsed.hostname) if policy else parsed.hostname
+                host_slot = host_limiter.slot(host_key) if host_limiter else nullcontext()
+                cached = http_cache.lookup(target_url) if http_cache else None
+                request_kwargs = {}
+                if cached is not None:
+                    request_kwargs['headers'] = http_cache.conditional_headers(cached)
+                # Take the --rate-policy token before the slot, so a throttled
+                # host does not keep its slots while the token comes due.
+                if throttle:
+                    throttle.wait(host_key)
                 # Security: Stream response and enforce 10MB limit to prevent DoS (OOM)
-                response = session.get(target_url, timeout=30, stream=True)
-                try:
-                    response.raise_for_status()
-
-                    max_size = 10 * 1024 * 1024
+                with host_slot:
+                    fetch_start = time.perf_counter()
+                    # Time spent converting streamed chunks, reported as convert_ms.
+                    streamed = 0.0
+                    total = 0
                     try:
-                        if int(response.headers.get('Content-Length', 0)) > max_size:
-                            print(f"Error: Content-Length exceeds maximum allowed size ({max_size} bytes).", file=sys.stderr)
-                            return 1
-                    except ValueError:
-                        # Invalid or non-numeric Content-Length: treat as unknown size.
-                        # The streaming loop below still enforces max_size.
-                        pass
+                        response = session.get(target_url, timeout=30, stream=True,
+                                               **request_kwargs)
+                        if isinstance(response.status_code, int):
+                            record.http_status = response.status_code
+                        if record.http_status in RETRY_STATUSES:
+                            record.transient = True
+                            record.retry_after = parse_retry_after(
+                                response.headers.get('Retry-After'))
+                        try:
+                            if cached is not None and response.status_code == 304:
+                                http_cache.mark_used(target_url)
+                                print("Not modified; using cached Markdown.", file=out)
+                                record.reason = "not modified"
+                                return Page(target_url, None, markdown=cached.markdown,
+                                            record=record)
+                            response.raise_for_status()
 
-                    chunks = []
-                    total = 0
-                    for chunk in response.iter_content(chunk_size=8192):
-                        total += len(chunk)
-                        if total > max_size:
-                            print(f"Error: Downloaded content exceeds maximum allowed size ({max_size} bytes).", file=sys.stderr)
-                            return 1
-                        chunks.append(chunk)
-                    content_bytes = b"".join(chunks)
-                finally:
-                    response.close()
+                            max_size = MAX_DOWNLOAD_BYTES
+                            try:
+                                if int(response.headers.get('Content-Length', 0)) > max_size:
+                                    record.size_limited = True
+                                    fail(record, "Error: Content-Length exceeds maximum "
+                                                 f"allowed size ({max_size} bytes).", err)
+                                    return None
+                            except ValueError:
+                                # Invalid or non-numeric Content-Length: treat as unknown size.
+                                # The streaming loop below still enforces max_size.
+                                pass
 
-                encoding = response.encoding if isinstance(response.encoding, str) else "utf-8"
-                html_content = content_bytes.decode(encoding, errors="replace")
+                            encoding = response.encoding if isinstance(response.encoding, str) else "utf-8"
+                            if robots is not None:
+                                directives = header_directives(
+                                    response.headers.get('X-Robots-Tag'))
+                                if 'noindex' in directives:
+                                    print(f"Skipped: {target_url} is marked noindex.", file=out)
+                                    record.skip('noindex')
+                                    return Page(target_url, None, skipped=True, record=record)
+                                nofollow = 'nofollow' in directives
+                            if stream is not None:
+                                sink = stream(target_url, encoding)
+                                if sink is None:
+                                    return None
+                            hasher = (content_hasher(variant, encoding)
+                                      if conversion_cache and sink is None else None)
+                            chunks = []
+                            for chunk in response.iter_content(chunk_size=8192):
+                                total += len(chunk)
+                                if total > max_size:
+                                    record.size_limited = True
+                                    fail(record, "Error: Downloaded content exceeds maximum "
+                                                 f"allowed size ({max_size} bytes).", err)
+                                    if sink is not None:
+                                        sink.abort()
+                                    return None
+                                if sink is not None:
+                                    feed_start = time.perf_counter()
+                                    sink.feed(chunk)
+                                    streamed += time.perf_counter() - feed_start
+                                    continue
+                                chunks.append(chunk)
+                                if hasher:
+                                    hasher.update(chunk)
+                            if sink is not None:
+                                feed_start = time.perf_counter()
+                                sink.finish()
+                                streamed += time.perf_counter() - feed_start
+                                return Page(target_url, None, streamed=True, record=record)
+                            content_bytes = b"".join(chunks)
+                        finally:
+                            response.close()
+                    finally:
+                        record.bytes = total
+                        record.add('convert', streamed)
+                        record.add('fetch', time.perf_counter() - fetch_start - streamed)
 
-                print("Converting to Markdown...")
-                md_content = md(html_content, heading_style="ATX")
+                if robots is not None:
+                    # Only the head is searched; the page is not parsed here.
+                    directives = page_directives(
+                        content_bytes[:HEAD_SCAN_BYTES].decode(encoding, errors="replace"))
+                    if 'noindex' in directives:
+                        print(f"Skipped: {target_url} is marked noindex.", file=out)
+                        record.skip('noindex')
+                        return Page(target_url, None, skipped=True, record=record)
+                    nofollow = nofollow or 'nofollow' in directives
 
-                if args.outdir:
-                    # Create a safe filename based on the URL
-                    filename = "conversion_result.md"
-                    url_path = target_url.split('?')[0].rstrip('/')
-                    if url_path:
-                        base = os.path.basename(unquote(url_path))
-                        # Sanitize to prevent path traversal
-                        base = base.replace('/', '_').replace('\\', '_')
-                        base = base.strip('. ')
-                        if base:
-                            filename = f"{base}.md"
-
-                    out_path = (outdir_path or Path(args.outdir)) / filename
-                    # Final safety check: ensure output stays within outdir
-                    real_out_path = out_path.resolve()
-                    try:
-                        if real_outdir:
-                            real_out_path.relative_to(real_outdir)
-                    except ValueError:
-                        print("Error: Output path escapes output directory.",
-                              file=sys.stderr)
-                        return 1
-                    with out_path.open('w', encoding='utf-8') as f:
-                        f.write(md_content)
-                    print(f"Success! Saved to: {out_path}")
-                else:
-                    print(md_content)
+                etag = response.headers.get('ETag')
+                etag = etag if isinstance(etag, str) else None
+                last_modified = response.headers.get('Last-Modified')
+                last_modified = last_modified if isinstance(last_modified, str) else None
+                content_key = hasher.hexdigest() if hasher else None
+                if content_key:
+                    cached_md = conversion_cache.get(content_key)
+                    if cached_md is not None:
+                        print("Identical content already converted; using cached Markdown.",
+                              file=out)
+                        record.reason = "identical content cached"
+                        return Page(target_url, None, markdown=cached_md, etag=etag,
+                                    last_modified=last_modified, nofollow=nofollow,
+                                    record=record)
 
+                with record.timed('decode'):
+                    html_content = content_bytes.decode(encoding, errors="replace")
             except requests.RequestException as e:
-                print(f"Network error: {e}", file=sys.stderr)
-                return 1
+                if sink is None and is_transient_error(e):
+                    record.transient = True
+                fail(record, f"Network error: {e}", err)
+                if sink is not None:
+                    sink.abort()
+                return None
             except OSError as e:
-                print(f"File error: {e}", file=sys.stderr)
+                fail(record, f"File error: {e}", err)
+                if sink is not None:
+                    sink.abort()
+                return None
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                fail(record, f"Conversion failed: {e}", err)
+                if sink is not None:
+                    sink.abort()
+                return None
+
+            final_url = response.url if isinstance(response.url, str) else None
+            return Page(target_url, html_content, etag=etag, last_modified=last_modified,
+                        content_key=content_key, nofollow=nofollow, final_url=final_url,
+                        record=record)
+
+        def output_path(target_url: str, err: TextIO,
+                        record: Optional[RunRecord] = None) -> Optional[Path]:
+            """Return the --outdir file for ``target_url`` or None if it escapes."""
+            out_path = (outdir_path or Path(args.outdir)) / _output_name(target_url)
+            # Final safety check: ensure output stays within outdir
+            real_out_path = out_path.resolve()
+            try:
+                if real_outdir:
+                    real_out_path.relative_to(real_outdir)
+            except ValueError:
+                fail(record, "Error: Output path escapes output directory.", err)
+                return None
+            return out_path
+
+        def write_stage(page: Page, md_content: str, out: TextIO,
+                        err: TextIO) -> int:
+            """Write converted Markdown to --outdir or stdout. Returns 0 or 1."""
+            target_url = page.url
+            record = page.record or RunRecord(target_url)
+            # nofollow: keep the link text but drop the targets.
+            written = strip_links(md_content) if page.nofollow else md_content
+            try:
+                with record.timed('write'):
+                    record.bytes_out = len(written.encode('utf-8'))
+                    if shards is not None:
+                        record.sha256 = hashlib.sha256(written.encode('utf-8')).hexdigest()
+                        shard = shards.put(target_url, page.final_url or target_url,
+                                           _output_name(target_url), written, record.sha256)
+                        record.output = str(shard)
+                        print(f"Success! Saved to: {shard}", file=out)
+                    elif args.outdir:
+                        out_path = output_path(target_url, err, record)
+                        if out_path is None:
+                            return 1
+                        saved = written
+                        if images is not None:
+                            # The caches keep the remote links; only the file is rewritten.
+                            saved = images.localize(written, page.final_url or target_url)
+                            record.bytes_out = len(saved.encode('utf-8'))
+                        _write_atomic(out_path, saved)
+                        record.output = str(out_path)
+                        record.sha256 = hashlib.sha256(saved.encode('utf-8')).hexdigest()
+                        print(f"Success! Saved to: {out_path}", file=out)
+                    else:
+                        print(written, file=out)
+                        record.output = '<stdout>'
+                    if http_cache:
+                        http_cache.store(target_url, page.etag, page.last_modified, written)
+                    if conversion_cache and page.content_key and page.markdown is None:
+                        conversion_cache.put(page.content_key, md_content)
+            except OSError as e:
+                fail(record, f"File error: {e}", err)
+                return 1
+            except sqlite3.Error as e:
+                fail(record, f"Cache error: {e}", err)
                 return 1
             except Exception as e:  # pylint: disable=broad-exception-caught
-                print(f"Conversion failed: {e}", file=sys.stderr)
+                fail(record, f"Conversion failed: {e}", err)
                 return 1
 
             return 0
 
-        exit_code = 0
+        def host_key(target_url: str) -> str:
+            """Key of ``target_url``'s host for the circuit breaker."""
+            host = _hostname(target_url)
+            return policy.key(host) if policy else (host or '').lower()
+
+        def throttle_wait(target_url: str) -> float:
+            """Seconds until ``target_url``'s host has a --rate-policy token; 0 if it has one."""
+            return throttle.ready_in(host_key(target_url)) if throttle else 0.0
+
+        def guarded(target_url: str, err: TextIO, record: RunRecord,
+                    attempt: Callable[[], _T]) -> Optional[_T]:
+            """Run ``attempt`` and feed the outcome back to the circuit breaker.
+
+            Raises :class:`CircuitOpen` instead while the host's circuit is open.
+            """
+            if breaker is None:
+                return attempt()
+            host = host_key(target_url)
+            if not breaker.allow(host):
+                raise CircuitOpen(host, breaker.wait(host))
+            try:
+                return attempt()
+            finally:
+                if record.transient:
+                    breaker.failure(host)
+                else:
+                    breaker.success(host)
+
+        def circuit_wait(target_url: str, opened: CircuitOpen, err: TextIO) -> float:
+            """Report that ``target_url`` waits for its host's circuit; return the wait."""
+            print(f"Circuit open for {opened.host} after repeated failures; {target_url} "
+                  f"waits {opened.wait:.1f}s.", file=err)
+            return opened.wait
 
-        if args.url:
-            code = process_url(args.url)
-            if code:
-                exit_code = code
+        def retry_delay(target_url: str, record: RunRecord, err: TextIO) -> Optional[float]:
+            """Return the wait before retrying a failed URL, or None to give up.
 
-        if args.batch:
-            if not os.path.exists(args.batch):
-                print(f"Error: Batch file not found: {args.batch}", file=sys.stderr)
+            Either decision is reported on ``err``; a retried record is reset.
+            """
+            if not record.transient or not args.retries:
+                return None
+            if record.retries >= args.retries:
+                print(f"Giving up on {target_url} after {record.retries + 1} attempts.",
+                      file=err)
+                record.reason = f"{record.reason} (after {record.retries + 1} attempts)"
+                return None
+            delay = backoff.delay(record.retries, record.retry_after)
+            if delay is None:
+                print(f"Giving up on {target_url}: Retry-After of {record.retry_after:.0f}s "
+                      "exceeds --retry-max-wait.", file=err)
+                return None
+            print(f"Retrying {target_url} in {delay:.1f}s "
+                  f"(retry {record.retries + 1}/{args.retries}).", file=err)
+            record.retry()
+            return delay
+
+        def process_url(target_url: str, out: Optional[TextIO] = None,
+                        err: Optional[TextIO] = None) -> int:
+            """Process a single URL. Returns 0 on success, 1 on error."""
+            out = out or sys.stdout
+            err = err or sys.stderr
+            return attempt_url(target_url, out, err, RunRecord(target_url), defer=False)
+
+        def batch_url(target_url: str, out: TextIO, err: TextIO) -> int:
+            """process_url for run_concurrent; retries are deferred rather than slept."""
+            return attempt_url(target_url, out, err, RunRecord(target_url), defer=True)
+
+        def attempt_url(target_url: str, out: TextIO, err: TextIO,
+                        record: RunRecord, defer: bool) -> int:
+            """Try one URL; on a transient failure, retry it after a backoff.
+
+            With ``defer``, the retry is handed back to run_concurrent as
+            :class:`RetryLater` so the thread can serve other URLs meanwhile;
+            so is a URL whose host has no --rate-policy token free yet.
+            """
+            wait = throttle_wait(target_url)
+            if wait > 0:
+                # Wait for the host's token before taking a slot (or a thread).
+                if defer:
+                    raise RetryLater(wait,
+                                     lambda o, e: attempt_url(target_url, o, e, record, True))
+                time.sleep(wait)
+            code = 1
+            delay = None
+            try:
+                code = guarded(target_url, err, record,
+                               lambda: convert_url(target_url, out, err, record))
+                if code is None:
+                    code = 1
+                if code:
+                    delay = retry_delay(target_url, record, err)
+            except CircuitOpen as opened:
+                # Put off, not failed: no attempt was made and none is counted.
+                delay = circuit_wait(target_url, opened, err)
+            finally:
+                if delay is None:
+                    log_record(record, code)
+            if delay is None:
+                return code
+            if defer:
+                raise RetryLater(delay, lambda o, e: attempt_url(target_url, o, e, record, True))
+            time.sleep(delay)
+            return attempt_url(target_url, out, err, record, False)
+
+        def convert_url(target_url: str, out: TextIO, err: TextIO,
+                        record: RunRecord) -> int:
+            """Fetch, convert and write one URL in the calling thread."""
+            if args.stream:
+                return stream_url(target_url, out, err, record)
+            page = fetch_stage(target_url, out, err, record=record)
+            if page is None:
+                return 1
+            if page.skipped:
+                return 0
+            if formats is not None:
+                return render_formats(page, out, err)
+
+            if page.markdown is not None:
+                md_content = page.markdown
+            else:
+                try:
+                    print("Converting to Markdown...", file=out)
+                    with record.timed('convert'):
+                        md_content = engine.convert(page.html)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    fail(record, f"Conversion failed: {e}", err)
+                    return 1
+
+            return write_stage(page, md_content, out, err)
+
+        def render_formats(page: Page, out: TextIO, err: TextIO) -> int:
+            """Parse ``page`` once and write every --formats output. Returns 0 or 1."""
+            record = page.record or RunRecord(page.url)
+            try:
+                print(f"Rendering {', '.join(formats)}...", file=out)
+                with record.timed('convert'):
+                    doc = Document.parse(page.html or '')
+                    md_content = render_markdown(doc) if 'md' in formats else None
+                    text = render_text(doc) if 'txt' in formats else None
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                fail(record, f"Conversion failed: {e}", err)
+                return 1
+            if md_content is not None:
+                code = write_stage(page, md_content, out, err)
+                if code:
+                    return code
+            out_path = None
+            if args.outdir:
+                out_path = output_path(page.url, err, record)
+                if out_path is None:
+                    return 1
+            try:
+                with record.timed('write'):
+                    if text is not None and out_path is not None:
+                        txt_path = out_path.with_suffix('.txt')
+                        _write_atomic(txt_path, text)
+                        print(f"Success! Saved to: {txt_path}", file=out)
+                    elif text is not None:
+                        print(text, file=out)
+                    if text is not None and md_content is None:
+                        data = text.encode('utf-8')
+                        record.bytes_out = len(data)
+                        record.sha256 = hashlib.sha256(data).hexdigest()
+                        record.output = str(txt_path) if out_path is not None else '<stdout>'
+                    if pdf_writer is not None and out_path is not None:
+                        pdf_path = out_path.with_suffix('.pdf')
+                        # The page moves on while the PDF renders; it is logged
+                        # (and marked done for --resume) once the PDF exists.
+                        record.pending = pdf_writer.submit(doc, pdf_path)
+                        print(f"Rendering PDF to: {pdf_path}", file=out)
+                        if not record.output:
+                            record.output = str(pdf_path)
+            except OSError as e:
+                fail(record, f"File error: {e}", err)
+                return 1
+            return 0
+
+        def stream_url(target_url: str, out: TextIO, err: TextIO,
+                       record: RunRecord) -> int:
+            """Fetch and convert one URL incrementally. Returns 0 or 1."""
+            opened = []
+
+            def open_output(url: str, encoding: str) -> Optional[_StreamOutput]:
+                out_path = None
+                if args.outdir:
+                    out_path = output_path(url, err, record)
+                    if out_path is None:
+                        return None
+                print("Converting to Markdown (streaming)...", file=out)
+                opened.append(_StreamOutput(out_path, out, encoding))
+                return opened[-1]
+
+            page = fetch_stage(target_url, out, err, stream=open_output, record=record)
+            if page is None:
                 return 1
-            with open(args.batch, 'r', encoding='utf-8') as f:
-                for line in f:
-                    u = line.strip()
-                    if u:
-                        code = process_url(u)
-                        exit_code |= code
-
-        return exit_code
+            if page.skipped:
+                return 0
+            if not page.streamed:
+                # Answered from cache before any body was streamed.
+                return write_stage(page, page.markdown or '', out, err)
+            if opened:
+                record.bytes_out = opened[0].bytes_out
+            if opened and opened[0].path is not None:
+                record.output = str(opened[0].path)
+                record.sha256 = opened[0].hash.hexdigest()
+                print(f"Success! Saved to: {opened[0].path}", file=out)
+            else:
+                record.output = '<stdout>'
+            return 0
+
+        def pipeline_fetch(target_url: str, out: TextIO, err: TextIO,
+                           record: Optional[RunRecord] = None) -> Optional[Page]:
+            """fetch_stage for --convert-workers; logs URLs that fail to fetch.
+
+            A retry, or a host without a free --rate-policy token, raises
+            :class:`RetryLater`; the pipeline re-queues the URL after the delay
+            instead of blocking a fetch thread.
+            """
+            record = record or RunRecord(target_url)
+            wait = throttle_wait(target_url)
+            if wait > 0:
+                raise RetryLater(wait, lambda o, e: pipeline_fetch(target_url, o, e, record))
+            try:
+                page = guarded(target_url, err, record,
+                               lambda: fetch_stage(target_url, out, err, record=record))
+            except CircuitOpen as opened:
+                delay = circuit_wait(target_url, opened, err)
+                raise RetryLater(delay, lambda o, e: pipeline_fetch(target_url, o, e, record))
+            if page is not None:
+                return page
+            delay = retry_delay(target_url, record, err)
+            if delay is None:
+                log_record(record, 1)
+                return None
+            raise RetryLater(delay, lambda o, e: pipeline_fetch(target_url, o, e, record))
+
+        deduper = _deduper(args)
+
+        def run_batch(feed: UrlFeed) -> int:
+            """Process the URLs of a --batch source as they are read."""
+            exit_code = 0
+            urls: Iterable[str] = feed
+            if deduper is not None:
+                urls = _unique(urls, args, deduper)
+            if args.resume and manifest is not None:
+                # Completed URLs are dropped here, before any fetch.
+                urls = filter(manifest.pending, urls)
+            if policy is not None:
+                urls = interleave(urls, lambda u: policy.key(_hostname(u)),
+                                  policy.window, feed.ready)
+            if args.convert_workers:
+                exit_code |= run_pipeline(
+                    urls, pipeline_fetch,
+                    functools.partial(convert_html, engine=args.engine), write_stage,
+                    jobs=args.jobs, convert_workers=args.convert_workers,
+                    initializer=functools.partial(init_worker, args.engine),
+                    done=lambda page, code: log_record(page.record, code),
+                )
+            elif args.jobs > 1 or args.retries:
+                exit_code |= run_concurrent(urls, batch_url, args.jobs, feed.ready)
+            else:
+                for u in urls:
+                    code = process_url(u)
+                    exit_code |= code
+
+            return exit_code
+
+        def run() -> int:
+            """Process --url and --batch inputs and OR their exit codes."""
+            exit_code = 0
+
+            if args.url:
+                code = process_url(args.url)
+                if code:
+                    exit_code = code
+
+            if args.batch:
+                try:
+                    source = _batch_source(args.batch)
+                except FileNotFoundError:
+                    print(f"Error: Batch file not found: {args.batch}", file=sys.stderr)
+                    return 1
+                except OSError as e:
+                    print(f"Error: Cannot read batch file: {e}", file=sys.stderr)
+                    return 1
+                with source as f:
+                    feed = UrlFeed(f)
+                    try:
+                        exit_code |= run_batch(feed)
+                    except (OSError, ValueError) as e:
+                        print(f"Error: Cannot read batch file: {e}", file=sys.stderr)
+                        exit_code |= 1
+                    finally:
+                        feed.close()
+
+            return exit_code
+
+        try:
+            exit_code = run()
+            if shards:
+                exit_code |= _close_shards(shards)
+            if pdf_writer and pdf_writer.close():
+                exit_code |= 1
+            if images:
+                print(f"Images: {images.fetched} fetched, {images.stored} stored "
+                      f"({images.stored_bytes} bytes), {images.reused} reused, "
+                      f"{images.skipped} over budget, {images.disallowed} disallowed by "
+                      f"robots.txt, {images.failed} failed", file=sys.stderr)
+            if deduper is not None and args.batch:
+                _report_dedupe(deduper)
+            if args.resume and manifest is not None and args.batch:
+                print(f"Resume: {manifest.resumed} URLs already done, skipped.",
+                      file=sys.stderr)
+            if conversion_cache and args.batch:
+                print(f"Conversion cache: {conversion_cache.hits} hits, "
+                      f"{conversion_cache.misses} misses", file=sys.stderr)
+            if stats:
+                print(summary(stats), file=sys.stderr)
+            return exit_code
+        finally:
+            if pdf_writer:
+                # First: finished PDFs still log their pages.
+                pdf_writer.close()
+            if http_cache:
+                http_cache.close()
+            if conversion_cache:
+                conversion_cache.close()
+            if run_log:
+                run_log.close()
+            if robots:
+                robots.close()
+            if manifest:
+                manifest.close()
+            if shards:
+                # Already closed unless run() raised; keeps complete pages readable.
+                _close_shards(shards)
+            if images:
+                images.close()
 
     ap.print_help()
     return 0
@@ -0,0 +1,137 @@
+"""Pluggable HTML to Markdown conversion engines.
+
+``markdownify`` (the default) builds a BeautifulSoup tree and walks it in
+Python. ``fast`` feeds parser events straight into
+:class:`~html2md.stream.MarkdownRenderer`, which writes to an output buffer
+without building a tree; it uses lxml's C parser when lxml is installed and
+the stdlib :class:`html.parser.HTMLParser` otherwise.
+
+The module-level :func:`convert_html` and :func:`init_worker` are picklable
+entry points for conversion worker processes.
+"""
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from importlib import metadata
+from typing import Callable, Dict, List
+
+from .stream import MarkdownRenderer, convert as convert_with_stdlib
+
+DEFAULT_ENGINE = 'markdownify'
+
+
+class Engine(ABC):
+    """Interface of a conversion engine."""
+
+    name = ''
+
+    @abstractmethod
+    def convert(self, html: str) -> str:
+        """Convert an HTML document to Markdown."""
+
+    @property
+    def variant(self) -> str:
+        """Identify the engine, its version and options for cache keys."""
+        return self.name
+
+
+class MarkdownifyEngine(Engine):
+    """markdownify with ATX headings; imports markdownify on construction."""
+
+    name = 'markdownify'
+
+    def __init__(self):
+        from markdownify import markdownify  # pylint: disable=import-outside-toplevel
+        self._markdownify: Callable[..., str] = markdownify
+
+    def convert(self, html: str) -> str:
+        return self._markdownify(html, heading_style="ATX")
+
+    @property
+    def variant(self) -> str:
+        return f'markdownify-{_version("markdownify")}:heading_style=ATX'
+
+
+class LxmlTarget:
+    """lxml parser target forwarding events to a :class:`MarkdownRenderer`.
+
+    Like :class:`~html2md.stream.EventParser`, it accepts any object with
+    the renderer's event methods.
+    """
+
+    def __init__(self, renderer: MarkdownRenderer):
+        self._renderer = renderer
+
+    def start(self, tag, attrib):
+        self._renderer.start(tag, dict(attrib))
+
+    def end(self, tag):
+        self._renderer.end(tag)
+
+    def data(self, data):
+        self._renderer.data(data)
+
+    def comment(self, text):  # pylint: disable=unused-argument
+        return None
+
+    def close(self):
+        self._renderer.close()
+
+
+class FastEngine(Engine):
+    """Tree-less renderer on lxml's parser, falling back to the stdlib parser."""
+
+    name = 'fast'
+
+    def __init__(self):
+        try:
+            from lxml import etree  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            etree = None
+        self._etree = etree
+        self.backend = 'lxml' if etree is not None else 'html.parser'
+
+    def convert(self, html: str) -> str:
+        if self._etree is None:
+            return convert_with_stdlib(html)
+        parts: List[str] = []
+        parser = self._etree.HTMLParser(target=LxmlTarget(MarkdownRenderer(parts.append)))
+        parser.feed(html)
+        parser.close()
+        return ''.join(parts)
+
+    @property
+    def variant(self) -> str:
+        return f'fast-{_version("html2md-cli")}:{self.backend}'
+
+
+ENGINES: Dict[str, Callable[[], Engine]] = {
+    MarkdownifyEngine.name: MarkdownifyEngine,
+    FastEngine.name: FastEngine,
+}
+
+_worker_engines: Dict[str, Engine] = {}
+
+
+def get_engine(name: str = DEFAULT_ENGINE) -> Engine:
+    """Instantiate the engine called ``name``; raises KeyError if unknown."""
+    return ENGINES[name]()
+
+
+def _version(dist: str) -> str:
+    try:
+        return metadata.version(dist)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def init_worker(engine: str = DEFAULT_ENGINE) -> None:
+    """Import and set up ``engine`` once per conversion worker process."""
+    if engine not in _worker_engines:
+        _worker_engines[engine] = get_engine(engine)
+
+
+def convert_html(html: str, engine: str = DEFAULT_ENGINE) -> str:
+    """Convert an HTML document to Markdown with the named engine."""
+    init_worker(engine)
+    return _worker_engines[engine].convert(html)
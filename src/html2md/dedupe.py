@@ -0,0 +1,168 @@
+"""URL canonicalization and duplicate removal for batch input (``--dedupe``).
+
+:func:`canonicalize` maps the variants crawlers produce for one page
+(fragments, tracking parameters, host case, default ports) to one URL.
+:class:`Deduper` remembers which canonical URLs were already seen. Small
+batches use an exact set of 16-byte digests. Past ``max_exact`` URLs it
+switches to a :class:`BloomFilter` with a fixed memory footprint, which
+may drop a unique URL with probability ``error_rate`` but never lets a
+duplicate through.
+"""
+from __future__ import annotations
+
+import fnmatch
+import hashlib
+import math
+from typing import Callable, Iterable, Iterator, Sequence, Set
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+
+# Query parameters dropped by default: analytics and click identifiers.
+DEFAULT_STRIP_PARAMS = ('utm_*', 'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid',
+                        'mc_cid', 'mc_eid', '_ga', '_gl')
+MODES = ('auto', 'exact', 'bloom')
+# auto mode keeps an exact set up to this many unique URLs (about 100 MB).
+DEFAULT_MAX_EXACT = 1_000_000
+# Bloom filter sizing: 20 million URLs at a one-in-a-million false-positive
+# rate take about 72 MB.
+DEFAULT_CAPACITY = 20_000_000
+DEFAULT_ERROR_RATE = 1e-6
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonicalize(url: str, strip_params: Sequence[str] = DEFAULT_STRIP_PARAMS,
+                 sort_query: bool = False) -> str:
+    """Return the canonical form of an http(s) ``url``; other URLs are only stripped.
+
+    Scheme and host are lowercased, default ports and the fragment are
+    removed, an empty path becomes ``/`` and query parameters whose names
+    match a ``strip_params`` glob are dropped. The remaining parameters keep
+    their original encoding and, unless ``sort_query``, their order.
+    """
+    url = url.strip()
+    # Same rewrite fetch_stage applies, so the key matches what is fetched.
+    if '/?' in url:
+        url = url.replace('/?', '?')
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return url
+    host = parts.hostname.lower()
+    if ':' in host:
+        host = f'[{host}]'
+    userinfo, at, _ = parts.netloc.rpartition('@')
+    netloc = f'{userinfo}{at}{host}'
+    if port is not None and port != _DEFAULT_PORTS[scheme]:
+        netloc = f'{netloc}:{port}'
+    query = parts.query
+    if query and (strip_params or sort_query):
+        fields = [f for f in query.split('&') if f]
+        if strip_params:
+            fields = [f for f in fields if not _matches(f, strip_params)]
+        if sort_query:
+            fields.sort()
+        query = '&'.join(fields)
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def _matches(field: str, patterns: Sequence[str]) -> bool:
+    name = unquote_plus(field.partition('=')[0]).lower()
+    return any(fnmatch.fnmatchcase(name, pattern.lower()) for pattern in patterns)
+
+
+class BloomFilter:
+    """Bit array sized for ``capacity`` items at false-positive rate ``error_rate``.
+
+    Items are 16-byte digests; the ``k`` bit positions come from double
+    hashing the digest's two halves.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError('capacity must be >= 1 and error_rate in (0, 1)')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, digest: bytes) -> Iterator[int]:
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        bits = self.bits
+        return ((h1 + i * h2) % bits for i in range(self.hashes))
+
+    def __contains__(self, digest: bytes) -> bool:
+        array = self._array
+        return all(array[bit >> 3] & (1 << (bit & 7)) for bit in self._positions(digest))
+
+    def add(self, digest: bytes) -> bool:
+        """Add ``digest``; return True if it was (probably) present already."""
+        array = self._array
+        present = True
+        for bit in self._positions(digest):
+            mask = 1 << (bit & 7)
+            if not array[bit >> 3] & mask:
+                present = False
+                array[bit >> 3] |= mask
+        return present
+
+
+class Deduper:
+    """Tracks seen keys: exact up to ``max_exact``, then (``auto``) a Bloom filter."""
+
+    def __init__(self, mode: str = 'auto', capacity: int = DEFAULT_CAPACITY,
+                 error_rate: float = DEFAULT_ERROR_RATE, max_exact: int = DEFAULT_MAX_EXACT):
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {", ".join(MODES)}')
+        self.mode = mode
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._max_exact = max_exact
+        self._exact: Set[bytes] = set()
+        self._bloom = BloomFilter(capacity, error_rate) if mode == 'bloom' else None
+        self.unique = 0
+        self.duplicates = 0
+
+    @property
+    def structure(self) -> str:
+        """``'exact'`` or ``'bloom'``: what is currently tracking the keys."""
+        return 'exact' if self._bloom is None else 'bloom'
+
+    def add(self, key: str) -> bool:
+        """Record ``key``; return True if it was not seen before."""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        if self._bloom is not None:
+            seen = self._bloom.add(digest)
+        else:
+            seen = digest in self._exact
+            if not seen:
+                self._exact.add(digest)
+                if self.mode == 'auto' and len(self._exact) > self._max_exact:
+                    self._spill()
+        if seen:
+            self.duplicates += 1
+        else:
+            self.unique += 1
+        return not seen
+
+    def _spill(self) -> None:
+        bloom = BloomFilter(self._capacity, self._error_rate)
+        for digest in self._exact:
+            bloom.add(digest)
+        self._bloom = bloom
+        self._exact = set()
+
+
+def unique_urls(urls: Iterable[str], deduper: Deduper,
+                canonical: Callable[[str], str] = canonicalize) -> Iterator[str]:
+    """Yield the canonical form of each URL in ``urls`` the first time it appears."""
+    add = deduper.add
+    for url in urls:
+        url = canonical(url)
+        if add(url):
+            yield url
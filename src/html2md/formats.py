@@ -0,0 +1,494 @@
+"""Multi-format output from one parse (``--formats md,txt,pdf``).
+
+:meth:`Document.parse` runs the HTML parser once and records its start-tag,
+end-tag and text events. Each format then renders from that recording
+without parsing again:
+
+* Markdown replays the events into :class:`~html2md.stream.MarkdownRenderer`,
+  so it matches ``--engine fast``;
+* plain text and PDF use :func:`blocks`, which groups the events into
+  headings, paragraphs, list items, code blocks, rules and tables.
+
+PDF rendering with ReportLab is by far the slowest of the three.
+:class:`PdfWriter` runs it in worker processes, so Markdown and text
+output do not wait for it.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from .convert import LxmlTarget
+from .stream import BLOCK_TAGS, HEADINGS, SKIP_TAGS, EventParser, MarkdownRenderer
+
+FORMATS = ('md', 'txt', 'pdf')
+
+_START, _END, _DATA = 0, 1, 2
+# (kind, tag or text, attrs)
+Event = Tuple[int, str, Optional[Dict[str, str]]]
+# Inline run: (text, styles, href). Styles: b(old), i(talic), c(ode), n (line break).
+Run = Tuple[str, str, str]
+
+_SPACE = re.compile(r'\s+')
+_INLINE = {'b': 'b', 'strong': 'b', 'i': 'i', 'em': 'i',
+           'code': 'c', 'kbd': 'c', 'samp': 'c', 'tt': 'c'}
+
+
+def parse_formats(value: str) -> List[str]:
+    """Return the formats of a ``--formats`` value; raises ValueError for unknown ones."""
+    formats: List[str] = []
+    for name in (part.strip().lower() for part in value.split(',')):
+        if not name:
+            continue
+        if name not in FORMATS:
+            raise ValueError(f"unknown format '{name}' (choose from {', '.join(FORMATS)})")
+        if name not in formats:
+            formats.append(name)
+    if not formats:
+        raise ValueError('no format given')
+    return formats
+
+
+class _Recorder:
+    """Parser target that records events for :class:`Document`."""
+
+    def __init__(self, events: List[Event]):
+        self._events = events
+
+    def start(self, tag: str, attrs: Dict[str, str]) -> None:
+        self._events.append((_START, tag, attrs))
+
+    def end(self, tag: str) -> None:
+        self._events.append((_END, tag, None))
+
+    def data(self, text: str) -> None:
+        if text:
+            self._events.append((_DATA, text, None))
+
+    def close(self) -> None:
+        pass
+
+
+class Document:
+    """The parse events of one HTML page, replayable into any renderer."""
+
+    __slots__ = ('events',)
+
+    def __init__(self, events: List[Event]):
+        self.events = events
+
+    @classmethod
+    def parse(cls, html: str) -> 'Document':
+        """Parse ``html`` once, with lxml when it is installed, else the stdlib parser."""
+        events: List[Event] = []
+        recorder = _Recorder(events)
+        try:
+            from lxml import etree  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            parser = EventParser(recorder)  # type: ignore[arg-type]
+            parser.feed(html)
+            parser.close()
+        else:
+            lxml_parser = etree.HTMLParser(target=LxmlTarget(recorder))  # type: ignore
+            lxml_parser.feed(html)
+            lxml_parser.close()
+        return cls(events)
+
+    def replay(self, target) -> None:
+        """Feed the recorded events to ``target`` (start/end/data/close)."""
+        start, end, data = target.start, target.end, target.data
+        for kind, value, attrs in self.events:
+            if kind == _START:
+                start(value, attrs)
+            elif kind == _END:
+                end(value)
+            else:
+                data(value)
+        target.close()
+
+    def title(self) -> str:
+        """Return the text of the ``<title>`` element, or ''."""
+        parts: List[str] = []
+        inside = False
+        for kind, value, _ in self.events:
+            if kind == _START and value == 'title':
+                inside = True
+            elif kind == _END and value == 'title':
+                break
+            elif kind == _DATA and inside:
+                parts.append(value)
+        return ' '.join(''.join(parts).split())
+
+
+def render_markdown(doc: Document) -> str:
+    """Render ``doc`` as Markdown."""
+    parts: List[str] = []
+    doc.replay(MarkdownRenderer(parts.append))
+    return ''.join(parts)
+
+
+class Block(NamedTuple):
+    """A block of a rendered document."""
+
+    # heading, para, item, pre, rule or table
+    kind: str
+    runs: Tuple[Run, ...] = ()
+    # Heading level, or list nesting depth (from 0) of an item.
+    level: int = 0
+    # Bullet or number of the first block of a list item; '' for the rest.
+    marker: str = ''
+    # Number of enclosing blockquotes.
+    quote: int = 0
+    # Preformatted text of a pre block.
+    text: str = ''
+    rows: Tuple[Tuple[str, ...], ...] = ()
+
+    @property
+    def plain(self) -> str:
+        """The block's inline text without styles."""
+        return ''.join(text for text, _, _ in self.runs)
+
+
+class _BlockBuilder:
+    """Groups parse events into :class:`Block` objects."""
+
+    def __init__(self):
+        self.blocks: List[Block] = []
+        self._runs: List[Run] = []
+        self._styles: List[Tuple[str, str]] = []
+        self._skip = 0
+        self._heading = 0
+        self._quote = 0
+        self._lists: List[List[int]] = []
+        self._marker = ''
+        self._pre: Optional[List[str]] = None
+        self._rows: Optional[List[Tuple[str, ...]]] = None
+        self._cells: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+
+    def start(self, tag: str, attrs: Dict[str, str]) -> None:
+        if tag in SKIP_TAGS or tag == 'title':
+            self._skip += 1
+        elif self._skip or self._pre is not None:
+            return
+        elif tag in BLOCK_TAGS:
+            self._flush()
+        elif tag in HEADINGS:
+            self._flush()
+            self._heading = HEADINGS[tag]
+        elif tag in ('ul', 'ol'):
+            self._flush()
+            try:
+                first = int(attrs.get('start') or 1)
+            except ValueError:
+                first = 1
+            self._lists.append([tag == 'ol', first - 1])
+        elif tag == 'li':
+            self._flush()
+            if not self._lists:
+                self._lists.append([False, 0])
+            current = self._lists[-1]
+            current[1] += 1
+            self._marker = f'{current[1]}.' if current[0] else '•'
+        elif tag == 'blockquote':
+            self._flush()
+            self._quote += 1
+        elif tag == 'pre':
+            self._flush()
+            self._pre = []
+        elif tag == 'hr':
+            self._flush()
+            self.blocks.append(Block('rule'))
+        elif tag == 'table':
+            self._flush()
+            self._rows = []
+        elif tag == 'tr' and self._rows is not None:
+            self._end_row()
+            self._cells = []
+        elif tag in ('td', 'th') and self._cells is not None:
+            self._end_cell()
+            self._cell = []
+        elif tag == 'br':
+            self._add('\n', 'n')
+        elif tag == 'img':
+            alt = (attrs.get('alt') or '').strip()
+            if alt:
+                self._add(alt, 'i')
+        elif tag in _INLINE or tag == 'a':
+            self._styles.append((tag, attrs.get('href', '') if tag == 'a' else ''))
+
+    def end(self, tag: str) -> None:
+        if tag in SKIP_TAGS or tag == 'title':
+            self._skip = max(0, self._skip - 1)
+        elif self._skip:
+            return
+        elif self._pre is not None:
+            if tag == 'pre':
+                text = ''.join(self._pre).strip('\n')
+                self._pre = None
+                self.blocks.append(self._block('pre', text=text))
+        elif tag in BLOCK_TAGS or tag == 'li':
+            self._flush()
+        elif tag in HEADINGS:
+            self._flush()
+            self._heading = 0
+        elif tag in ('ul', 'ol'):
+            self._flush()
+            if self._lists:
+                self._lists.pop()
+        elif tag == 'blockquote':
+            self._flush()
+            self._quote = max(0, self._quote - 1)
+        elif tag in ('td', 'th'):
+            self._end_cell()
+        elif tag == 'tr':
+            self._end_row()
+        elif tag == 'table':
+            self._end_row()
+            if self._rows:
+                self.blocks.append(self._block('table', rows=tuple(self._rows)))
+            self._rows = None
+        elif any(open_tag == tag for open_tag, _ in self._styles):
+            while self._styles and self._styles.pop()[0] != tag:
+                pass
+
+    def data(self, text: str) -> None:
+        if self._skip:
+            return
+        if self._pre is not None:
+            self._pre.append(text)
+        elif self._cell is not None:
+            self._cell.append(text)
+        else:
+            self._add(text, '')
+
+    def close(self) -> None:
+        if self._pre is not None:
+            self.end('pre')
+        if self._rows is not None:
+            self.end('table')
+        self._flush()
+
+    def _add(self, text: str, style: str) -> None:
+        if self._cell is not None:
+            self._cell.append(' ' if style == 'n' else text)
+            return
+        styles = {_INLINE[tag] for tag, _ in self._styles if tag in _INLINE}
+        href = next((h for tag, h in reversed(self._styles) if tag == 'a' and h), '')
+        self._runs.append((text, style + ''.join(sorted(styles)), href))
+
+    def _block(self, kind: str, **fields) -> Block:
+        level = self._heading if kind == 'heading' else max(0, len(self._lists) - 1)
+        if kind == 'item':
+            fields['marker'], self._marker = self._marker, ''
+        return Block(kind, level=level, quote=self._quote, **fields)
+
+    def _flush(self) -> None:
+        """Turn the buffered runs into a block, collapsing whitespace."""
+        runs: List[Run] = []
+        for text, style, href in self._runs:
+            if 'n' not in style:
+                text = _SPACE.sub(' ', text)
+                if text.startswith(' ') and (not runs or runs[-1][0].endswith((' ', '\n'))):
+                    text = text[1:]
+            if text:
+                runs.append((text, style, href))
+        self._runs = []
+        while runs and not runs[-1][0].strip():
+            runs.pop()
+        if runs and runs[-1][0].endswith(' '):
+            runs[-1] = (runs[-1][0].rstrip(' '),) + runs[-1][1:]
+        if not runs:
+            return
+        if self._heading:
+            kind = 'heading'
+        elif self._lists:
+            kind = 'item'
+        else:
+            kind = 'para'
+        self.blocks.append(self._block(kind, runs=tuple(runs)))
+
+    def _end_cell(self) -> None:
+        if self._cell is not None and self._cells is not None:
+            self._cells.append(' '.join(''.join(self._cell).split()))
+        self._cell = None
+
+    def _end_row(self) -> None:
+        self._end_cell()
+        if self._cells and self._rows is not None:
+            self._rows.append(tuple(self._cells))
+        self._cells = None
+
+
+def blocks(doc: Document) -> List[Block]:
+    """Group ``doc`` into blocks for the text and PDF renderers."""
+    builder = _BlockBuilder()
+    doc.replay(builder)
+    return builder.blocks
+
+
+def render_text(doc: Document) -> str:
+    """Render ``doc`` as plain text: no markup, links reduced to their text."""
+    out: List[str] = []
+    previous = ''
+    for block in blocks(doc):
+        indent = '    ' * block.quote
+        if block.kind == 'item':
+            lead = '  ' * block.level
+            lines = block.plain.split('\n')
+            marker = (block.marker + ' ') if block.marker else ''
+            pad = ' ' * len(marker)
+            lines = [indent + lead + (marker if i == 0 else pad) + line
+                     for i, line in enumerate(lines)]
+        elif block.kind == 'heading':
+            title = ' '.join(block.plain.split())
+            lines = [indent + title]
+            if block.level <= 2:
+                lines.append(indent + ('=' if block.level == 1 else '-') * len(title))
+        elif block.kind == 'pre':
+            lines = [indent + line for line in block.text.split('\n')]
+        elif block.kind == 'rule':
+            lines = [indent + '-' * 40]
+        elif block.kind == 'table':
+            lines = [indent + '\t'.join(row) for row in block.rows]
+        else:
+            lines = [indent + line for line in block.plain.split('\n')]
+        if out:
+            # List items follow each other directly; other blocks get a blank line.
+            out.append('\n' if block.kind == previous == 'item' and block.marker else '\n\n')
+        out.append('\n'.join(line.rstrip() for line in lines))
+        previous = block.kind
+    return ''.join(out) + ('\n' if out else '')
+
+
+def _markup(runs: Sequence[Run]) -> str:
+    """ReportLab paragraph markup for inline runs."""
+    parts = []
+    for text, style, href in runs:
+        if 'n' in style:
+            parts.append('<br/>')
+            continue
+        text = escape(text)
+        if 'c' in style:
+            text = f'<font face="Courier">{text}</font>'
+        if 'i' in style:
+            text = f'<i>{text}</i>'
+        if 'b' in style:
+            text = f'<b>{text}</b>'
+        if href.startswith(('http://', 'https://', 'mailto:')):
+            text = f'<a href="{escape(href, {chr(34): "&quot;"})}" color="blue">{text}</a>'
+        parts.append(text)
+    return ''.join(parts)
+
+
+def write_pdf(events: List[Event], path: str, title: str = '') -> None:
+    """Render a :class:`Document`'s events to a PDF at ``path``.
+
+    Module-level so it can run in a worker process. The PDF is written to
+    a ``.part`` sibling and moved into place when complete.
+    """
+    # pylint: disable=import-outside-toplevel
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.platypus import (HRFlowable, Paragraph, Preformatted, SimpleDocTemplate,
+                                    Spacer, Table, TableStyle)
+
+    styles = getSampleStyleSheet()
+    flowables: list = []
+    for block in blocks(Document(events)):
+        indent = 18 * block.quote
+        if block.kind == 'heading':
+            style = styles[f'Heading{min(block.level, 6)}']
+            flowables.append(Paragraph(_markup(block.runs), style))
+        elif block.kind == 'item':
+            style = ParagraphStyle('item', parent=styles['BodyText'],
+                                   leftIndent=indent + 18 * (block.level + 1),
+                                   bulletIndent=indent + 18 * block.level + 6)
+            flowables.append(Paragraph(_markup(block.runs), style,
+                                       bulletText=block.marker or None))
+        elif block.kind == 'pre':
+            style = ParagraphStyle('pre', parent=styles['Code'], leftIndent=indent + 6)
+            flowables.append(Preformatted(block.text, style))
+        elif block.kind == 'rule':
+            flowables.append(HRFlowable(width='100%', color=colors.grey))
+        elif block.kind == 'table':
+            width = max(len(row) for row in block.rows)
+            cell = styles['BodyText']
+            data = [[Paragraph(escape(text), cell) for text in row] + [''] * (width - len(row))
+                    for row in block.rows]
+            table = Table(data, repeatRows=1)
+            table.setStyle(TableStyle([('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                                       ('VALIGN', (0, 0), (-1, -1), 'TOP')]))
+            flowables.append(table)
+        else:
+            style = ParagraphStyle('para', parent=styles['BodyText'], leftIndent=indent)
+            flowables.append(Paragraph(_markup(block.runs), style))
+    if not flowables:
+        flowables.append(Spacer(1, 1))
+
+    # Per worker process: two pages may render to the same file name at once.
+    part = f'{path}.{os.getpid()}.part'
+    try:
+        SimpleDocTemplate(part, pagesize=A4, title=title).build(flowables)
+        os.replace(part, path)
+    except BaseException:
+        try:
+            os.unlink(part)
+        except OSError:
+            pass
+        raise
+
+
+class PdfWriter:
+    """Renders PDFs in ``workers`` processes while the caller carries on.
+
+    At most ``2 * workers`` documents wait for a worker; :meth:`submit`
+    blocks beyond that, so a slow PDF backlog cannot grow without bound.
+    Failures are counted in :attr:`failures`; reporting them is left to
+    whoever waits on the future returned by :meth:`submit`.
+    """
+
+    def __init__(self, workers: int = 1,
+                 render: Callable[[List[Event], str, str], None] = write_pdf):
+        if workers < 1:
+            raise ValueError('workers must be >= 1')
+        # Spawn rather than fork, as in the conversion pipeline: forking a
+        # process that runs fetch threads can deadlock on POSIX.
+        self._pool = ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=multiprocessing.get_context('spawn'))
+        self._render = render
+        self._slots = threading.BoundedSemaphore(2 * workers)
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failures = 0
+
+    def submit(self, doc: Document, path: Path) -> 'Future[None]':
+        """Queue ``doc`` for rendering to ``path``; the future fails if rendering does."""
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._render, doc.events, str(path), doc.title())
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future) -> None:
+        self._slots.release()
+        with self._lock:
+            if future.exception() is None:
+                self.written += 1
+            else:
+                self.failures += 1
+
+    def close(self) -> int:
+        """Wait for every queued PDF; return the number that failed."""
+        self._pool.shutdown(wait=True)
+        return self.failures
@@ -0,0 +1,320 @@
+"""Local, content-addressed copies of the images a page references (``--images``).
+
+:class:`ImageStore` finds the Markdown image links of a converted page,
+downloads the remote images concurrently over the CLI's pooled session and
+rewrites the links to the local copies. Images are processed with Pillow
+in worker processes. Anything larger than ``max_px`` on a side is
+downscaled, and JPEG/WebP are recompressed at ``quality``. A recompressed
+image larger than the original is dropped in favour of the original.
+
+Files are named after the SHA-256 of the downloaded bytes
+(``images/ab/abcdef....png``), so an image shared by many pages or URLs
+is stored once. Each image URL is also fetched only once per run: pages
+that reference a URL while it is being fetched wait for that download.
+Failures that may be temporary (429/5xx, dropped connections) and images
+over another page's budget are not remembered and are fetched again.
+
+Every response is capped like the HTML pages (``max_bytes``). Downloads
+also count against a per-page and an optional run-wide byte budget. An
+image that does not fit keeps its remote URL. Image requests go through
+the same robots.txt check, per-host limit and rate policy as page fetches
+when the caller passes ``allowed`` and ``slot``.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import multiprocessing
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, ContextManager, Dict, Optional, Tuple, Union
+from urllib.parse import urljoin, urlsplit
+
+from .retry import RETRY_STATUSES, is_transient_error
+
+# Subdirectory of --outdir holding the image store.
+IMAGE_DIR = 'images'
+DEFAULT_MAX_PX = 1600
+DEFAULT_QUALITY = 85
+DEFAULT_JOBS = 8
+DEFAULT_PAGE_BUDGET_MB = 20
+
+_IMAGE_LINK = re.compile(r'!\[([^\]]*)\]\(([^()\s]+)(\s+"[^"]*")?\)')
+# Magic numbers of the formats stored; anything else keeps its remote URL.
+_SIGNATURES = ((b'\xff\xd8\xff', 'jpg'), (b'\x89PNG\r\n\x1a\n', 'png'), (b'GIF87a', 'gif'),
+               (b'GIF89a', 'gif'))
+_PIL_FORMATS = {'jpg': 'JPEG', 'png': 'PNG', 'gif': 'GIF', 'webp': 'WEBP'}
+
+
+class BudgetExceeded(Exception):
+    """Raised when a download would go over a byte budget."""
+
+
+class ByteBudget:
+    """Thread-safe byte allowance; ``limit`` None means unlimited."""
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def take(self, size: int) -> bool:
+        """Charge ``size`` bytes; return False (charging nothing) if they do not fit."""
+        with self._lock:
+            if self.limit is not None and self.used + size > self.limit:
+                return False
+            self.used += size
+            return True
+
+    def refund(self, size: int) -> None:
+        """Give back ``size`` bytes charged by :meth:`take`."""
+        with self._lock:
+            self.used -= size
+
+    def fits(self, size: int) -> bool:
+        """Return True if ``size`` more bytes are still available."""
+        with self._lock:
+            return self.limit is None or self.used + size <= self.limit
+
+
+def image_format(data: bytes) -> Optional[str]:
+    """Return the file extension of JPEG, PNG, GIF or WebP ``data``, else None."""
+    for signature, ext in _SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def process_image(data: bytes, ext: str, max_px: int, quality: int) -> bytes:
+    """Downscale and recompress an image; return the original if that is smaller.
+
+    Module-level so it can run in a worker process. Animated images are
+    returned unchanged.
+    """
+    from PIL import Image  # pylint: disable=import-outside-toplevel
+
+    with Image.open(io.BytesIO(data)) as image:
+        if getattr(image, 'is_animated', False):
+            return data
+        resized = max(image.size) > max_px
+        if not resized and ext in ('png', 'gif'):
+            return data
+        image.load()
+        if resized:
+            image.thumbnail((max_px, max_px), Image.LANCZOS)
+        out = io.BytesIO()
+        options = {'optimize': True}
+        if ext in ('jpg', 'webp'):
+            options['quality'] = quality
+        if ext == 'jpg' and image.mode not in ('RGB', 'L', 'CMYK'):
+            image = image.convert('RGB')
+        image.save(out, _PIL_FORMATS[ext], **options)
+    processed = out.getvalue()
+    return processed if resized or len(processed) < len(data) else data
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """Return True for download errors worth another try: 429/5xx, dropped connections."""
+    response = getattr(exc, 'response', None)
+    return (is_transient_error(exc)
+            or getattr(response, 'status_code', None) in RETRY_STATUSES)
+
+
+class ImageStore:
+    """Fetches, processes and stores the images of converted pages.
+
+    ``session`` is a requests session shared with the page fetches.
+    ``jobs`` threads download images and ``workers`` processes run Pillow.
+    ``allowed(url)`` returning False (robots.txt) keeps an image remote, and
+    each download runs inside ``slot(url)`` (per-host limit and throttle).
+    """
+
+    def __init__(self, root: Path, session, max_bytes: int, page_budget: Optional[int] = None,
+                 total_budget: Optional[int] = None, max_px: int = DEFAULT_MAX_PX,
+                 quality: int = DEFAULT_QUALITY, jobs: int = DEFAULT_JOBS, workers: int = 1,
+                 allowed: Optional[Callable[[str], bool]] = None,
+                 slot: Optional[Callable[[str], ContextManager[None]]] = None):
+        if jobs < 1 or workers < 1:
+            raise ValueError('jobs and workers must be >= 1')
+        self.root = Path(root)
+        self._session = session
+        self.max_bytes = max_bytes
+        self.page_budget = page_budget
+        self.total = ByteBudget(total_budget)
+        self.max_px = max_px
+        self.quality = quality
+        self._allowed = allowed
+        self._slot = slot
+        self._fetchers = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='html2md-img')
+        # Spawn rather than fork, as in the conversion pipeline.
+        self._workers = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        self._lock = threading.Lock()
+        # URL -> stored path relative to root (None: not an image or failed for
+        # good); a Future while the download is in flight.
+        self._urls: Dict[str, Union[Optional[str], 'Future[Optional[str]]']] = {}
+        self.fetched = 0
+        self.reused = 0
+        self.stored = 0
+        self.stored_bytes = 0
+        self.skipped = 0
+        self.disallowed = 0
+        self.failed = 0
+
+    def close(self) -> None:
+        """Stop the download threads and Pillow workers."""
+        self._fetchers.shutdown(wait=True)
+        self._workers.shutdown(wait=True)
+
+    def localize(self, markdown: str, page_url: str, link_base: str = IMAGE_DIR) -> str:
+        """Return ``markdown`` with remote image links pointing at local copies.
+
+        ``link_base`` is the store's path relative to the Markdown file.
+        Images that cannot be stored keep their original link.
+        """
+        sources = {}
+        for match in _IMAGE_LINK.finditer(markdown):
+            src = match.group(2)
+            url = urljoin(page_url, src)
+            if urlsplit(url).scheme in ('http', 'https'):
+                sources[src] = url
+        if not sources:
+            return markdown
+        budget = ByteBudget(self.page_budget)
+        pending = {src: (url, *self._lookup(url, budget)) for src, url in sources.items()}
+        local = {}
+        for src, (url, found, owned) in pending.items():
+            found = self._resolve(url, budget, found, owned)
+            if found is not None:
+                local[src] = f'{link_base}/{found}'
+
+        def rewrite(match: 're.Match[str]') -> str:
+            path = local.get(match.group(2))
+            if path is None:
+                return match.group(0)
+            return f'![{match.group(1)}]({path}{match.group(3) or ""})'
+
+        return _IMAGE_LINK.sub(rewrite, markdown)
+
+    def _lookup(self, url: str, budget: ByteBudget
+                ) -> Tuple[Union[Optional[str], 'Future[Optional[str]]'], bool]:
+        """Return the stored path of ``url``, or a Future of it while it downloads.
+
+        The flag is True when the download was started here, against ``budget``.
+        """
+        with self._lock:
+            if url in self._urls:
+                self.reused += 1
+                return self._urls[url], False
+            future: 'Future[Optional[str]]' = Future()
+            self._urls[url] = future
+        self._fetchers.submit(self._fetch, url, budget, future)
+        return future, True
+
+    def _resolve(self, url: str, budget: ByteBudget,
+                 found: Union[Optional[str], 'Future[Optional[str]]'],
+                 owned: bool) -> Optional[str]:
+        """Wait for a looked-up image; None if it stays remote.
+
+        A download that went over another page's budget is tried again
+        against this page's budget.
+        """
+        while isinstance(found, Future):
+            try:
+                return found.result()
+            except BudgetExceeded:
+                if owned:
+                    return None
+            found, owned = self._lookup(url, budget)
+        return found
+
+    def _fetch(self, url: str, budget: ByteBudget, future: 'Future[Optional[str]]') -> None:
+        stored = None
+        try:
+            stored = self._download(url, budget)
+        except BudgetExceeded as e:
+            # Not remembered: a later page with budget left may fetch it.
+            with self._lock:
+                self._urls.pop(url, None)
+                self.skipped += 1
+            future.set_exception(e)
+            return
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            transient = _is_transient(e)
+            with self._lock:
+                self.failed += 1
+                if transient:
+                    # Not remembered: a later page may get a better answer.
+                    self._urls.pop(url, None)
+            if transient:
+                future.set_result(None)
+        finally:
+            if not future.done():
+                with self._lock:
+                    # Only the result is kept once the download is finished.
+                    self._urls[url] = stored
+                future.set_result(stored)
+
+    def _download(self, url: str, budget: ByteBudget) -> Optional[str]:
+        if self._allowed is not None and not self._allowed(url):
+            with self._lock:
+                self.disallowed += 1
+            return None
+        with self._slot(url) if self._slot is not None else nullcontext():
+            data = self._get(url, budget)
+        if data is None:
+            return None
+        with self._lock:
+            self.fetched += 1
+        ext = image_format(data)
+        if ext is None:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        name = f'{digest[:2]}/{digest}.{ext}'
+        path = self.root / name
+        if path.exists():
+            return name
+        processed = self._workers.submit(process_image, data, ext, self.max_px,
+                                         self.quality).result()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part = path.with_name(f'{path.name}.{threading.get_ident()}.part')
+        part.write_bytes(processed)
+        part.replace(path)
+        with self._lock:
+            self.stored += 1
+            self.stored_bytes += len(processed)
+        return name
+
+    def _get(self, url: str, budget: ByteBudget) -> Optional[bytes]:
+        """Download ``url``; None if it is over ``max_bytes``."""
+        response = self._session.get(url, timeout=30, stream=True)
+        try:
+            response.raise_for_status()
+            try:
+                length = int(response.headers.get('Content-Length', 0))
+            except (TypeError, ValueError):
+                length = 0
+            if length > self.max_bytes:
+                return None
+            if not (budget.fits(length) and self.total.fits(length)):
+                raise BudgetExceeded(url)
+            chunks = []
+            total = 0
+            for chunk in response.iter_content(chunk_size=8192):
+                total += len(chunk)
+                if total > self.max_bytes:
+                    return None
+                if not budget.take(len(chunk)):
+                    raise BudgetExceeded(url)
+                if not self.total.take(len(chunk)):
+                    budget.refund(len(chunk))
+                    raise BudgetExceeded(url)
+                chunks.append(chunk)
+        finally:
+            response.close()
+        return b''.join(chunks)
@@ -0,0 +1,315 @@
+"""Background batch jobs for the web service.
+
+A job is a list of URLs. :class:`JobStore` keeps jobs and their per-URL
+results in SQLite, so any worker process of the service can report on a
+job. :class:`JobRunner` converts the URLs on a small pool of background
+threads. The number of URLs waiting for a thread is capped, and a job that
+would exceed the cap is rejected up front with :class:`QueueFull`. One
+large client then cannot monopolise the process.
+
+Queued URLs only live in the memory of the runner that accepted the job,
+so every runner records a heartbeat in the database. A runner whose
+heartbeat has lapsed (a worker that crashed or was restarted) has its
+unfinished jobs adopted, and their pending URLs queued again, by the
+next runner that checks. Jobs older than the retention period are
+deleted together with their results.
+"""
+from __future__ import annotations
+
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+# Per-URL states; a job is finished once none of its URLs is pending.
+PENDING = 'pending'
+OK = 'ok'
+ERROR = 'error'
+
+DEFAULT_HEARTBEAT = 10.0
+# Jobs and their results are deleted this long after they were created.
+DEFAULT_RETENTION = 7 * 24 * 3600.0
+# Attempts at storing one URL's result before it is marked failed instead.
+_RECORD_ATTEMPTS = 3
+
+# (job id, URL index, URL) of a URL waiting for a runner thread.
+Task = Tuple[str, int, str]
+
+
+class QueueFull(Exception):
+    """Raised when a job does not fit in the runner's queue."""
+
+
+class JobStore:
+    """SQLite table of jobs and their per-URL results, shared by threads."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id TEXT PRIMARY KEY, created REAL NOT NULL, total INTEGER NOT NULL)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            ' job_id TEXT NOT NULL, idx INTEGER NOT NULL, url TEXT NOT NULL,'
+            ' status TEXT NOT NULL, error TEXT, markdown TEXT,'
+            ' PRIMARY KEY (job_id, idx))'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS runners (id TEXT PRIMARY KEY, seen REAL NOT NULL)'
+        )
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(jobs)')}
+        if 'owner' not in columns:
+            # Databases from before runners were tracked; their jobs have no owner.
+            self._db.execute('ALTER TABLE jobs ADD COLUMN owner TEXT')
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        with self._lock:
+            self._db.close()
+
+    def create(self, urls: Sequence[str], owner: Optional[str] = None) -> str:
+        """Store a new job for ``urls``, run by runner ``owner``, and return its id."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._db.execute('INSERT INTO jobs (id, created, total, owner) VALUES (?, ?, ?, ?)',
+                                 (job_id, time.time(), len(urls), owner))
+                self._db.executemany(
+                    'INSERT INTO results (job_id, idx, url, status) VALUES (?, ?, ?, ?)',
+                    [(job_id, idx, url, PENDING) for idx, url in enumerate(urls)],
+                )
+                self._db.execute('COMMIT')
+            except sqlite3.Error:
+                self._db.execute('ROLLBACK')
+                raise
+        return job_id
+
+    def finish(self, job_id: str, idx: int, markdown: Optional[str],
+               error: Optional[str] = None) -> None:
+        """Record the outcome of URL ``idx`` of ``job_id``."""
+        status = ERROR if error is not None else OK
+        with self._lock:
+            self._db.execute(
+                'UPDATE results SET status = ?, error = ?, markdown = ?'
+                ' WHERE job_id = ? AND idx = ?',
+                (status, error, markdown, job_id, idx),
+            )
+
+    def beat(self, runner_id: str) -> None:
+        """Record that runner ``runner_id`` is alive."""
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO runners (id, seen) VALUES (?, ?)',
+                             (runner_id, time.time()))
+
+    def adopt(self, runner_id: str, lease: float) -> List[Task]:
+        """Take over the unfinished jobs of runners not seen for ``lease`` seconds.
+
+        The jobs are reassigned to ``runner_id`` and their pending URLs
+        returned, to be queued again. Jobs without an owner are adopted too.
+        """
+        with self._lock:
+            # IMMEDIATE: runners in other processes must not adopt the same jobs.
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.execute('DELETE FROM runners WHERE seen < ? AND id != ?',
+                                 (time.time() - lease, runner_id))
+                orphans = [row[0] for row in self._db.execute(
+                    'SELECT id FROM jobs WHERE (owner IS NULL OR owner NOT IN'
+                    ' (SELECT id FROM runners)) AND EXISTS (SELECT 1 FROM results'
+                    ' WHERE job_id = jobs.id AND status = ?)', (PENDING,))]
+                tasks: List[Task] = []
+                for job_id in orphans:
+                    self._db.execute('UPDATE jobs SET owner = ? WHERE id = ?',
+                                     (runner_id, job_id))
+                    tasks.extend((job_id, idx, url) for idx, url in self._db.execute(
+                        'SELECT idx, url FROM results WHERE job_id = ? AND status = ?'
+                        ' ORDER BY idx', (job_id, PENDING)))
+                self._db.execute('COMMIT')
+            except sqlite3.Error:
+                self._db.execute('ROLLBACK')
+                raise
+        return tasks
+
+    def purge(self, created_before: float) -> int:
+        """Delete jobs created before ``created_before`` and their results; return the count."""
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._db.execute('DELETE FROM results WHERE job_id IN'
+                                 ' (SELECT id FROM jobs WHERE created < ?)', (created_before,))
+                deleted = self._db.execute('DELETE FROM jobs WHERE created < ?',
+                                           (created_before,)).rowcount
+                self._db.execute('COMMIT')
+            except sqlite3.Error:
+                self._db.execute('ROLLBACK')
+                raise
+        return deleted
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """Return progress and per-URL results of ``job_id``, or None if unknown."""
+        with self._lock:
+            job = self._db.execute('SELECT created, total FROM jobs WHERE id = ?',
+                                   (job_id,)).fetchone()
+            if job is None:
+                return None
+            rows = self._db.execute(
+                'SELECT url, status, error FROM results WHERE job_id = ? ORDER BY idx',
+                (job_id,),
+            ).fetchall()
+        results = [{'url': url, 'status': status, 'error': error}
+                   for url, status, error in rows]
+        pending = sum(1 for r in results if r['status'] == PENDING)
+        failed = sum(1 for r in results if r['status'] == ERROR)
+        total = job[1]
+        if pending == 0:
+            state = 'done'
+        elif pending == total:
+            state = 'queued'
+        else:
+            state = 'running'
+        return {
+            'id': job_id,
+            'status': state,
+            'created': job[0],
+            'total': total,
+            'completed': total - pending,
+            'failed': failed,
+            'results': results,
+        }
+
+    def outputs(self, job_id: str, batch: int = 16) -> Iterator[dict]:
+        """Yield finished results of ``job_id`` in URL order, ``batch`` rows per query.
+
+        The lock is only held while a batch is read, so a slow client
+        downloading a large job does not block the worker threads.
+        """
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    'SELECT idx, url, status, error, markdown FROM results'
+                    ' WHERE job_id = ? AND idx > ? AND status != ?'
+                    ' ORDER BY idx LIMIT ?',
+                    (job_id, last, PENDING, batch),
+                ).fetchall()
+            if not rows:
+                return
+            for idx, url, status, error, markdown in rows:
+                last = idx
+                yield {'url': url, 'status': status, 'error': error, 'markdown': markdown}
+
+
+class JobRunner:
+    """Convert job URLs on ``workers`` background threads.
+
+    ``convert(url)`` returns the Markdown for a URL; any exception it raises
+    is stored as that URL's error. At most ``max_pending`` URLs may wait for
+    a thread. Every ``heartbeat`` seconds the runner marks itself alive,
+    adopts the jobs of runners silent for three heartbeats and deletes jobs
+    older than ``retention`` seconds (None keeps them). The first round runs
+    before the constructor returns, so a restarted worker resumes the jobs
+    it was running.
+    """
+
+    def __init__(self, store: JobStore, convert: Callable[[str], str],
+                 workers: int = 2, max_pending: int = 1000,
+                 heartbeat: float = DEFAULT_HEARTBEAT,
+                 retention: Optional[float] = DEFAULT_RETENTION):
+        self.store = store
+        self.id = uuid.uuid4().hex
+        self._convert = convert
+        self.max_pending = max_pending
+        self.heartbeat = heartbeat
+        self.retention = retention
+        self._queue: "queue.Queue[Task]" = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._work, name=f'html2md-job-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        self._threads.append(threading.Thread(target=self._maintain,
+                                              name='html2md-job-heartbeat', daemon=True))
+        self._sweep()
+        for t in self._threads:
+            t.start()
+
+    @property
+    def pending(self) -> int:
+        """Number of queued URLs not yet picked up by a thread."""
+        return self._pending
+
+    def submit(self, urls: Sequence[str]) -> str:
+        """Create and queue a job; raises :class:`QueueFull` if it does not fit."""
+        with self._lock:
+            if self._pending + len(urls) > self.max_pending:
+                raise QueueFull(f'{self._pending} URLs already queued '
+                                f'(limit {self.max_pending}).')
+            self._pending += len(urls)
+        try:
+            job_id = self.store.create(urls, owner=self.id)
+        except Exception:
+            with self._lock:
+                self._pending -= len(urls)
+            raise
+        for idx, url in enumerate(urls):
+            self._queue.put((job_id, idx, url))
+        return job_id
+
+    def _maintain(self) -> None:
+        while True:
+            time.sleep(self.heartbeat)
+            self._sweep()
+
+    def _sweep(self) -> None:
+        """Heartbeat, adopt orphaned jobs and apply the retention period."""
+        try:
+            self.store.beat(self.id)
+            tasks = self.store.adopt(self.id, 3 * self.heartbeat)
+            if self.retention is not None:
+                self.store.purge(time.time() - self.retention)
+        except sqlite3.Error:
+            return  # Tried again on the next heartbeat.
+        with self._lock:
+            self._pending += len(tasks)
+        for task in tasks:
+            self._queue.put(task)
+
+    def _work(self) -> None:
+        while True:
+            job_id, idx, url = self._queue.get()
+            with self._lock:
+                self._pending -= 1
+            try:
+                markdown = self._convert(url)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self._record(job_id, idx, None, str(e) or type(e).__name__)
+            else:
+                self._record(job_id, idx, markdown)
+
+    def _record(self, job_id: str, idx: int, markdown: Optional[str],
+                error: Optional[str] = None) -> None:
+        for attempt in range(_RECORD_ATTEMPTS):
+            try:
+                self.store.finish(job_id, idx, markdown, error)
+                return
+            except sqlite3.Error as e:
+                failure = e
+                time.sleep(0.05 * 2 ** attempt)
+        try:
+            # The result cannot be stored (e.g. too large); fail the URL instead.
+            self.store.finish(job_id, idx, None, f'Could not store the result: {failure}')
+        except sqlite3.Error:
+            # Leave the URL pending rather than kill the worker thread.
+            pass
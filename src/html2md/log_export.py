@@ -2,11 +2,43 @@
 from __future__ import annotations
 
 import argparse
+import bz2
 import csv
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
 import json
+import lzma
+import mmap
+import multiprocessing
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional, TextIO
+from urllib.parse import urlsplit
+
+from .sketches import HyperLogLog, QuantileSketch
 
 _DANGEROUS_PREFIXES = ("=", "+", "-", "@")
+# Inputs with these suffixes are decompressed while they are read.
+_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+# Target shard size for --workers; small enough to keep several shards per
+# worker in flight without holding much of a multi-GB log in memory.
+_SHARD_BYTES = 32 * 1024 * 1024
+# Rows per executemany transaction in --format sqlite.
+_SQLITE_BATCH_ROWS = 50_000
+# Columns indexed by --format sqlite once the rows are loaded.
+_SQLITE_INDEXED = ('ts', 'status', 'input')
+# Unique per-record key of --format sqlite rows, so reruns skip records
+# that are already in the table.
+_SQLITE_KEY = 'record_sha256'
 
 
 def _sanitize_formula(value: str) -> str:
@@ -49,49 +81,639 @@ def _sanitize_value(value: object) -> object:
     return value
 
 
+def _sql_value(value: object) -> object:
+    """Return ``value`` as an SQLite-storable scalar; objects and lists become JSON."""
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _write_rows(lines: Iterable[str], w, input_names: list[str],
+                sanitize: Callable[[object], object] = _sanitize_value) -> None:
+    """Write one sanitized CSV row per JSON object in ``lines``."""
+    # Hoist lookups out of hot loop for faster access (LOAD_FAST vs LOAD_GLOBAL/LOAD_ATTR)
+    writerow = w.writerow
+    loads = json.loads
+
+    for line in lines:
+        # json.loads ignores whitespace; skip manual strip/empty checks
+        try:
+            rec = loads(line)
+        except json.JSONDecodeError:
+            continue
+
+        # Strict/fast dict check
+        if not isinstance(rec, dict):
+            continue
+
+        writerow([
+            sanitize(rec.get(name))
+            for name in input_names
+        ])
+
+
+def _is_compressed(path: Path) -> bool:
+    return path.suffix.lower() in _OPENERS
+
+
+def _open_text(path: Path) -> TextIO:
+    """Open a plain or compressed JSONL log as UTF-8 text with universal newlines."""
+    opener = _OPENERS.get(path.suffix.lower())
+    if opener is not None:
+        return opener(path, 'rt', encoding='utf-8')
+    return path.open('r', encoding='utf-8')
+
+
+def _expand_inputs(patterns: list[str]) -> list[Path]:
+    """Expand glob patterns (sorted, so rotated logs keep their order) into paths."""
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                raise FileNotFoundError(f'no input matches {pattern!r}')
+            paths.extend(Path(m) for m in matches)
+        else:
+            paths.append(Path(pattern))
+    return paths
+
+
+def _iter_records(lines: Iterable[str]) -> Iterator[dict]:
+    """Yield the JSON objects of ``lines``, skipping malformed and non-object lines."""
+    loads = json.loads
+    for line in lines:
+        try:
+            rec = loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(rec, dict):
+            yield rec
+
+
+def _ts_key(rec: dict) -> tuple:
+    """Order records by ``ts``: missing first, then numbers, then strings (ISO 8601)."""
+    ts = rec.get('ts')
+    if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        return (1, ts, '')
+    if isinstance(ts, str):
+        return (2, 0, ts)
+    return (0, 0, '')
+
+
+def _write_merged(inputs: list[Path], w, input_names: list[str],
+                  sanitize: Callable[[object], object] = _sanitize_value) -> None:
+    """Write the records of ``inputs`` ordered by ``ts`` with a k-way heap merge.
+
+    Each input must already be in ``ts`` order, as rotated logs are. Only
+    one record per input is held in memory; ties keep the input order.
+    """
+    writerow = w.writerow
+    with ExitStack() as stack:
+        streams = [_iter_records(stack.enter_context(_open_text(path))) for path in inputs]
+        for rec in heapq.merge(*streams, key=_ts_key):
+            writerow([
+                sanitize(rec.get(name))
+                for name in input_names
+            ])
+
+
+def _quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class _SQLiteWriter:
+    """``csv.writer``-like sink that bulk-loads rows into an SQLite table.
+
+    The table is created from ``columns`` if missing, and columns the
+    existing table lacks are added, so repeated exports append to one
+    database. Rows are inserted ``batch`` at a time with ``executemany``,
+    one transaction per batch, with WAL and ``synchronous=OFF`` during the
+    load. :meth:`close` writes the last batch, builds the ``ts``, ``status``
+    and ``input`` indexes and restores normal syncing. With ``key``, that
+    column gets a unique index and rows whose key is already stored are
+    skipped.
+    """
+
+    def __init__(self, path: Path, table: str, columns: list[str],
+                 indexed: Iterable[str] = (), batch: int = _SQLITE_BATCH_ROWS,
+                 key: Optional[str] = None):
+        self._db = sqlite3.connect(str(path), isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=OFF')
+        self._table = table
+        self._indexed = list(indexed)
+        self._batch = batch
+        self._rows: list[list] = []
+        if key is not None:
+            columns = [key] + columns
+        quoted = ', '.join(_quote_ident(c) for c in columns)
+        self._db.execute(f'CREATE TABLE IF NOT EXISTS {_quote_ident(table)} ({quoted})')
+        existing = {row[1] for row in
+                    self._db.execute(f'PRAGMA table_info({_quote_ident(table)})')}
+        for column in columns:
+            if column not in existing:
+                self._db.execute(f'ALTER TABLE {_quote_ident(table)} '
+                                 f'ADD COLUMN {_quote_ident(column)}')
+        if key is not None:
+            self._db.execute(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS {_quote_ident(f"{table}_{key}")} '
+                f'ON {_quote_ident(table)} ({_quote_ident(key)})'
+            )
+        verb = 'INSERT' if key is None else 'INSERT OR IGNORE'
+        self._insert = (f'{verb} INTO {_quote_ident(table)} ({quoted}) '
+                        f'VALUES ({", ".join("?" * len(columns))})')
+
+    def writerow(self, row: list) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self._batch:
+            self.flush()
+
+    def flush(self) -> None:
+        """Insert the pending rows in one transaction."""
+        if not self._rows:
+            return
+        self._db.execute('BEGIN')
+        try:
+            self._db.executemany(self._insert, self._rows)
+            self._db.execute('COMMIT')
+        except sqlite3.Error:
+            self._db.execute('ROLLBACK')
+            raise
+        self._rows.clear()
+
+    def close(self) -> None:
+        """Flush, index and close the database."""
+        try:
+            self.flush()
+            for column in self._indexed:
+                self._db.execute(
+                    f'CREATE INDEX IF NOT EXISTS {_quote_ident(f"{self._table}_{column}")} '
+                    f'ON {_quote_ident(self._table)} ({_quote_ident(column)})'
+                )
+            self._db.execute('PRAGMA synchronous=NORMAL')
+        finally:
+            self._db.close()
+
+
+def _export_sqlite(inputs: list[Path], out: Path, table: str,
+                   mapping: list[tuple[str, str]], merge_by_ts: bool) -> None:
+    """Append the records of ``inputs`` to ``table`` of the SQLite database ``out``.
+
+    Each row is keyed by the SHA-256 of its record, so exporting a log
+    again (e.g. after more lines were appended) only adds the new records.
+    """
+    columns = [column for _, column in mapping]
+    # Index the first column of each indexed field; duplicates repeat its values.
+    first = {}
+    for field, column in mapping:
+        first.setdefault(field, column)
+    indexed = [first[field] for field in _SQLITE_INDEXED if field in first]
+    input_names = [name for name, _ in mapping]
+    w = _SQLiteWriter(out, table, columns, indexed, key=_SQLITE_KEY)
+    try:
+        with ExitStack() as stack:
+            streams = [_iter_records(stack.enter_context(_open_text(path))) for path in inputs]
+            records = (heapq.merge(*streams, key=_ts_key) if merge_by_ts
+                       else itertools.chain.from_iterable(streams))
+            for rec in records:
+                digest = hashlib.sha256(
+                    json.dumps(rec, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+                w.writerow([digest.hexdigest()] + [_sql_value(rec.get(name))
+                                                   for name in input_names])
+    finally:
+        w.close()
+
+
+# Groups past --max-groups are counted together under this key.
+_OTHER_GROUP = '(other)'
+_PERCENTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+
+class _Group:
+    """Running totals and sketches of one group-by key."""
+
+    __slots__ = ('count', 'errors', 'latency', 'distinct')
+
+    def __init__(self, latency_fields: int, distinct: bool):
+        self.count = 0
+        self.errors = 0
+        self.latency = [QuantileSketch() for _ in range(latency_fields)]
+        self.distinct = HyperLogLog() if distinct else None
+
+
+def _group_value(rec: dict, name: str) -> str:
+    """Return the group-by value of ``name``; ``host`` falls back to the input URL's host."""
+    if name == 'host' and 'host' not in rec:
+        url = rec.get('input')
+        try:
+            return (urlsplit(url).hostname or '') if isinstance(url, str) else ''
+        except ValueError:
+            return ''
+    value = rec.get(name)
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, sort_keys=True)
+
+
+def _aggregate(records: Iterable[dict], group_by: list[str], latency_fields: list[str],
+               distinct_field: str, max_groups: int) -> Dict[tuple, _Group]:
+    """Fold ``records`` into per-group counts, error totals and sketches in one pass."""
+    groups: Dict[tuple, _Group] = {}
+    other = (_OTHER_GROUP,) * len(group_by)
+    for rec in records:
+        key = tuple(_group_value(rec, name) for name in group_by)
+        group = groups.get(key)
+        if group is None:
+            if len(groups) >= max_groups:
+                key = other
+                group = groups.get(key)
+            if group is None:
+                group = groups[key] = _Group(len(latency_fields), bool(distinct_field))
+        group.count += 1
+        if rec.get('status') not in ('ok', 'skipped'):
+            group.errors += 1
+        for sketch, name in zip(group.latency, latency_fields):
+            value = rec.get(name)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                sketch.add(value)
+        if group.distinct is not None:
+            value = rec.get(distinct_field)
+            if value is not None:
+                group.distinct.add(value if isinstance(value, str) else json.dumps(value))
+    return groups
+
+
+def _write_aggregate(fo, groups: Dict[tuple, _Group], group_by: list[str],
+                     latency_fields: list[str], distinct_field: str) -> None:
+    """Write one sanitized CSV row per group, largest groups first."""
+    header = list(group_by) + ['count', 'errors', 'error_rate']
+    for name in latency_fields:
+        header.extend(f'{name}_{label}' for label, _ in _PERCENTILES)
+    if distinct_field:
+        header.append(f'distinct_{distinct_field}')
+    fieldnames, _ = _unique_fieldnames(header)
+
+    w = csv.writer(fo)
+    w.writerow(fieldnames)
+    for key, group in sorted(groups.items(), key=lambda item: (-item[1].count, item[0])):
+        row: list = list(key) + [group.count, group.errors,
+                                 round(group.errors / group.count, 4)]
+        for sketch in group.latency:
+            for _, q in _PERCENTILES:
+                value = sketch.quantile(q)
+                row.append(None if value is None else round(value, 3))
+        if group.distinct is not None:
+            row.append(group.distinct.estimate())
+        w.writerow([_sanitize_value(value) for value in row])
+
+
+def _shard_ranges(mm, size: int, shards: int, offset: int = 0) -> list[tuple[int, int]]:
+    """Split ``mm[offset:size]`` into at most ``shards`` ranges that end on a newline."""
+    ranges = []
+    start = offset
+    for i in range(1, shards + 1):
+        if start >= size:
+            break
+        end = size if i == shards else max(offset + (size - offset) * i // shards, start)
+        if end < size:
+            nl = mm.find(b'\n', end)
+            end = size if nl == -1 else nl + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _export_shard(path: str, start: int, end: int, input_names: list[str]) -> str:
+    """Return the CSV rows for bytes ``start:end`` of ``path`` (worker entry point)."""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = mm[start:end]
+    # Decode exactly like the serial path's text-mode file (UTF-8, universal
+    # newlines) so malformed and blank lines are skipped the same way. Shards
+    # end right after b'\n', which never occurs inside a UTF-8 sequence.
+    lines = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8')
+    buf = io.StringIO(newline='')
+    _write_rows(lines, csv.writer(buf), input_names)
+    return buf.getvalue()
+
+
+def _export_parallel(inp: Path, fo, input_names: list[str], workers: int,
+                     offset: int = 0, size: Optional[int] = None) -> None:
+    """Export bytes ``offset:size`` of ``inp`` in newline-aligned shards on
+    ``workers`` processes, in order."""
+    if size is None:
+        size = inp.stat().st_size
+    if size <= offset:
+        return
+    with inp.open('rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        shards = max(workers, -(-(size - offset) // _SHARD_BYTES))
+        ranges = _shard_ranges(mm, size, shards, offset)
+
+    # Keep at most 2 * workers shards in flight so finished shards that
+    # are ahead of the writer do not pile up in memory.
+    mp_context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        pending: deque = deque()
+        todo = deque(ranges)
+        while todo or pending:
+            while todo and len(pending) < 2 * workers:
+                start, end = todo.popleft()
+                pending.append(pool.submit(_export_shard, str(inp), start, end, input_names))
+            fo.write(pending.popleft().result())
+
+
+# A line is recognised by the hash of at most its last this many bytes.
+_LAST_LINE_KEEP = 4096
+
+
+def _last_line_hash(f, offset: int) -> str:
+    """Hash the line of binary file ``f`` that ends just before ``offset``."""
+    start = max(0, offset - _LAST_LINE_KEEP - 1)
+    f.seek(start)
+    chunk = f.read(offset - start)
+    line = chunk[chunk.rfind(b'\n', 0, len(chunk) - 1) + 1:][-_LAST_LINE_KEEP:]
+    return hashlib.sha256(line).hexdigest()
+
+
+class CheckpointError(ValueError):
+    """The checkpoint file cannot be used for this export."""
+
+
+class _Checkpoint:
+    """Where an incremental export stopped, saved as JSON.
+
+    ``offset`` is the byte offset just past the last exported line of the
+    log. The log's inode and size and a hash of that last line tell whether
+    the file at the path is still the one the offset refers to.
+    ``csv_size`` lets a resumed run cut off rows written after the
+    checkpoint was saved, so an interrupted run never duplicates rows.
+    """
+
+    def __init__(self, path: Path, fields: list[str]):
+        self.path = path
+        self.fields = fields
+        self.offset = 0
+        self.inode = 0
+        self.size = 0
+        self.last_line_sha256 = ''
+        self.csv_size = 0
+
+    @classmethod
+    def load(cls, path: Path, fields: list[str]) -> Optional['_Checkpoint']:
+        """Return the checkpoint saved at ``path``, or None when there is none."""
+        try:
+            state = json.loads(path.read_text(encoding='utf-8'))
+            ckpt = cls(path, state['fields'])
+            for name in ('offset', 'inode', 'size', 'last_line_sha256', 'csv_size'):
+                setattr(ckpt, name, state[name])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            raise CheckpointError(f'unreadable checkpoint {path}: {e}') from e
+        if ckpt.fields != fields:
+            raise CheckpointError(f'checkpoint {path} was written for --fields '
+                                  f'{",".join(ckpt.fields)}; remove it to change fields')
+        return ckpt
+
+    def save(self) -> None:
+        """Atomically write the checkpoint."""
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps({
+            'fields': self.fields,
+            'offset': self.offset,
+            'inode': self.inode,
+            'size': self.size,
+            'last_line_sha256': self.last_line_sha256,
+            'csv_size': self.csv_size,
+        }), encoding='utf-8')
+        os.replace(str(tmp), str(self.path))
+
+    def matches(self, f) -> bool:
+        """Whether open log ``f`` still holds the exported bytes before ``offset``."""
+        st = os.fstat(f.fileno())
+        if self.inode and st.st_ino and st.st_ino != self.inode:
+            return False  # rotated: another file now lives at the path
+        if st.st_size < self.offset:
+            return False  # truncated
+        return self.offset == 0 or _last_line_hash(f, self.offset) == self.last_line_sha256
+
+    def advance(self, f, offset: int, fo) -> None:
+        """Record that ``f`` is exported up to ``offset`` and flush ``fo`` first."""
+        fo.flush()
+        st = os.fstat(f.fileno())
+        self.offset = offset
+        self.inode = st.st_ino
+        self.size = st.st_size
+        self.last_line_sha256 = _last_line_hash(f, offset) if offset else ''
+        self.csv_size = os.fstat(fo.fileno()).st_size
+        self.save()
+
+
+def _export_new_lines(f, offset: int, w, input_names: list[str]) -> int:
+    """Export the complete lines of ``f`` after ``offset``; return the new offset.
+
+    A partially written last line is left for the next run.
+    """
+    f.seek(offset)
+    tail = b''
+    while True:
+        data = f.read(_SHARD_BYTES)
+        if not data:
+            return offset
+        data = tail + data
+        cut = data.rfind(b'\n') + 1
+        if cut:
+            _write_rows(io.TextIOWrapper(io.BytesIO(data[:cut]), encoding='utf-8'),
+                        w, input_names)
+            offset += cut
+        tail = data[cut:]
+
+
+def _complete_lines_end(f, offset: int) -> int:
+    """Return the offset just past the last newline of ``f`` after ``offset``."""
+    size = os.fstat(f.fileno()).st_size
+    if size <= offset:
+        return offset
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return max(offset, mm.rfind(b'\n', offset, size) + 1)
+
+
+def _export_incremental(args, inp: Path, out: Path, fields: list[str],
+                        fieldnames: list[str], input_names: list[str],
+                        should_stop: Callable[[], bool] = lambda: False) -> int:
+    """Append rows for lines added since the checkpoint; with --follow, keep tailing."""
+    ckpt_path = (Path(args.checkpoint) if args.checkpoint
+                 else out.with_name(out.name + '.checkpoint.json'))
+    ckpt = _Checkpoint.load(ckpt_path, fields)
+    f = inp.open('rb')
+    try:
+        if ckpt is not None and out.exists() and out.stat().st_size >= ckpt.csv_size:
+            if not ckpt.matches(f):
+                # Rotated or truncated: rows exported so far stay and the
+                # file now at the path is exported from its start.
+                ckpt.offset = 0
+            # Drop rows an interrupted run wrote after the checkpoint.
+            with out.open('r+b') as fb:
+                fb.truncate(ckpt.csv_size)
+            fo = out.open('a', newline='', encoding='utf-8')
+        else:
+            ckpt = _Checkpoint(ckpt_path, fields)
+            fo = out.open('w', newline='', encoding='utf-8')
+            csv.writer(fo).writerow(fieldnames)
+        with fo:
+            w = csv.writer(fo)
+
+            def export_available() -> None:
+                if args.workers > 1:
+                    end = _complete_lines_end(f, ckpt.offset)
+                    _export_parallel(inp, fo, input_names, args.workers, ckpt.offset, end)
+                else:
+                    end = _export_new_lines(f, ckpt.offset, w, input_names)
+                # Rows are flushed and the checkpoint saved once per batch.
+                if end != ckpt.offset or not ckpt.inode:
+                    ckpt.advance(f, end, fo)
+
+            export_available()
+            while args.follow and not should_stop():
+                time.sleep(args.poll)
+                export_available()
+                try:
+                    st = inp.stat()
+                except FileNotFoundError:
+                    continue  # rotated away; wait for the new file
+                if st.st_ino != os.fstat(f.fileno()).st_ino or st.st_size < ckpt.offset:
+                    # The old file was drained above; start on the new one.
+                    f.close()
+                    f = inp.open('rb')
+                    ckpt.offset = 0
+                    export_available()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        f.close()
+    return 0
+
+
 def main(argv=None):
     """Run the log export CLI."""
     ap = argparse.ArgumentParser(
-        prog='html2md-log-export', description='Export html2md JSONL logs to CSV'
+        prog='html2md-log-export', description='Export html2md JSONL logs to CSV or SQLite'
     )
-    ap.add_argument('--in', dest='inp', required=True)
+    ap.add_argument('--in', dest='inp', nargs='+', action='extend', required=True,
+                    metavar='PATH',
+                    help='JSONL log(s) to export: files or glob patterns, exported in order; '
+                         '.gz, .bz2 and .xz files are decompressed while reading')
     ap.add_argument('--out', dest='out', required=True)
     ap.add_argument('--fields', default='ts,input,output,status,reason')
+    ap.add_argument('--format', choices=('csv', 'sqlite'), default='csv',
+                    help='csv writes --out; sqlite appends to the table --table of the '
+                         'SQLite database --out, indexed on ts, status and input; records '
+                         'already in the table are skipped, so reruns only add new lines '
+                         '(default: csv)')
+    ap.add_argument('--table', default='runs',
+                    help='Table for --format sqlite (default: runs)')
+    ap.add_argument('--merge-by-ts', action='store_true',
+                    help='Interleave several inputs in ts order with a k-way merge (each '
+                         'input must already be ordered by ts)')
+    ap.add_argument('--group-by', metavar='FIELDS',
+                    help='Write one summary row per distinct combination of these fields '
+                         '(e.g. status,reason,host; "host" defaults to the input URL host) '
+                         'instead of one row per record; --fields is ignored')
+    ap.add_argument('--latency-fields', default='fetch_ms,convert_ms', metavar='FIELDS',
+                    help='Numeric fields summarized as p50/p95/p99 with --group-by '
+                         '(default: fetch_ms,convert_ms)')
+    ap.add_argument('--distinct-field', default='input', metavar='FIELD',
+                    help='Field whose distinct values are estimated per group with '
+                         '--group-by; empty to skip (default: input)')
+    ap.add_argument('--max-groups', type=int, default=10000,
+                    help='With --group-by, fold groups beyond this many into "(other)" '
+                         '(default: 10000)')
+    ap.add_argument('--workers', type=int, default=1,
+                    help='Parse newline-aligned shards of the memory-mapped input in N '
+                         'processes; output is identical to the serial export (default: 1)')
+    ap.add_argument('--since-checkpoint', action='store_true',
+                    help='Export only lines added since the last checkpoint, appending to '
+                         '--out; the first run exports everything and saves the checkpoint')
+    ap.add_argument('--follow', action='store_true',
+                    help='Like --since-checkpoint, then keep tailing the log, appending rows '
+                         'in batches; handles rotation and truncation (Ctrl+C to stop)')
+    ap.add_argument('--checkpoint', metavar='FILE',
+                    help='Checkpoint file (default: OUT.checkpoint.json)')
+    ap.add_argument('--poll', type=float, default=1.0,
+                    help='Seconds between checks for new lines with --follow (default: 1.0)')
     args = ap.parse_args(argv)
 
+    if args.workers < 1:
+        ap.error('--workers must be at least 1')
+    if args.follow and args.workers > 1:
+        ap.error('--follow cannot be combined with --workers')
+
+    try:
+        inputs = _expand_inputs(args.inp)
+    except FileNotFoundError as e:
+        ap.error(str(e))
+    compressed = any(_is_compressed(path) for path in inputs)
+    if args.since_checkpoint or args.follow:
+        if len(inputs) != 1 or compressed:
+            ap.error('--since-checkpoint and --follow need a single uncompressed input')
+    if args.group_by and (args.workers > 1 or args.since_checkpoint or args.follow):
+        ap.error('--group-by cannot be combined with --workers, --since-checkpoint or --follow')
+    if args.format == 'sqlite' and (args.group_by or args.workers > 1
+                                    or args.since_checkpoint or args.follow):
+        ap.error('--format sqlite cannot be combined with --group-by, --workers, '
+                 '--since-checkpoint or --follow')
+    if args.max_groups < 1:
+        ap.error('--max-groups must be at least 1')
+    if args.workers > 1 and (compressed or args.merge_by_ts):
+        ap.error('--workers needs uncompressed inputs and cannot be combined with --merge-by-ts')
+
     fields = [f.strip() for f in args.fields.split(',') if f.strip()]
     fieldnames, mapping = _unique_fieldnames(fields)
 
-    inp = Path(args.inp)
     out = Path(args.out)
-    with inp.open('r', encoding='utf-8') as fi, out.open('w', newline='', encoding='utf-8') as fo:
-        # Optimization: Use csv.writer instead of DictWriter to avoid per-row dictionary overhead
-        w = csv.writer(fo)
-        w.writerow(fieldnames)
-
-        # Hoist lookups out of hot loop for faster access (LOAD_FAST vs LOAD_GLOBAL/LOAD_ATTR)
-        sanitize = _sanitize_value
-        writerow = w.writerow
-        loads = json.loads
+    # Pre-extract names to avoid tuple unpacking in loop comprehension
+    input_names = [name for name, _ in mapping]
 
-        # Pre-extract names to avoid tuple unpacking in loop comprehension
-        input_names = [name for name, _ in mapping]
+    if args.since_checkpoint or args.follow:
+        try:
+            return _export_incremental(args, inputs[0], out, fields, fieldnames, input_names)
+        except CheckpointError as e:
+            ap.error(str(e))
 
-        for line in fi:
-            # json.loads ignores whitespace; skip manual strip/empty checks
-            try:
-                rec = loads(line)
-            except json.JSONDecodeError:
-                continue
+    if args.format == 'sqlite':
+        try:
+            _export_sqlite(inputs, out, args.table, mapping, args.merge_by_ts)
+        except sqlite3.Error as e:
+            ap.error(f'cannot write {out}: {e}')
+        return 0
 
-            # Strict/fast dict check
-            if not isinstance(rec, dict):
-                continue
+    if args.group_by:
+        group_by = [f.strip() for f in args.group_by.split(',') if f.strip()]
+        latency_fields = [f.strip() for f in args.latency_fields.split(',') if f.strip()]
+        distinct_field = args.distinct_field.strip()
+        with ExitStack() as stack:
+            records = (rec for inp in inputs
+                       for rec in _iter_records(stack.enter_context(_open_text(inp))))
+            groups = _aggregate(records, group_by, latency_fields, distinct_field,
+                                args.max_groups)
+        with out.open('w', newline='', encoding='utf-8') as fo:
+            _write_aggregate(fo, groups, group_by, latency_fields, distinct_field)
+        return 0
 
-            writerow([
-                sanitize(rec.get(name, ""))
-                for name in input_names
-            ])
+    with out.open('w', newline='', encoding='utf-8') as fo:
+        # Optimization: Use csv.writer instead of DictWriter to avoid per-row dictionary overhead
+        w = csv.writer(fo)
+        w.writerow(fieldnames)
+        if args.merge_by_ts:
+            _write_merged(inputs, w, input_names)
+        elif args.workers > 1:
+            for inp in inputs:
+                _export_parallel(inp, fo, input_names, args.workers)
+        else:
+            for inp in inputs:
+                with _open_text(inp) as fi:
+                    _write_rows(fi, w, input_names)
 
     return 0
 
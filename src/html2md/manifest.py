@@ -0,0 +1,86 @@
+"""Persistent progress manifest for resumable batch runs (``--resume``).
+
+Every finished URL is recorded in a SQLite file together with its status,
+output path, output size and SHA-256. A run with ``--resume`` skips URLs the
+manifest lists as done before they are fetched. Only failed URLs and URLs
+never reached are processed again. Outputs are moved into place before
+their manifest row is written, and WAL journaling keeps the table intact
+when the process is killed. So an entry marked done always has a complete
+file behind it; a URL interrupted mid-write is simply done again.
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+# File name of the manifest inside --outdir unless --manifest is given.
+DEFAULT_NAME = '.html2md-manifest.sqlite3'
+# Statuses that --resume does not process again.
+DONE = ('ok', 'skipped')
+
+
+class Manifest:
+    """SQLite table of per-URL outcomes, shared by the batch worker threads."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS urls ('
+            ' url TEXT PRIMARY KEY, status TEXT NOT NULL, output TEXT,'
+            ' bytes INTEGER, sha256 TEXT, reason TEXT, updated REAL NOT NULL)'
+        )
+        self.resumed = 0
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        with self._lock:
+            self._db.close()
+
+    def is_done(self, url: str) -> bool:
+        """Return True if ``url`` finished in an earlier run and its output is intact.
+
+        A file output counts only while it still exists with the recorded
+        size, so deleted or truncated files are produced again. Shard outputs
+        (recorded without a size) only need to exist: a shard that was never
+        finished is still a ``.part`` file, so its URLs are done again.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT status, output, bytes FROM urls WHERE url = ?',
+                                   (url,)).fetchone()
+        if row is None or row[0] not in DONE:
+            return False
+        status, output, size = row
+        if status == 'ok' and output and output != '<stdout>':
+            try:
+                actual = Path(output).stat().st_size
+            except OSError:
+                return False
+            if size is not None and actual != size:
+                return False
+        return True
+
+    def pending(self, url: str) -> bool:
+        """Filter for the batch: False (and counted) for URLs that are already done."""
+        if self.is_done(url):
+            self.resumed += 1
+            return False
+        return True
+
+    def record(self, url: str, status: str, output: str = '', size: Optional[int] = None,
+               sha256: str = '', reason: str = '') -> None:
+        """Store the outcome of ``url``, replacing any earlier one."""
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO urls (url, status, output, bytes, sha256, reason, updated)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, status, output, size, sha256, reason, time.time()),
+            )
@@ -0,0 +1,325 @@
+"""Counters, gauges and latency histograms for the service and ``--stats``.
+
+:class:`Registry` holds the values of one process. The web service renders
+them in the Prometheus text format on ``/metrics``. The CLI prints a summary
+of the same metrics at the end of a run.
+
+Under gunicorn, every worker process has its own registry. If
+``HTML2MD_METRICS_DIR`` is set, each worker writes a JSON snapshot of its
+registry to that directory about once a second, and ``/metrics`` adds up all
+snapshots. Counters and histograms of workers that have exited keep counting,
+as Prometheus expects of counters. Gauges of workers that stopped writing
+are dropped. Empty the directory when the service is (re)deployed.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Latency histogram bucket upper bounds in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+
+# name -> (type, help); rendering follows this order.
+METRICS: Dict[str, Tuple[str, str]] = {
+    'html2md_requests_total': ('counter', 'HTTP requests handled, by endpoint and status code.'),
+    'html2md_urls_total': ('counter', 'URLs processed by the CLI, by outcome.'),
+    'html2md_fetch_seconds': ('histogram', 'Time to download a page.'),
+    'html2md_convert_seconds': ('histogram', 'Time to convert a page to Markdown.'),
+    'html2md_request_seconds': ('histogram', 'Total time per HTTP request or CLI URL.'),
+    'html2md_bytes_in_total': ('counter', 'HTML bytes downloaded or posted.'),
+    'html2md_bytes_out_total': ('counter', 'Markdown bytes produced.'),
+    'html2md_size_limit_rejections_total': ('counter', 'Inputs rejected by the 10 MB size limit.'),
+    'html2md_fetch_retries_total': ('counter', 'Fetches retried after a transient failure.'),
+    'html2md_cache_hits_total': ('counter', 'Pages answered from a cache, by cache.'),
+    'html2md_conversions_in_flight': ('gauge', 'Conversions currently running.'),
+    'html2md_http_pool_connections_opened': ('gauge', 'Upstream connections opened by the pool.'),
+    'html2md_http_pool_requests': ('gauge', 'Upstream requests sent through the pool.'),
+    'html2md_http_pool_idle_connections': ('gauge', 'Open upstream connections waiting for reuse.'),
+}
+
+# Snapshots not rewritten for this long belong to a dead worker.
+STALE_AFTER = 30.0
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Registry:
+    """Thread-safe metric values of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scalars: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {}
+        self._pid = None
+        self._snapshot_path: Optional[Path] = None
+        self._collectors = []
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Add ``value`` to a counter or gauge."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._scalars.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Set a gauge."""
+        with self._lock:
+            self._scalars.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        """Record one observation in a histogram."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts = self._histograms.setdefault(name, {}).get(key)
+            if counts is None:
+                counts = self._histograms[name][key] = [0.0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += seconds
+            counts[-1] += 1
+
+    def value(self, name: str, **labels: str) -> float:
+        """Return a counter or gauge; without labels, the sum over all series."""
+        with self._lock:
+            series = self._scalars.get(name, {})
+            if labels:
+                return series.get(tuple(sorted(labels.items())), 0)
+            return sum(series.values())
+
+    def add_collector(self, collect) -> None:
+        """Call ``collect(registry)`` before every snapshot to refresh gauges."""
+        self._collectors.append(collect)
+
+    def snapshot(self) -> dict:
+        """Return the current values as a JSON-serializable dict."""
+        for collect in self._collectors:
+            collect(self)
+        with self._lock:
+            return {
+                'time': time.time(),
+                'scalars': {name: [[list(map(list, key)), value] for key, value in series.items()]
+                            for name, series in self._scalars.items()},
+                'histograms': {name: [[list(map(list, key)), list(counts)]
+                                      for key, counts in series.items()]
+                               for name, series in self._histograms.items()},
+            }
+
+    def quantile(self, name: str, q: float) -> Optional[float]:
+        """Estimate the ``q`` quantile of a histogram over all its series.
+
+        Interpolates linearly inside the bucket, like PromQL's
+        ``histogram_quantile``. Returns None without observations.
+        """
+        with self._lock:
+            merged = [0.0] * (len(BUCKETS) + 2)
+            for counts in self._histograms.get(name, {}).values():
+                merged = [a + b for a, b in zip(merged, counts)]
+        total = merged[-1]
+        if not total:
+            return None
+        rank = q * total
+        seen = 0.0
+        lower = 0.0
+        for bound, count in zip(BUCKETS, merged):
+            if count and seen + count >= rank:
+                if math.isinf(bound):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound if not math.isinf(bound) else lower
+        return lower
+
+    def share(self, directory: Path, interval: float = 1.0) -> None:
+        """Write snapshots to ``directory`` every ``interval`` seconds.
+
+        Safe to call on every request: the writer thread is started once per
+        process, including in workers forked after the call.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            path = Path(directory) / f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+            self._snapshot_path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        def flush_forever():
+            while True:
+                write_snapshot(self.snapshot(), path)
+                time.sleep(interval)
+
+        threading.Thread(target=flush_forever, name='html2md-metrics', daemon=True).start()
+
+    @property
+    def snapshot_path(self) -> Optional[Path]:
+        """File this process writes its snapshots to, if sharing."""
+        return self._snapshot_path if self._pid == os.getpid() else None
+
+
+def write_snapshot(snapshot: dict, path: Path) -> None:
+    """Atomically replace ``path`` with ``snapshot``."""
+    tmp = path.with_name(path.name + '.tmp')
+    try:
+        tmp.write_text(json.dumps(snapshot), encoding='utf-8')
+        os.replace(str(tmp), str(path))
+    except OSError:
+        # Metrics must never take the service down; the next flush retries.
+        pass
+
+
+def collect(registry: Registry) -> dict:
+    """Merge ``registry`` with every other process's snapshot in its shared directory."""
+    own = registry.snapshot()
+    own_path = registry.snapshot_path
+    snapshots = [own]
+    if own_path is not None:
+        now = time.time()
+        for path in own_path.parent.glob('metrics-*.json'):
+            if path == own_path:
+                continue
+            try:
+                snapshot = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            if now - snapshot.get('time', 0) > STALE_AFTER:
+                snapshot['scalars'] = {name: series
+                                       for name, series in snapshot['scalars'].items()
+                                       if METRICS.get(name, ('',))[0] != 'gauge'}
+            snapshots.append(snapshot)
+
+    scalars: Dict[str, Dict[Labels, float]] = {}
+    histograms: Dict[str, Dict[Labels, List[float]]] = {}
+    for snapshot in snapshots:
+        for name, series in snapshot.get('scalars', {}).items():
+            merged = scalars.setdefault(name, {})
+            for labels, value in series:
+                key = tuple(tuple(pair) for pair in labels)
+                merged[key] = merged.get(key, 0) + value
+        for name, series in snapshot.get('histograms', {}).items():
+            merged_h = histograms.setdefault(name, {})
+            for labels, counts in series:
+                key = tuple(tuple(pair) for pair in labels)
+                prev = merged_h.get(key)
+                merged_h[key] = counts if prev is None else [a + b for a, b in zip(prev, counts)]
+    return {'scalars': scalars, 'histograms': histograms}
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(key: Labels, extra: str = '') -> str:
+    parts = [f'{k}="{_escape(str(v))}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(collected: dict) -> str:
+    """Render merged values in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            for key, counts in sorted(collected['histograms'].get(name, {}).items()):
+                cumulative = 0.0
+                for bound, count in zip(BUCKETS, counts):
+                    cumulative += count
+                    le = 'le="%s"' % _number(bound)
+                    lines.append(f'{name}_bucket{_labels(key, le)} {_number(cumulative)}')
+                lines.append(f'{name}_sum{_labels(key)} {_number(counts[-2])}')
+                lines.append(f'{name}_count{_labels(key)} {_number(counts[-1])}')
+        else:
+            for key, value in sorted(collected['scalars'].get(name, {}).items()):
+                lines.append(f'{name}{_labels(key)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def pool_collector(session):
+    """Return a collector publishing connection-pool usage of a requests session."""
+    def collect(registry: Registry) -> None:
+        opened = requests = idle = 0
+        for adapter in list(session.adapters.values()):
+            manager = getattr(adapter, 'poolmanager', None)
+            if manager is None:
+                continue
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                opened += pool.num_connections
+                requests += pool.num_requests
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        registry.set('html2md_http_pool_connections_opened', opened)
+        registry.set('html2md_http_pool_requests', requests)
+        registry.set('html2md_http_pool_idle_connections', idle)
+    return collect
+
+
+def observe_record(registry: Registry, record) -> None:
+    """Count one finished CLI URL (a :class:`~html2md.runlog.RunRecord`)."""
+    registry.inc('html2md_urls_total', status=record.status or 'error')
+    registry.inc('html2md_bytes_in_total', record.bytes)
+    registry.inc('html2md_bytes_out_total', record.bytes_out)
+    if record.size_limited:
+        registry.inc('html2md_size_limit_rejections_total')
+    if record.retries:
+        registry.inc('html2md_fetch_retries_total', record.retries)
+    if record.reason == 'not modified':
+        registry.inc('html2md_cache_hits_total', cache='http')
+    elif record.reason == 'identical content cached':
+        registry.inc('html2md_cache_hits_total', cache='content')
+    if record.http_status is not None:
+        registry.observe('html2md_fetch_seconds', record.seconds['fetch'])
+    if record.seconds['convert']:
+        registry.observe('html2md_convert_seconds', record.seconds['convert'])
+    registry.observe('html2md_request_seconds', sum(record.seconds.values()))
+
+
+def _ms(seconds: Optional[float]) -> str:
+    return '-' if seconds is None else f'{seconds * 1000:.1f} ms'
+
+
+def summary(registry: Registry) -> str:
+    """Return the human-readable ``--stats`` summary of a CLI run."""
+    registry.snapshot()  # refresh collected gauges
+    ok = registry.value('html2md_urls_total', status='ok')
+    skipped = registry.value('html2md_urls_total', status='skipped')
+    total = registry.value('html2md_urls_total')
+    counts = f'{int(ok)} ok, {int(total - ok - skipped)} failed'
+    if skipped:
+        counts += f', {int(skipped)} skipped'
+    lines = [
+        f'Stats: {int(total)} URLs ({counts}), '
+        f'{int(registry.value("html2md_bytes_in_total"))} bytes in, '
+        f'{int(registry.value("html2md_bytes_out_total"))} bytes out, '
+        f'{int(registry.value("html2md_size_limit_rejections_total"))} size-limit rejections, '
+        f'{int(registry.value("html2md_fetch_retries_total"))} retries',
+    ]
+    for label, name in (('fetch', 'html2md_fetch_seconds'),
+                        ('convert', 'html2md_convert_seconds'),
+                        ('total', 'html2md_request_seconds')):
+        lines.append(f'  {label:<8} p50 {_ms(registry.quantile(name, 0.5))}  '
+                     f'p95 {_ms(registry.quantile(name, 0.95))}  '
+                     f'p99 {_ms(registry.quantile(name, 0.99))}')
+    lines.append(f'  HTTP pool: {int(registry.value("html2md_http_pool_connections_opened"))} '
+                 f'connections opened for '
+                 f'{int(registry.value("html2md_http_pool_requests"))} requests')
+    lines.append(f'  Cache hits: http {int(registry.value("html2md_cache_hits_total", cache="http"))}, '
+                 f'content {int(registry.value("html2md_cache_hits_total", cache="content"))}')
+    return '\n'.join(lines)
@@ -0,0 +1,258 @@
+"""Staged fetch → convert → write pipeline for large batches.
+
+Fetching is I/O bound and runs on a thread pool; markdownify conversion is
+CPU bound and holds the GIL, so it runs in a process pool; results are
+written by a single writer thread so output files and progress lines are
+never touched concurrently. Every hand-off between stages is bounded, so a
+slow stage pushes back on the one feeding it instead of buffering pages in
+memory. A fetch stage that raises :class:`~html2md.batch.RetryLater` hands
+its URL back: the URL is re-queued once the delay has passed, so a backoff
+never holds a fetch thread.
+"""
+from __future__ import annotations
+
+import heapq
+import io
+import itertools
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Iterable, List, NamedTuple, Optional, TextIO, Tuple
+
+from .batch import RetryLater, Resume
+from .convert import init_worker
+from .runlog import RunRecord
+
+
+class Page(NamedTuple):
+    """A fetched page handed from the fetch stage to the later stages."""
+
+    url: str
+    html: Optional[str]
+    # Set when conversion can be skipped, e.g. a 304 answered from cache.
+    markdown: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # Content-addressed conversion cache key of the downloaded bytes.
+    content_key: Optional[str] = None
+    # True when the body was converted and written while downloading.
+    streamed: bool = False
+    # True when robots rules excluded the page; nothing is converted or written.
+    skipped: bool = False
+    # True when robots rules say nofollow; links are written as plain text.
+    nofollow: bool = False
+    # URL the response came from after redirects, when it differs from ``url``.
+    final_url: Optional[str] = None
+    # Outcome and stage timings for --log.
+    record: Optional[RunRecord] = None
+
+
+# fetch(url, out, err) -> Page, or None when the URL failed; may raise RetryLater.
+FetchStage = Callable[[str, TextIO, TextIO], Optional[Page]]
+# convert(html) -> markdown; must be picklable (a module-level function).
+ConvertStage = Callable[[str], str]
+# write(page, markdown, out, err) -> exit code.
+WriteStage = Callable[[Page, str, TextIO, TextIO], int]
+# done(page, exit_code), called by the writer once a fetched page is finished.
+DoneHook = Callable[[Page, int], None]
+
+_STOP = object()
+
+
+class _Item:
+    """One URL travelling through the pipeline with its buffered output."""
+
+    __slots__ = ('url', 'page', 'out', 'err', 'future', 'resume')
+
+    def __init__(self, url: str):
+        self.url = url
+        # Set while the URL waits out a RetryLater delay.
+        self.resume: Optional[Resume] = None
+        self.page: Optional[Page] = None
+        self.out = io.StringIO()
+        self.err = io.StringIO()
+        self.future: Optional[Future] = None
+
+
+def run_pipeline(
+    urls: Iterable[str],
+    fetch: FetchStage,
+    convert: ConvertStage,
+    write: WriteStage,
+    *,
+    jobs: int,
+    convert_workers: int,
+    queue_size: Optional[int] = None,
+    initializer: Callable[[], None] = init_worker,
+    done: Optional[DoneHook] = None,
+) -> int:
+    """Run ``urls`` through the three stages and OR the per-URL exit codes.
+
+    ``jobs`` fetch threads pull from a queue of at most ``queue_size`` URLs
+    (default ``2 * jobs``). At most ``2 * convert_workers`` pages are held
+    between fetch and write, whether converting or waiting for the writer.
+    ``initializer`` runs once in each conversion process to import the
+    converter up front. ``done`` is called with every page that was
+    fetched, after its write (or its failed conversion), e.g. to log it.
+    URLs whose fetch raised ``RetryLater`` wait in a heap and are put back
+    on the fetch queue by a scheduler thread once they are due.
+    """
+    url_q: "queue.Queue[object]" = queue.Queue(maxsize=queue_size or 2 * jobs)
+    write_q: "queue.Queue[object]" = queue.Queue()
+    slots = threading.BoundedSemaphore(2 * convert_workers)
+    exit_code = 0
+    # URLs queued or deferred whose fetch has not finished, and the deferred
+    # ones as (ready_at, seq, item); both guarded by ``pending``.
+    pending = threading.Condition()
+    unfetched = 0
+    deferred: List[Tuple[float, int, _Item]] = []
+    seq = itertools.count()
+    stopping = False
+
+    def fetcher(pool: ProcessPoolExecutor) -> None:
+        nonlocal unfetched
+        while True:
+            entry = url_q.get()
+            if entry is _STOP:
+                return
+            item = entry if isinstance(entry, _Item) else _Item(entry)  # type: ignore[arg-type]
+            try:
+                if item.resume is not None:
+                    fetched = item.resume(item.out, item.err)
+                else:
+                    fetched = fetch(item.url, item.out, item.err)
+            except RetryLater as later:
+                item.resume = later.resume
+                with pending:
+                    heapq.heappush(deferred, (time.monotonic() + later.delay, next(seq), item))
+                    pending.notify_all()
+                continue
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"Error processing {item.url}: {e}", file=item.err)
+                fetched = None
+            with pending:
+                unfetched -= 1
+                pending.notify_all()
+            slots.acquire()
+            item.page = fetched
+            if fetched is None or fetched.markdown is not None or fetched.skipped:
+                write_q.put(item)
+                continue
+            print("Converting to Markdown...", file=item.out)
+            try:
+                item.future = pool.submit(_timed_convert, convert, fetched.html)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"Conversion failed: {e}", file=item.err)
+                if fetched.record is not None:
+                    fetched.record.fail(f"Conversion failed: {e}")
+                write_q.put(item)
+                continue
+            item.future.add_done_callback(lambda _f, it=item: write_q.put(it))
+
+    def scheduler() -> None:
+        while True:
+            with pending:
+                while not stopping and (not deferred
+                                        or deferred[0][0] > time.monotonic()):
+                    pending.wait(deferred[0][0] - time.monotonic() if deferred else None)
+                if stopping:
+                    return
+                item = heapq.heappop(deferred)[2]
+            url_q.put(item)
+
+    def writer() -> None:
+        nonlocal exit_code
+        while True:
+            item = write_q.get()
+            if item is _STOP:
+                return
+            try:
+                exit_code |= _finish(item, write, done)  # type: ignore[arg-type]
+            finally:
+                slots.release()
+
+    # Spawn (the only start method on Windows) rather than fork: forking a
+    # process that already runs fetch threads can deadlock on POSIX.
+    mp_context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=convert_workers, mp_context=mp_context,
+                             initializer=initializer) as pool:
+        writer_thread = threading.Thread(target=writer, name='html2md-writer', daemon=True)
+        writer_thread.start()
+        fetchers: List[threading.Thread] = [
+            threading.Thread(target=fetcher, args=(pool,), name=f'html2md-fetch-{i}', daemon=True)
+            for i in range(jobs)
+        ]
+        for t in fetchers:
+            t.start()
+        scheduler_thread = threading.Thread(target=scheduler, name='html2md-retry',
+                                            daemon=True)
+        scheduler_thread.start()
+        try:
+            for url in urls:
+                with pending:
+                    unfetched += 1
+                url_q.put(url)
+        finally:
+            # Deferred URLs come back to the fetchers, so wait for them all.
+            with pending:
+                while unfetched:
+                    pending.wait()
+                stopping = True
+                pending.notify_all()
+            scheduler_thread.join()
+            for _ in fetchers:
+                url_q.put(_STOP)
+            for t in fetchers:
+                t.join()
+    # Leaving the executor waits for every conversion, and with it every
+    # done-callback, so all items are queued before the writer is stopped.
+    write_q.put(_STOP)
+    writer_thread.join()
+    return exit_code
+
+
+def _timed_convert(convert: ConvertStage, html: str) -> Tuple[str, float]:
+    """Run ``convert`` in a worker and return its result and duration in seconds."""
+    start = time.perf_counter()
+    md_content = convert(html)
+    return md_content, time.perf_counter() - start
+
+
+def _finish(item: _Item, write: WriteStage, done: Optional[DoneHook] = None) -> int:
+    """Write one item and flush its buffered output. Returns its exit code."""
+    code = 1
+    page = item.page
+    record = page.record if page is not None else None
+    md_content: Optional[str] = None
+    if page is not None and page.skipped:
+        code = 0
+    elif page is not None and page.markdown is not None:
+        md_content = page.markdown
+    elif item.future is not None:
+        try:
+            md_content, seconds = item.future.result()
+            if record is not None:
+                record.add('convert', seconds)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"Conversion failed: {e}", file=item.err)
+            if record is not None:
+                record.fail(f"Conversion failed: {e}")
+    if page is not None and md_content is not None:
+        try:
+            code = write(page, md_content, item.out, item.err)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"Error processing {item.url}: {e}", file=item.err)
+            if record is not None:
+                record.fail(f"Error processing {item.url}: {e}")
+    if page is not None and done is not None:
+        done(page, code)
+    if item.out.tell():
+        sys.stdout.write(item.out.getvalue())
+        sys.stdout.flush()
+    if item.err.tell():
+        sys.stderr.write(item.err.getvalue())
+        sys.stderr.flush()
+    return code
@@ -0,0 +1,254 @@
+"""Per-domain rate policy for batch runs (``--rate-policy``).
+
+A policy is a YAML file::
+
+    # Optional: URLs read ahead from the batch file to interleave hosts.
+    window: 10000
+    default:            # hosts not listed under ``domains``
+      rate: 2           # requests per second; omit for no limit
+      burst: 4          # requests allowed back to back (default: 1)
+      concurrency: 2    # in-flight requests (default: --per-host)
+    domains:
+      example.com:      # also matches www.example.com, docs.example.com, ...
+        rate: 0.5
+        concurrency: 1
+
+Hosts under a listed domain share one token bucket and one concurrency cap
+(the most specific domain wins). Every other host gets its own bucket with
+the ``default`` settings. The batch is reordered round-robin across hosts,
+so one host's backlog does not hold back the others.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple
+
+# Batch URLs read ahead for round-robin interleaving, unless the policy sets ``window``.
+DEFAULT_WINDOW = 10000
+
+
+class PolicyError(ValueError):
+    """Raised for a malformed rate policy file."""
+
+
+class HostPolicy:
+    """Rate and concurrency limits of one domain."""
+
+    __slots__ = ('rate', 'burst', 'concurrency')
+
+    def __init__(self, rate: Optional[float] = None, burst: int = 1,
+                 concurrency: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+
+    @classmethod
+    def from_dict(cls, data: object, where: str,
+                  base: Optional['HostPolicy'] = None) -> 'HostPolicy':
+        """Build a policy from a YAML mapping; unset keys fall back to ``base``."""
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            raise PolicyError(f'{where} must be a mapping')
+        unknown = set(data) - {'rate', 'burst', 'concurrency'}
+        if unknown:
+            raise PolicyError(f'{where}: unknown key(s) {", ".join(sorted(map(str, unknown)))}')
+        base = base or cls()
+        rate = data.get('rate', base.rate)
+        burst = data.get('burst', base.burst)
+        concurrency = data.get('concurrency', base.concurrency)
+        if rate is not None and (isinstance(rate, bool) or not isinstance(rate, (int, float))
+                                 or rate <= 0):
+            raise PolicyError(f'{where}: rate must be a positive number')
+        for name, value in (('burst', burst), ('concurrency', concurrency)):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int)
+                                      or value < 1):
+                raise PolicyError(f'{where}: {name} must be a positive integer')
+        return cls(None if rate is None else float(rate), burst, concurrency)
+
+
+class RatePolicy:
+    """Maps hosts to the domain key and :class:`HostPolicy` that govern them."""
+
+    def __init__(self, default: Optional[HostPolicy] = None,
+                 domains: Optional[Dict[str, HostPolicy]] = None,
+                 window: int = DEFAULT_WINDOW):
+        self.default = default or HostPolicy()
+        self.domains = {d.lower().strip('.'): p for d, p in (domains or {}).items()}
+        self.window = window
+
+    @classmethod
+    def from_dict(cls, data: object) -> 'RatePolicy':
+        """Build a policy from the parsed YAML document."""
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            raise PolicyError('policy must be a mapping')
+        unknown = set(data) - {'window', 'default', 'domains'}
+        if unknown:
+            raise PolicyError(f'unknown key(s) {", ".join(sorted(map(str, unknown)))}')
+        window = data.get('window', DEFAULT_WINDOW)
+        if isinstance(window, bool) or not isinstance(window, int) or window < 1:
+            raise PolicyError('window must be a positive integer')
+        default = HostPolicy.from_dict(data.get('default'), 'default')
+        domains = data.get('domains') or {}
+        if not isinstance(domains, dict):
+            raise PolicyError('domains must be a mapping of domain to settings')
+        return cls(default, {
+            str(domain): HostPolicy.from_dict(settings, f'domains.{domain}', default)
+            for domain, settings in domains.items()
+        }, window)
+
+    def key(self, host: Optional[str]) -> str:
+        """Return the listed domain covering ``host``, or the host itself."""
+        host = (host or '').lower().rstrip('.')
+        candidate = host
+        while True:
+            if candidate in self.domains:
+                return candidate
+            if '.' not in candidate:
+                return host
+            candidate = candidate.split('.', 1)[1]
+
+    def for_key(self, key: str) -> HostPolicy:
+        """Return the limits of a key returned by :meth:`key`."""
+        return self.domains.get(key, self.default)
+
+    def concurrency(self, key: str, fallback: int) -> int:
+        """In-flight cap for ``key``; ``fallback`` (--per-host) when the policy sets none."""
+        return self.for_key(key).concurrency or fallback
+
+
+def load_policy(path: Path) -> RatePolicy:
+    """Read a YAML rate policy; raises :class:`PolicyError` or OSError."""
+    import yaml  # pylint: disable=import-outside-toplevel
+
+    try:
+        with Path(path).open('r', encoding='utf-8') as f:
+            data = yaml.safe_load(f)
+    except yaml.YAMLError as e:
+        raise PolicyError(f'invalid YAML: {e}') from e
+    return RatePolicy.from_dict(data)
+
+
+class TokenBucket:
+    """Token bucket of ``rate`` tokens per second holding at most ``burst``.
+
+    :meth:`reserve` always takes a token, going into debt if none is left,
+    and returns how long the caller must wait before using it. Concurrent
+    callers therefore get distinct, correctly spaced start times.
+    """
+
+    def __init__(self, rate: float, burst: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._last = clock()
+
+    def reserve(self) -> float:
+        """Take one token; return the seconds to wait before it is valid."""
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def ready_in(self) -> float:
+        """Return the seconds until a token is free, without taking it."""
+        tokens = min(self.burst, self._tokens + (self._clock() - self._last) * self.rate)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+
+class Throttle:
+    """Thread-safe per-domain token buckets for a :class:`RatePolicy`."""
+
+    def __init__(self, policy: RatePolicy, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.policy = policy
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def reserve(self, key: str) -> float:
+        """Take a token for ``key``; return the seconds until it may be used."""
+        limits = self.policy.for_key(key)
+        if limits.rate is None:
+            return 0.0
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(limits.rate, limits.burst,
+                                                          self._clock)
+            return bucket.reserve()
+
+    def ready_in(self, key: str) -> float:
+        """Return the seconds until ``key`` has a free token, without taking it.
+
+        Callers can put a request off for that long instead of sleeping in
+        :meth:`wait` while holding a thread.
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            return bucket.ready_in() if bucket is not None else 0.0
+
+    def wait(self, key: str) -> float:
+        """Block until ``key`` may send its next request; return the time waited."""
+        delay = self.reserve(key)
+        if delay > 0:
+            self._sleep(delay)
+        return delay
+
+
+def interleave(urls: Iterable[str], key: Callable[[str], str],
+               window: int = DEFAULT_WINDOW,
+               ready: Optional[Callable[[], bool]] = None) -> Iterator[str]:
+    """Yield ``urls`` round-robin across ``key(url)``, reading ``window`` URLs ahead.
+
+    URLs of one key keep their order. Only ``window`` URLs are held in
+    memory, so a huge batch file is interleaved window by window. With
+    ``ready`` (see :meth:`html2md.batch.UrlFeed.ready`), read-ahead stops
+    early while the source has nothing available, so a slow stream is not
+    held back until a whole window has arrived.
+    """
+    queues: 'OrderedDict[str, Deque[str]]' = OrderedDict()
+    buffered = 0
+    it = iter(urls)
+    exhausted = False
+    while True:
+        while not exhausted and buffered < window:
+            if buffered and ready is not None and not ready():
+                break
+            try:
+                url = next(it)
+            except StopIteration:
+                exhausted = True
+                break
+            queues.setdefault(key(url), deque()).append(url)
+            buffered += 1
+        if not queues:
+            return
+        k, q = queues.popitem(last=False)
+        yield q.popleft()
+        buffered -= 1
+        if q:
+            queues[k] = q
+
+
+def plan(urls: Iterable[str], policy: RatePolicy,
+         host_of: Callable[[str], Optional[str]]) -> Iterator[Tuple[float, str, str]]:
+    """Yield the ``(start_offset, key, url)`` schedule of a batch for ``--dry-run``.
+
+    Offsets assume every request finishes instantly, so they show the
+    earliest start the rate limits allow.
+    """
+    now = [0.0]
+    throttle = Throttle(policy, clock=lambda: now[0], sleep=lambda _s: None)
+    for url in interleave(urls, lambda u: policy.key(host_of(u)), policy.window):
+        key = policy.key(host_of(url))
+        yield now[0] + throttle.reserve(key), key, url
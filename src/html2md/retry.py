@@ -0,0 +1,153 @@
+"""Retry timing and per-host circuit breaking for transient fetch failures.
+
+A fetch is retried after a ``429``/``5xx`` answer or a dropped connection.
+The delay is the server's ``Retry-After`` when it sends one and otherwise an
+exponential backoff with full jitter, so many URLs failing together do not
+retry in lockstep. :class:`CircuitBreaker` stops sending requests to a host
+after consecutive transient failures and lets a single probe through once a
+cool-down has passed.
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+# HTTP statuses that are worth retrying.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# requests exceptions for a failed, timed-out or dropped connection.
+_TRANSIENT_ERRORS = frozenset({'ConnectionError', 'Timeout', 'ChunkedEncodingError'})
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Return True if ``exc`` is a requests connection, timeout or truncated-body error.
+
+    Classes are matched by name, so requests need not be imported here;
+    the CLI imports it lazily.
+    """
+    return any(cls.__name__ in _TRANSIENT_ERRORS and cls.__module__.startswith('requests')
+               for cls in type(exc).__mro__)
+
+
+def parse_retry_after(value: object, now: Optional[float] = None) -> Optional[float]:
+    """Return the seconds a ``Retry-After`` header asks to wait, or None if invalid.
+
+    Both forms are accepted: delta-seconds (``120``) and an HTTP date.
+    """
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+class Backoff:
+    """Delays before retry ``n`` (0-based): full jitter over ``base * 2**n``, capped."""
+
+    def __init__(self, base: float = 0.5, cap: float = 30.0,
+                 rng: Callable[[], float] = random.random):
+        self.base = base
+        self.cap = cap
+        self._rng = rng
+
+    def delay(self, retry: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """Return the wait before retry ``retry``; None if Retry-After exceeds ``cap``."""
+        if retry_after is not None:
+            return retry_after if retry_after <= self.cap else None
+        return self._rng() * min(self.cap, self.base * 2 ** retry)
+
+
+class CircuitOpen(Exception):
+    """Raised instead of a request to ``host`` while its circuit is open.
+
+    ``wait`` is how long until the breaker lets a probe through; the URL is
+    put off until then rather than failed.
+    """
+
+    def __init__(self, host: str, wait: float):
+        super().__init__(f'circuit open for {host}')
+        self.host = host
+        self.wait = wait
+
+
+class _HostState:
+    __slots__ = ('failures', 'opened_at', 'probing')
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+
+class CircuitBreaker:
+    """Per-host breaker: open after ``threshold`` consecutive failures.
+
+    While open, :meth:`allow` refuses requests to the host. After
+    ``cooldown`` seconds one probe request is let through; its success
+    closes the breaker and its failure keeps it open for another cool-down.
+    Only hosts that are currently failing are tracked.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        if threshold < 1:
+            raise ValueError('threshold must be >= 1')
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, _HostState] = {}
+
+    def allow(self, host: str) -> bool:
+        """Return True if a request to ``host`` may be sent now."""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state.opened_at is None:
+                return True
+            if state.probing or self._clock() - state.opened_at < self.cooldown:
+                return False
+            state.probing = True
+            return True
+
+    def success(self, host: str) -> None:
+        """Record a request to ``host`` that got an answer; closes the breaker."""
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def failure(self, host: str) -> None:
+        """Record a transient failure of ``host``."""
+        with self._lock:
+            state = self._hosts.setdefault(host, _HostState())
+            state.failures += 1
+            if state.probing or state.failures >= self.threshold:
+                state.opened_at = self._clock()
+                state.probing = False
+
+    def wait(self, host: str) -> float:
+        """Seconds until :meth:`allow` may let a request to ``host`` through.
+
+        With a probe in flight, that is a full cool-down, by when the probe
+        has either closed the breaker or opened it again.
+        """
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state.opened_at is None:
+                return 0.0
+            if state.probing:
+                return self.cooldown
+            return max(0.0, state.opened_at + self.cooldown - self._clock())
+
+    def is_open(self, host: str) -> bool:
+        """Return True while ``host`` is refused (open, or open with a probe in flight)."""
+        with self._lock:
+            state = self._hosts.get(host)
+            return state is not None and state.opened_at is not None
@@ -0,0 +1,212 @@
+"""robots.txt and meta-robots controls (``--respect-robots``).
+
+:class:`RobotsCache` fetches each origin's ``robots.txt`` once per TTL.
+Parsed rules are kept in memory for the worker threads of a run and in a
+small SQLite table in the cache directory, so later runs and other
+processes reuse them. Missing files (4xx) allow everything. An unreachable
+``robots.txt`` (5xx, network error) disallows the whole origin for a
+shorter TTL, as RFC 9309 asks.
+
+:func:`page_directives` reads ``<meta name="robots">`` (and
+``<meta name="html2md">``) from the document head only, without parsing the
+page, and :func:`header_directives` reads the ``X-Robots-Tag`` header.
+"""
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set, Tuple
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+# Product token matched against robots.txt User-agent lines and meta names.
+ROBOTS_AGENT = 'html2md'
+DEFAULT_TTL = 24 * 60 * 60
+# Unreachable robots.txt files are retried sooner than the regular TTL.
+ERROR_TTL = 10 * 60
+# RFC 9309 parsers must read at least 500 KiB; anything after is ignored.
+MAX_ROBOTS_BYTES = 500 * 1024
+# Bytes of a page searched for meta robots tags when no </head> comes first.
+HEAD_SCAN_BYTES = 64 * 1024
+
+# fetch(robots_url) -> (HTTP status or None on network error, body text)
+RobotsFetch = Callable[[str], Tuple[Optional[int], str]]
+
+_HEAD_END = re.compile(r'</head\s*>|<body[\s>]', re.IGNORECASE)
+_META = re.compile(r'<meta\b[^>]*>', re.IGNORECASE)
+_ATTR = re.compile(r'([\w:-]+)\s*=\s*("[^"]*"|\'[^\']*\'|[^\s>]+)')
+# Link destination with an optional title; one level of parentheses allowed.
+_DEST = r'\((?:[^()\s]|\([^()]*\))*(?:\s+"[^"]*")?\)'
+# The link text may contain an image (a linked logo); "![" only starts one.
+_LINK = re.compile(r'(?<!!)\[((?:!\[[^\]]*\]' + _DEST + r'|!(?!\[)|[^\]!])*)\]' + _DEST)
+
+
+def _directives(content: str) -> Set[str]:
+    found = {d.strip().lower() for d in content.split(',') if d.strip()}
+    if 'none' in found:
+        found |= {'noindex', 'nofollow'}
+    return found
+
+
+def page_directives(head: str, agent: str = ROBOTS_AGENT) -> Set[str]:
+    """Return the robots directives of the meta tags in the ``<head>`` of ``head``.
+
+    Only the text before ``</head>`` (or ``<body>``) is searched, so callers
+    can pass just the first :data:`HEAD_SCAN_BYTES` of a page.
+    """
+    end = _HEAD_END.search(head)
+    if end is not None:
+        head = head[:end.start()]
+    found: Set[str] = set()
+    for tag in _META.findall(head):
+        attrs = {k.lower(): v.strip('"\'') for k, v in _ATTR.findall(tag)}
+        if attrs.get('name', '').lower() in ('robots', agent):
+            found |= _directives(attrs.get('content', ''))
+    return found
+
+
+def header_directives(value: object, agent: str = ROBOTS_AGENT) -> Set[str]:
+    """Return the ``X-Robots-Tag`` directives for ``agent`` or for every agent."""
+    if not isinstance(value, str):
+        return set()
+    found: Set[str] = set()
+    for part in value.split(','):
+        name, sep, rest = part.partition(':')
+        if sep:
+            # "agent: noindex" applies to that agent only; other values with a
+            # colon (unavailable_after: <date>) are not directives we act on.
+            if name.strip().lower() == agent:
+                found |= _directives(rest)
+            continue
+        found |= _directives(part)
+    return found
+
+
+def strip_links(markdown: str) -> str:
+    """Replace Markdown links with their text, keeping images (``nofollow``)."""
+    return _LINK.sub(r'\1', markdown)
+
+
+def _origin(url: str) -> Optional[str]:
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or '').lower()
+        port = parts.port
+    except ValueError:
+        return None
+    if not host:
+        return None
+    if ':' in host:
+        host = f'[{host}]'
+    netloc = host if port is None else f'{host}:{port}'
+    return f'{parts.scheme.lower()}://{netloc}'
+
+
+def _rules(status: Optional[int], body: str) -> RobotFileParser:
+    parser = RobotFileParser()
+    if status is not None and 200 <= status < 300:
+        parser.parse(body.splitlines())
+    elif status is not None and 400 <= status < 500:
+        parser.allow_all = True
+    else:
+        parser.disallow_all = True
+    return parser
+
+
+class RobotsCache:
+    """Per-origin robots.txt rules with an in-memory and optional on-disk TTL cache.
+
+    Concurrent lookups for an origin that is not cached yet wait for a
+    single fetch. ``path`` is the SQLite file shared across runs and
+    processes; without it rules are only kept in memory.
+    """
+
+    def __init__(self, fetch: RobotsFetch, ttl: float = DEFAULT_TTL,
+                 path: Optional[Path] = None, agent: str = ROBOTS_AGENT,
+                 clock: Callable[[], float] = time.time):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.agent = agent
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._origin_locks: Dict[str, threading.Lock] = {}
+        self._rules: Dict[str, Tuple[float, RobotFileParser]] = {}
+        self.fetches = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False,
+                                       isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS robots ('
+                ' origin TEXT PRIMARY KEY, expires REAL NOT NULL,'
+                ' status INTEGER, body TEXT NOT NULL)'
+            )
+
+    def close(self) -> None:
+        """Close the on-disk cache."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def allowed(self, url: str) -> bool:
+        """Return True if robots.txt lets :attr:`agent` fetch ``url``."""
+        origin = _origin(url)
+        if origin is None:
+            return True
+        return self._get(origin).can_fetch(self.agent, url)
+
+    def _get(self, origin: str) -> RobotFileParser:
+        now = self._clock()
+        with self._lock:
+            cached = self._rules.get(origin)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+            origin_lock = self._origin_locks.setdefault(origin, threading.Lock())
+        with origin_lock:
+            with self._lock:
+                cached = self._rules.get(origin)
+                if cached is not None and cached[0] > self._clock():
+                    return cached[1]
+                row = self._load(origin)
+            if row is not None:
+                expires, status, body = row
+            else:
+                status, body = self._fetch(f'{origin}/robots.txt')
+                body = body[:MAX_ROBOTS_BYTES]
+                ok = status is not None and status < 500
+                expires = self._clock() + (self.ttl if ok else min(self.ttl, ERROR_TTL))
+                with self._lock:
+                    self.fetches += 1
+                    self._store(origin, expires, status, body)
+            rules = _rules(status, body)
+            with self._lock:
+                self._rules[origin] = (expires, rules)
+                self._origin_locks.pop(origin, None)
+            return rules
+
+    def _load(self, origin: str) -> Optional[Tuple[float, Optional[int], str]]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute('SELECT expires, status, body FROM robots WHERE origin = ?',
+                                   (origin,)).fetchone()
+        except sqlite3.Error:
+            return None
+        return row if row is not None and row[0] > self._clock() else None
+
+    def _store(self, origin: str, expires: float, status: Optional[int], body: str) -> None:
+        if self._db is None:
+            return
+        try:
+            self._db.execute('INSERT OR REPLACE INTO robots (origin, expires, status, body)'
+                             ' VALUES (?, ?, ?, ?)', (origin, expires, status, body))
+        except sqlite3.Error:
+            # The disk cache is an optimisation; the rules stay in memory.
+            pass
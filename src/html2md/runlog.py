@@ -0,0 +1,159 @@
+"""Structured JSONL run log (``--log``).
+
+Every processed URL produces one JSON object per line with the fields that
+``html2md-log-export`` reads by default (``ts``, ``input``, ``output``,
+``status``, ``reason``) plus the HTTP status, downloaded and written bytes, the number
+of retries and the time spent in each stage::
+
+    {"ts": "2024-05-01T12:00:00.123+00:00", "input": "https://example.com/a",
+     "output": "out/a.md", "status": "ok", "reason": "", "http_status": 200,
+     "bytes": 18234, "bytes_out": 6120, "retries": 0, "fetch_ms": 120.4, "decode_ms": 0.1,
+     "convert_ms": 9.8, "write_ms": 0.3}
+
+Records are buffered and written in batches, so logging a large batch does
+not add a flush per URL.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+STAGES = ('fetch', 'decode', 'convert', 'write')
+
+
+class RunRecord:
+    """Outcome and stage timings of one URL, filled in as it moves through the stages."""
+
+    __slots__ = ('ts', 'input', 'output', 'status', 'reason', 'http_status', 'bytes',
+                 'bytes_out', 'size_limited', 'retries', 'transient', 'retry_after', 'sha256',
+                 'seconds', 'pending')
+
+    def __init__(self, url: str):
+        self.ts = datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+        self.input = url
+        self.output = ''
+        self.status = ''
+        self.reason = ''
+        self.http_status: Optional[int] = None
+        self.bytes = 0
+        self.bytes_out = 0
+        # True when the page was rejected by the download size limit.
+        self.size_limited = False
+        self.retries = 0
+        # Set with fail() when the failure is worth retrying (429/5xx, dropped
+        # connection); retry_after is the server's Retry-After in seconds.
+        self.transient = False
+        self.retry_after: Optional[float] = None
+        # SHA-256 of the Markdown written to --outdir, for the --resume manifest.
+        self.sha256 = ''
+        self.seconds: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        # Future of an output still being written in the background (a
+        # --formats PDF); the record is only logged once it has finished.
+        self.pending: Optional[Future] = None
+
+    def add(self, stage: str, seconds: float) -> None:
+        """Add ``seconds`` to the time spent in ``stage``."""
+        self.seconds[stage] += seconds
+
+    @contextmanager
+    def timed(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block as part of ``stage``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def fail(self, reason: str) -> None:
+        """Mark the URL failed; the first reason recorded wins."""
+        if self.status != 'error':
+            self.status = 'error'
+            self.reason = reason
+
+    def skip(self, reason: str) -> None:
+        """Mark the URL deliberately not converted, e.g. excluded by robots rules."""
+        self.status = 'skipped'
+        self.reason = reason
+
+    def retry(self) -> None:
+        """Clear the failed attempt's outcome before the URL is tried again."""
+        self.retries += 1
+        self.status = ''
+        self.reason = ''
+        self.http_status = None
+        self.bytes = 0
+        self.size_limited = False
+        self.transient = False
+        self.retry_after = None
+
+    def finish(self, exit_code: int) -> None:
+        """Settle the status from the URL's exit code if no stage set it."""
+        if not self.status:
+            self.status = 'ok' if exit_code == 0 else 'error'
+
+    def as_dict(self) -> dict:
+        """Return the JSON-serializable log record."""
+        rec = {
+            'ts': self.ts,
+            'input': self.input,
+            'output': self.output,
+            'status': self.status or 'error',
+            'reason': self.reason,
+            'http_status': self.http_status,
+            'bytes': self.bytes,
+            'bytes_out': self.bytes_out,
+            'retries': self.retries,
+        }
+        for stage in STAGES:
+            rec[f'{stage}_ms'] = round(self.seconds[stage] * 1000, 3)
+        return rec
+
+
+class RunLog:
+    """Thread-safe, buffered JSONL writer for :class:`RunRecord` objects.
+
+    Lines are collected in memory and appended to ``path`` once
+    ``flush_lines`` records are pending or ``flush_interval`` seconds have
+    passed since the last write, and on :meth:`close`.
+    """
+
+    def __init__(self, path: Path, flush_lines: int = 64, flush_interval: float = 1.0):
+        self._file = Path(path).open('a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._pending: List[str] = []
+        self._flush_lines = flush_lines
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def write(self, record: RunRecord) -> None:
+        """Queue one record, writing the batch out when it is due."""
+        line = json.dumps(record.as_dict(), ensure_ascii=False) + '\n'
+        with self._lock:
+            self._pending.append(line)
+            if (len(self._pending) >= self._flush_lines
+                    or time.monotonic() - self._last_flush >= self._flush_interval):
+                self._flush()
+
+    def flush(self) -> None:
+        """Write out every pending record."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._pending:
+            self._file.write(''.join(self._pending))
+            self._file.flush()
+            self._pending.clear()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        """Flush pending records and close the file."""
+        with self._lock:
+            self._flush()
+            self._file.close()
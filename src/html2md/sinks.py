@@ -0,0 +1,186 @@
+"""Sharded and archive output sinks for ``--outdir`` (``--sink``).
+
+The default ``files`` sink writes one ``.md`` file per URL. At millions of
+pages that costs an inode and several metadata operations per page, so
+the other sinks append every page to a few large shard files instead:
+
+* ``jsonl``: one JSON object per line with ``url``, ``final_url``,
+  ``markdown`` and ``sha256``;
+* ``tar``: a PAX tar of ``.md`` entries, with the URLs and hash in the
+  PAX headers;
+* ``zip``: a deflated zip of ``.md`` entries, with the URL as the entry
+  comment.
+
+Shards are named ``html2md-00000.<ext>`` and rotated once they reach
+``max_bytes``. A shard is written through a large buffer to a ``.part``
+file and renamed when it is complete, so a shard under its final name
+is never truncated. Numbering continues after the shards (and leftover
+``.part`` files) already in the directory, so reruns never overwrite them.
+"""
+from __future__ import annotations
+
+import io
+import json
+import re
+import tarfile
+import threading
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO, Optional, Set
+
+SINKS = ('files', 'jsonl', 'tar', 'zip')
+DEFAULT_SHARD_MB = 256
+# Write buffer of an open shard.
+BUFFER_BYTES = 1024 * 1024
+SHARD_PREFIX = 'html2md'
+
+
+class ShardWriter(ABC):
+    """Appends pages to rolling shard files; safe to share between threads."""
+
+    extension = ''
+
+    def __init__(self, outdir: Path, max_bytes: int, prefix: str = SHARD_PREFIX):
+        if max_bytes < 1:
+            raise ValueError('max_bytes must be >= 1')
+        self.outdir = Path(outdir)
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._index = self._next_index()
+        self._file: Optional[BinaryIO] = None
+        self._path: Optional[Path] = None
+        self._names: Set[str] = set()
+        self.shards = 0
+
+    def _next_index(self) -> int:
+        pattern = re.compile(rf'{re.escape(self.prefix)}-(\d+)\.{self.extension}(\.part)?$')
+        found = [int(m.group(1)) for p in self.outdir.iterdir()
+                 for m in [pattern.match(p.name)] if m]
+        return max(found) + 1 if found else 0
+
+    def put(self, url: str, final_url: str, name: str, markdown: str, sha256: str) -> Path:
+        """Append one page; return the (final) path of the shard it went to."""
+        data = markdown.encode('utf-8')
+        with self._lock:
+            if self._file is not None and self._file.tell() + len(data) > self.max_bytes:
+                self._finish()
+            if self._file is None:
+                self._start()
+            self._write(url, final_url, self._unique(name), data, sha256)
+            return self._path  # type: ignore[return-value]
+
+    def _unique(self, name: str) -> str:
+        """Return ``name``, suffixed if the current shard already holds an entry of that name."""
+        stem, dot, ext = name.rpartition('.')
+        if not dot:
+            stem, ext = name, ''
+        candidate = name
+        n = 1
+        while candidate in self._names:
+            n += 1
+            candidate = f'{stem}-{n}.{ext}' if dot else f'{stem}-{n}'
+        self._names.add(candidate)
+        return candidate
+
+    def _start(self) -> None:
+        self._path = self.outdir / f'{self.prefix}-{self._index:05d}.{self.extension}'
+        self._index += 1
+        self._file = self._part().open('wb', buffering=BUFFER_BYTES)
+        self._names = set()
+        self._open()
+
+    def _part(self) -> Path:
+        return self._path.with_name(self._path.name + '.part')  # type: ignore[union-attr]
+
+    def _finish(self) -> None:
+        # Detach first: a shard that failed to close is not retried.
+        file, self._file = self._file, None
+        try:
+            self._close()
+        finally:
+            file.close()  # type: ignore[union-attr]
+        self._part().replace(self._path)  # type: ignore[arg-type]
+        self.shards += 1
+
+    def close(self) -> None:
+        """Complete the current shard and move it into place."""
+        with self._lock:
+            if self._file is not None:
+                self._finish()
+
+    # Format hooks.
+    def _open(self) -> None:
+        pass
+
+    @abstractmethod
+    def _write(self, url: str, final_url: str, name: str, data: bytes, sha256: str) -> None:
+        """Append one page to the open shard."""
+
+    def _close(self) -> None:
+        pass
+
+
+class JsonlShards(ShardWriter):
+    """Pages as JSON lines."""
+
+    extension = 'jsonl'
+
+    def _write(self, url: str, final_url: str, name: str, data: bytes, sha256: str) -> None:
+        line = json.dumps({'url': url, 'final_url': final_url,
+                           'markdown': data.decode('utf-8'), 'sha256': sha256},
+                          ensure_ascii=False)
+        self._file.write(line.encode('utf-8') + b'\n')  # type: ignore[union-attr]
+
+
+class TarShards(ShardWriter):
+    """Pages as ``.md`` entries of a PAX tar."""
+
+    extension = 'tar'
+    _tar: tarfile.TarFile
+
+    def _open(self) -> None:
+        self._tar = tarfile.open(fileobj=self._file, mode='w', format=tarfile.PAX_FORMAT)
+
+    def _write(self, url: str, final_url: str, name: str, data: bytes, sha256: str) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        info.pax_headers = {'HTML2MD.url': url, 'HTML2MD.final_url': final_url,
+                            'HTML2MD.sha256': sha256}
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def _close(self) -> None:
+        self._tar.close()
+
+
+class ZipShards(ShardWriter):
+    """Pages as deflated ``.md`` entries of a zip archive."""
+
+    extension = 'zip'
+    _zip: zipfile.ZipFile
+
+    def _open(self) -> None:
+        self._zip = zipfile.ZipFile(self._file, 'w', zipfile.ZIP_DEFLATED)  # type: ignore
+
+    def _write(self, url: str, final_url: str, name: str, data: bytes, sha256: str) -> None:
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.comment = url.encode('utf-8')
+        self._zip.writestr(info, data)
+
+    def _close(self) -> None:
+        self._zip.close()
+
+
+def open_sink(kind: str, outdir: Path, max_bytes: int) -> Optional[ShardWriter]:
+    """Return the shard writer for ``--sink kind``; None for per-URL ``files``."""
+    if kind == 'files':
+        return None
+    writers = {'jsonl': JsonlShards, 'tar': TarShards, 'zip': ZipShards}
+    if kind not in writers:
+        raise ValueError(f'sink must be one of {", ".join(SINKS)}')
+    return writers[kind](outdir, max_bytes)
@@ -0,0 +1,95 @@
+"""Fixed-memory streaming sketches for log aggregation.
+
+:class:`QuantileSketch` estimates percentiles within a relative error, and
+:class:`HyperLogLog` estimates the number of distinct values. Both use a
+bounded amount of memory however many values they see.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+from typing import Dict, Optional
+
+
+class QuantileSketch:
+    """Log-bucketed quantile sketch (the DDSketch scheme) for non-negative values.
+
+    Values are counted in buckets whose bounds grow geometrically, so every
+    quantile is returned within ``relative_accuracy`` of the true value.
+    Past ``max_buckets`` buckets, the lowest buckets are merged, trading
+    accuracy on the smallest values for bounded memory.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._max_buckets = max_buckets
+        self._buckets: Dict[int, int] = {}
+        self._zeros = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        """Record one value; negative values count as zero."""
+        self.count += 1
+        if value <= 0:
+            self._zeros += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        if len(self._buckets) > self._max_buckets:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        lowest = sorted(self._buckets)[:len(self._buckets) - self._max_buckets + 1]
+        target = lowest[-1]
+        for index in lowest[:-1]:
+            self._buckets[target] += self._buckets.pop(index)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the ``q`` quantile (0 to 1); None if nothing was added."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if rank < seen:
+                # Midpoint of the bucket (gamma^(i-1), gamma^i] in relative terms.
+                return 2 * self._gamma ** index / (1 + self._gamma)
+        return 2 * self._gamma ** max(self._buckets) / (1 + self._gamma)
+
+
+class HyperLogLog:
+    """Distinct-count estimator using ``2 ** precision`` one-byte registers.
+
+    The default precision of 12 uses 4 KiB and has a standard error of
+    about 1.6%.
+    """
+
+    def __init__(self, precision: int = 12):
+        self._p = precision
+        self._m = 1 << precision
+        self._registers = bytearray(self._m)
+        self._alpha = 0.7213 / (1 + 1.079 / self._m)
+
+    def add(self, value: str) -> None:
+        """Record one value."""
+        h = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(),
+                           'big')
+        index = h >> (64 - self._p)
+        rest = h & ((1 << (64 - self._p)) - 1)
+        rank = (64 - self._p) - rest.bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def estimate(self) -> int:
+        """Return the estimated number of distinct values added."""
+        registers = self._registers
+        raw = self._alpha * self._m * self._m / sum(2.0 ** -r for r in registers)
+        zeros = registers.count(0)
+        if raw <= 2.5 * self._m and zeros:
+            # Linear counting is more accurate for small cardinalities.
+            raw = self._m * math.log(self._m / zeros)
+        return int(round(raw))
@@ -0,0 +1,449 @@
+"""Incremental HTML to Markdown conversion.
+
+:class:`MarkdownRenderer` turns a stream of start-tag, end-tag and text
+events into Markdown and hands each finished block to a ``write``
+callback, so output starts before the document has been fully read and
+only the block being built is held in memory. :class:`StreamingConverter`
+drives it from raw response chunks through :class:`html.parser.HTMLParser`.
+
+The output follows markdownify's conventions (ATX headings, ``*``/``+``/``-``
+bullets by nesting depth, escaped ``_`` and ``*``, pipe tables) closely
+enough to be used in its place for ordinary documents.
+"""
+from __future__ import annotations
+
+import codecs
+import os
+import re
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Tag classes shared with html2md.formats, which renders text and PDF blocks.
+BLOCK_TAGS = frozenset((
+    'address', 'article', 'aside', 'body', 'dd', 'div', 'dl', 'dt', 'fieldset',
+    'figcaption', 'figure', 'footer', 'form', 'head', 'header', 'html', 'main',
+    'nav', 'p', 'section',
+))
+HEADINGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+SKIP_TAGS = frozenset(('script', 'style', 'template'))
+_VOID_TAGS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+    'source', 'track', 'wbr',
+))
+_EMPHASIS = {'b': '**', 'strong': '**', 'i': '*', 'em': '*'}
+_BULLETS = '*+-'
+# Placeholder for <br>; stands in for the trailing "  " + newline of a hard
+# break so that line stripping during flush cannot remove it.
+_BR = '\x1e'
+# Placeholder for whitespace moved outside emphasis markers; like markdownify
+# it is kept even when next to other whitespace.
+_PAD = '\x1f'
+_NEWLINE_RUN = re.compile(r'[\t \r\n]*[\r\n][\t \r\n]*')
+_SPACE_RUN = re.compile(r'[\t ]+')
+_BR_RUN = re.compile(' *' + _BR + ' *')
+_ESCAPE = re.compile(r'([_*])')
+
+
+class _Container:
+    """A blockquote or list item contributing a prefix to every line inside it."""
+
+    __slots__ = ('kind', 'first', 'rest')
+
+    def __init__(self, kind: str, first: str, rest: str):
+        self.kind = kind
+        self.first = first
+        self.rest = rest
+
+
+class _List:
+    """An open ``<ul>``/``<ol>`` and its running item number."""
+
+    __slots__ = ('ordered', 'count', 'depth', 'item')
+
+    def __init__(self, ordered: bool, start: int, depth: int):
+        self.ordered = ordered
+        self.count = start - 1
+        self.depth = depth
+        self.item: Optional[_Container] = None
+
+
+class MarkdownRenderer:
+    """Render HTML parse events as Markdown, one finished block at a time."""
+
+    def __init__(self, write: Callable[[str], None]):
+        self._write = write
+        self._wrote = False
+        self._inline: List[str] = []
+        # Open inline elements: (tag, start offset into _inline, attrs).
+        self._open: List[Tuple[str, int, Dict[str, str]]] = []
+        self._containers: List[_Container] = []
+        self._lists: List[_List] = []
+        self._heading = 0
+        self._skip = 0
+        self._pre: Optional[List[str]] = None
+        self._code = 0
+        self._row: Optional[List[str]] = None
+        self._rows = 0
+        self._cell: Optional[int] = None
+        self._need = ''
+        self._blank_prefix: Optional[str] = None
+
+    # -- events --------------------------------------------------------
+
+    def start(self, tag: str, attrs: Dict[str, str]) -> None:
+        """Handle an opening tag."""
+        if tag in SKIP_TAGS:
+            self._skip += 1
+            return
+        if self._skip:
+            return
+        if self._pre is not None:
+            return
+        if tag in BLOCK_TAGS:
+            self._break()
+        elif tag in HEADINGS:
+            self._break()
+            self._heading = HEADINGS[tag]
+        elif tag in ('ul', 'ol'):
+            self._break()
+            try:
+                start = int(attrs.get('start') or 1)
+            except ValueError:
+                start = 1
+            # Bullets cycle with the number of enclosing <ul>s only, as in markdownify.
+            depth = sum(1 for lst in self._lists if not lst.ordered)
+            self._lists.append(_List(tag == 'ol', start, depth))
+        elif tag == 'li':
+            self._start_item()
+        elif tag == 'blockquote':
+            self._break()
+            self._containers.append(_Container('quote', '> ', '> '))
+        elif tag == 'pre':
+            self._break()
+            self._pre = []
+        elif tag == 'hr':
+            self._break()
+            self._emit_lines(['---'])
+            self._break()
+        elif tag == 'table':
+            self._break()
+            self._rows = 0
+        elif tag == 'tr':
+            self._flush()
+            self._row = []
+        elif tag in ('td', 'th'):
+            if self._row is None:
+                self._row = []
+            self._cell = len(self._inline)
+        elif tag == 'br':
+            self._inline.append(_BR)
+        elif tag == 'img':
+            self._image(attrs)
+        elif tag in _EMPHASIS or tag in ('a', 'code', 'kbd', 'samp', 'tt'):
+            if tag in ('code', 'kbd', 'samp', 'tt'):
+                self._code += 1
+            self._open.append((tag, len(self._inline), attrs))
+
+    def end(self, tag: str) -> None:
+        """Handle a closing tag."""
+        if tag in SKIP_TAGS:
+            if self._skip:
+                self._skip -= 1
+            return
+        if self._skip:
+            return
+        if self._pre is not None:
+            if tag == 'pre':
+                self._end_pre()
+            return
+        if tag in BLOCK_TAGS:
+            self._break()
+        elif tag in HEADINGS:
+            self._flush()
+            self._heading = 0
+            self._break()
+        elif tag in ('ul', 'ol'):
+            if self._lists:
+                self._end_item()
+                self._lists.pop()
+            self._break()
+        elif tag == 'li':
+            self._end_item()
+        elif tag == 'blockquote':
+            self._flush()
+            if self._containers and self._containers[-1].kind == 'quote':
+                self._containers.pop()
+            self._break()
+        elif tag in ('td', 'th'):
+            self._end_cell()
+        elif tag == 'tr':
+            self._end_row()
+        elif tag == 'table':
+            self._end_row()
+            self._break()
+        elif self._open and any(entry[0] == tag for entry in self._open):
+            while self._open:
+                entry = self._open.pop()
+                self._close_inline(*entry)
+                if entry[0] == tag:
+                    break
+
+    def data(self, text: str) -> None:
+        """Handle character data."""
+        if self._skip or not text:
+            return
+        if self._pre is not None:
+            self._pre.append(text)
+            return
+        if not self._code:
+            text = _ESCAPE.sub(r'\\\1', text)
+        self._inline.append(text)
+
+    def close(self) -> None:
+        """Flush whatever is still buffered at the end of the document."""
+        if self._pre is not None:
+            self._end_pre()
+        while self._open:
+            self._close_inline(*self._open.pop())
+        self._end_row()
+        self._flush()
+
+    # -- inline --------------------------------------------------------
+
+    def _image(self, attrs: Dict[str, str]) -> None:
+        src = attrs.get('src') or ''
+        alt = attrs.get('alt') or ''
+        title = attrs.get('title')
+        title_part = f' "{title}"' if title else ''
+        self._inline.append(f'![{alt}]({src}{title_part})')
+
+    def _close_inline(self, tag: str, pos: int, attrs: Dict[str, str]) -> None:
+        pos = min(pos, len(self._inline))
+        content = ''.join(self._inline[pos:])
+        del self._inline[pos:]
+        if tag in ('code', 'kbd', 'samp', 'tt'):
+            self._code = max(0, self._code - 1)
+            self._inline.append(f'`{content}`' if content else '')
+            return
+        if tag == 'a':
+            self._inline.append(_link(content, attrs))
+            return
+        stripped = content.strip()
+        if not stripped:
+            self._inline.append(content)
+            return
+        lead = _pad(content[:len(content) - len(content.lstrip())])
+        trail = _pad(content[len(content.rstrip()):])
+        mark = _EMPHASIS[tag]
+        self._inline.append(f'{lead}{mark}{stripped}{mark}{trail}')
+
+    # -- blocks --------------------------------------------------------
+
+    def _prefix(self, first: bool) -> str:
+        parts = []
+        for container in self._containers:
+            if first:
+                parts.append(container.first)
+                container.first = container.rest
+            else:
+                parts.append(container.rest)
+        return ''.join(parts)
+
+    def _request(self, need: str) -> None:
+        """Ask for a line break (``'line'``) or blank line before the next block."""
+        if need == 'blank':
+            prefix = ''.join(c.rest for c in self._containers).rstrip()
+            if self._blank_prefix is None:
+                self._blank_prefix = prefix
+            else:
+                self._blank_prefix = os.path.commonprefix([self._blank_prefix, prefix])
+            self._need = 'blank'
+        elif not self._need:
+            self._need = 'line'
+
+    def _break(self) -> None:
+        self._flush()
+        self._request('line' if self._lists else 'blank')
+
+    def _emit_lines(self, lines: List[str]) -> None:
+        parts = []
+        if self._wrote:
+            if self._need == 'blank':
+                parts.append('\n' + (self._blank_prefix or '') + '\n')
+            else:
+                parts.append('\n')
+        for i, line in enumerate(lines):
+            if i:
+                parts.append('\n')
+            prefix = self._prefix(i == 0)
+            parts.append(prefix + line if line else prefix.rstrip())
+        self._write(''.join(parts))
+        self._wrote = True
+        self._need = ''
+        self._blank_prefix = None
+
+    def _flush(self) -> None:
+        """Emit the buffered inline text as one block."""
+        if self._row is not None:
+            # Inside a table row, text belongs to the cell being built.
+            return
+        if self._open:
+            # Inline elements left open across a block boundary (malformed
+            # markup) restart at the beginning of the next block.
+            self._open = [(tag, 0, attrs) for tag, _, attrs in self._open]
+        # Whitespace is collapsed here rather than per text event because
+        # the parser may split one run of text across several events.
+        text = _SPACE_RUN.sub(' ', _NEWLINE_RUN.sub('\n', ''.join(self._inline)))
+        text = text.replace(_PAD, ' ')
+        self._inline = []
+        lines = [line.strip() for line in text.split('\n')]
+        text = _BR_RUN.sub('  \n', '\n'.join(line for line in lines if line))
+        text = text.strip(' ')
+        while text.endswith('  \n'):
+            text = text[:-3].rstrip(' ')
+        if not text.strip():
+            return
+        if self._heading:
+            text = '#' * self._heading + ' ' + ' '.join(text.split('\n'))
+        self._emit_lines(text.split('\n'))
+
+    def _start_item(self) -> None:
+        if not self._lists:
+            self._lists.append(_List(False, 1, 0))
+        current = self._lists[-1]
+        self._end_item()
+        current.count += 1
+        if current.ordered:
+            marker = f'{current.count}. '
+        else:
+            marker = _BULLETS[current.depth % len(_BULLETS)] + ' '
+        current.item = _Container('item', marker, ' ' * len(marker))
+        self._containers.append(current.item)
+
+    def _end_item(self) -> None:
+        if not self._lists or self._lists[-1].item is None:
+            self._flush()
+            return
+        current = self._lists[-1]
+        self._flush()
+        if current.item in self._containers:
+            self._containers.remove(current.item)
+        current.item = None
+        self._request('line')
+
+    def _end_pre(self) -> None:
+        text = ''.join(self._pre or [])
+        self._pre = None
+        text = text.strip('\n')
+        self._emit_lines(['```'] + text.split('\n') + ['```'])
+        self._break()
+
+    def _end_cell(self) -> None:
+        if self._cell is None or self._row is None:
+            return
+        pos = min(self._cell, len(self._inline))
+        cell = ''.join(self._inline[pos:]).replace(_BR, ' ').replace(_PAD, ' ')
+        del self._inline[pos:]
+        self._cell = None
+        self._row.append(' '.join(cell.split()))
+
+    def _end_row(self) -> None:
+        if self._row is None:
+            return
+        self._end_cell()
+        row = self._row
+        self._row = None
+        self._inline = []
+        if not row:
+            return
+        lines = ['| ' + ' | '.join(row) + ' |']
+        if not self._rows:
+            lines.append('| ' + ' | '.join('---' for _ in row) + ' |')
+        self._rows += 1
+        self._emit_lines(lines)
+        self._request('line')
+
+
+def _pad(space: str) -> str:
+    """Return the placeholder for whitespace moved outside emphasis markers."""
+    if not space or '\n' in space or '\r' in space:
+        return space
+    return _PAD
+
+
+def _link(text: str, attrs: Dict[str, str]) -> str:
+    href = attrs.get('href')
+    title = attrs.get('title')
+    stripped = text.strip()
+    if not href:
+        return text
+    if not stripped:
+        return ''
+    if stripped.replace('\\_', '_') == href and not title:
+        return f'<{href}>'
+    title_part = ' "{}"'.format(title.replace('"', '\\"')) if title else ''
+    return f'[{stripped}]({href}{title_part})'
+
+
+class EventParser(HTMLParser):
+    """Forward :class:`HTMLParser` callbacks to a :class:`MarkdownRenderer`.
+
+    Any object with the renderer's ``start``/``end``/``data``/``close``
+    methods works, e.g. the event recorder of :mod:`html2md.formats`.
+    """
+
+    def __init__(self, renderer: MarkdownRenderer):
+        super().__init__(convert_charrefs=True)
+        self._renderer = renderer
+
+    def handle_starttag(self, tag, attrs):
+        self._renderer.start(tag, {k: v or '' for k, v in attrs})
+
+    def handle_startendtag(self, tag, attrs):
+        self._renderer.start(tag, {k: v or '' for k, v in attrs})
+        if tag not in _VOID_TAGS:
+            self._renderer.end(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in _VOID_TAGS:
+            self._renderer.end(tag)
+
+    def handle_data(self, data):
+        self._renderer.data(data)
+
+
+class StreamingConverter:
+    """Convert HTML to Markdown incrementally as raw bytes arrive.
+
+    Bytes are decoded with an incremental decoder, so multi-byte characters
+    split across chunk boundaries decode correctly, and each finished
+    Markdown block is passed to ``write`` as soon as it is complete.
+    """
+
+    def __init__(self, write: Callable[[str], None], encoding: str = 'utf-8'):
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._renderer = MarkdownRenderer(write)
+        self._parser = EventParser(self._renderer)
+
+    def feed(self, chunk: bytes) -> None:
+        """Parse the next chunk of the document."""
+        text = self._decoder.decode(chunk)
+        if text:
+            self._parser.feed(text)
+
+    def close(self) -> None:
+        """Finish parsing and flush the last block."""
+        self._parser.feed(self._decoder.decode(b'', final=True))
+        self._parser.close()
+        self._renderer.close()
+
+
+def convert(html: str) -> str:
+    """Convert a complete HTML string with the incremental renderer."""
+    parts: List[str] = []
+    renderer = MarkdownRenderer(parts.append)
+    parser = EventParser(renderer)
+    parser.feed(html)
+    parser.close()
+    renderer.close()
+    return ''.join(parts)
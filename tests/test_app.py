@@ -0,0 +1,91 @@
+"""Tests for the Flask /convert endpoint."""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from html2md import app as app_module
+from html2md.cli import MAX_DOWNLOAD_BYTES
+
+
+@pytest.fixture(name="client")
+def client_fixture():
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        yield client
+
+
+def _response(chunks, headers=None) -> MagicMock:
+    response = MagicMock()
+    response.headers = headers or {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = chunks
+    response.raise_for_status.return_value = None
+    return response
+
+
+def test_convert_posted_html(client):
+    """A JSON html document is converted without any upstream request."""
+    with patch.object(app_module.session, "get") as mock_get:
+        resp = client.post("/convert", json={"html": "<h1>Title</h1><p>Body</p>"})
+    mock_get.assert_not_called()
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/markdown"
+    assert resp.get_data(as_text=True) == "# Title\n\nBody"
+
+
+def test_convert_raw_html_body(client):
+    """A text/html request body is converted as the document."""
+    resp = client.post("/convert", data="<p>café</p>".encode("utf-8"),
+                       content_type="text/html; charset=utf-8")
+    assert resp.status_code == 200
+    assert "café" in resp.get_data(as_text=True)
+
+
+def test_convert_url_reuses_module_session(client):
+    """URLs are fetched with the shared pooled session."""
+    with patch.object(app_module.session, "get",
+                      return_value=_response([b"<h2>Remote</h2>"])) as mock_get:
+        first = client.post("/convert", json={"url": "https://example.com/a"})
+        second = client.get("/convert?url=https://example.com/b")
+    assert first.status_code == second.status_code == 200
+    assert "## Remote" in first.get_data(as_text=True)
+    assert [c.args[0] for c in mock_get.call_args_list] == [
+        "https://example.com/a", "https://example.com/b"]
+    assert mock_get.call_args.kwargs["stream"] is True
+
+
+def test_convert_rejects_unsupported_scheme(client):
+    """Only http and https URLs are fetched."""
+    with patch.object(app_module.session, "get") as mock_get:
+        resp = client.post("/convert", json={"url": "file:///etc/passwd"})
+    mock_get.assert_not_called()
+    assert resp.status_code == 400
+    assert "Unsupported URL scheme 'file'" in resp.get_json()["error"]
+
+
+def test_convert_enforces_download_limit(client):
+    """Oversized downloads are refused by header and while streaming."""
+    too_big = {"Content-Length": str(MAX_DOWNLOAD_BYTES + 1)}
+    with patch.object(app_module.session, "get", return_value=_response([], too_big)):
+        resp = client.post("/convert", json={"url": "http://example.com/big"})
+    assert resp.status_code == 413
+
+    chunk = b"x" * (1024 * 1024)
+    with patch.object(app_module.session, "get", return_value=_response([chunk] * 11)):
+        resp = client.post("/convert", json={"url": "http://example.com/big"})
+    assert resp.status_code == 413
+    assert "exceeds maximum allowed size" in resp.get_json()["error"]
+
+
+def test_convert_rejects_oversized_post(client):
+    """Posted documents share the download size cap."""
+    resp = client.post("/convert", data=b"x" * (MAX_DOWNLOAD_BYTES + 1),
+                       content_type="text/html")
+    assert resp.status_code == 413
+
+
+def test_convert_requires_input(client):
+    """A request with neither url nor html is a client error."""
+    resp = client.post("/convert", json={})
+    assert resp.status_code == 400
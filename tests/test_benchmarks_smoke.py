@@ -0,0 +1,35 @@
+"""Smoke tests for the benchmark suite."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BENCH = Path(__file__).resolve().parents[1] / "benchmarks" / "run.py"
+
+
+def test_bench_help_runs():
+    """The benchmark runner's --help exits 0."""
+    r = subprocess.run([sys.executable, str(BENCH), "--help"],
+                       capture_output=True, text=True, check=False)
+    assert r.returncode == 0, r.stderr
+
+
+def test_bench_quick_run_writes_json(tmp_path):
+    """A minimal run against the stub origin writes machine-readable results."""
+    out = tmp_path / "bench.json"
+    r = subprocess.run(
+        [sys.executable, str(BENCH), "--out", str(out), "--iterations", "1",
+         "--cli-repeat", "1", "--export-mb", "1", "--no-worst-case", "--engines", "fast"],
+        capture_output=True, text=True, check=False, timeout=300,
+    )
+    assert r.returncode == 0, r.stderr
+
+    results = json.loads(out.read_text(encoding="utf-8"))
+    assert results["corpus"]["version"] == "v1"
+    assert set(results["stages"]) == {"tiny", "article", "table_heavy"}
+    assert results["stages"]["tiny"]["convert"]["fast"]["count"] == 1
+    assert results["cli"]["fast"]["exit_code"] == 0
+    assert results["cli"]["fast"]["pages"] == 3
+    assert results["export"]["exit_code"] == 0
+    assert results["export"]["rows"] > 0
@@ -0,0 +1,133 @@
+"""Tests for the on-disk conversion caches."""
+
+from unittest.mock import MagicMock, patch
+
+from html2md import cli
+from html2md.cache import ConversionCache, HttpCache, cache_key, content_hasher
+
+
+def _response(status: int, html: bytes = b"", headers=None) -> MagicMock:
+    response = MagicMock()
+    response.status_code = status
+    response.headers = headers or {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = [html]
+    response.raise_for_status.return_value = None
+    return response
+
+
+def test_cache_key_canonicalizes_scheme_host_port_and_fragment():
+    """Equivalent spellings of one URL share a cache key."""
+    assert cache_key("HTTP://Example.COM:80/a?b=1#frag") == "http://example.com/a?b=1"
+    assert cache_key("https://example.com") == "https://example.com/"
+    assert cache_key("https://example.com:8443/x") == "https://example.com:8443/x"
+
+
+def test_http_cache_round_trip_and_variant(tmp_path):
+    """Entries are only returned to the converter variant that stored them."""
+    cache = HttpCache(tmp_path, 1024 * 1024, "v1")
+    cache.store("http://example.com/a", '"abc"', None, "# A")
+    cache.store("http://example.com/b", None, None, "# no validators")
+
+    entry = cache.lookup("http://EXAMPLE.com/a#top")
+    assert entry is not None
+    assert entry.markdown == "# A"
+    assert cache.conditional_headers(entry) == {"If-None-Match": '"abc"'}
+    assert cache.lookup("http://example.com/b") is None
+    cache.close()
+
+    other = HttpCache(tmp_path, 1024 * 1024, "v2")
+    assert other.lookup("http://example.com/a") is None
+    other.close()
+
+
+def test_http_cache_evicts_least_recently_used(tmp_path):
+    """Storing past max_bytes evicts the least recently used entries first."""
+    cache = HttpCache(tmp_path, 3500, "v1")
+    cache.store("http://example.com/1", "e1", None, "x" * 900)
+    cache.store("http://example.com/2", "e2", None, "x" * 900)
+    cache.mark_used("http://example.com/1")
+    cache.store("http://example.com/3", "e3", None, "x" * 900)
+    cache.store("http://example.com/4", "e4", None, "x" * 900)
+
+    assert cache.lookup("http://example.com/2") is None
+    assert cache.lookup("http://example.com/1") is not None
+    assert cache.lookup("http://example.com/4") is not None
+    cache.close()
+
+
+@patch("requests.Session.get")
+def test_cli_reuses_cached_markdown_on_304(mock_get, capsys, tmp_path):
+    """A 304 reply reuses cached Markdown without running markdownify."""
+    cache_dir = tmp_path / "cache"
+    mock_get.return_value = _response(
+        200, b"<h1>Title</h1>", {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    )
+    assert cli.main(["--url", "http://example.com/doc", "--cache-dir", str(cache_dir)]) == 0
+    assert "# Title" in capsys.readouterr().out
+    assert "headers" not in mock_get.call_args.kwargs
+
+    mock_get.return_value = _response(304)
+    with patch("markdownify.markdownify") as mock_md:
+        assert cli.main(["--url", "http://example.com/doc", "--cache-dir", str(cache_dir)]) == 0
+    mock_md.assert_not_called()
+    out = capsys.readouterr().out
+    assert "Not modified; using cached Markdown." in out
+    assert "# Title" in out
+    assert mock_get.call_args.kwargs["headers"] == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+
+
+@patch("requests.Session.get")
+def test_cli_no_cache_skips_conditional_headers(mock_get, capsys, tmp_path):
+    """--no-cache disables the cache even when --cache-dir is set."""
+    cache_dir = tmp_path / "cache"
+    mock_get.return_value = _response(200, b"<p>x</p>", {"ETag": '"v1"'})
+    cli.main(["--url", "http://example.com/doc", "--cache-dir", str(cache_dir), "--no-cache"])
+    capsys.readouterr()
+
+    assert not cache_dir.exists()
+    assert "headers" not in mock_get.call_args.kwargs
+
+
+def test_content_hasher_depends_on_variant_and_encoding():
+    """The same bytes hash differently under another converter or charset."""
+    def digest(variant, encoding):
+        hasher = content_hasher(variant, encoding)
+        hasher.update(b"<p>x</p>")
+        return hasher.hexdigest()
+
+    assert digest("v1", "utf-8") == digest("v1", "UTF-8")
+    assert digest("v1", "utf-8") != digest("v2", "utf-8")
+    assert digest("v1", "utf-8") != digest("v1", "latin-1")
+
+
+def test_conversion_cache_counts_hits_and_misses(tmp_path):
+    """get() tracks hit and miss counters."""
+    cache = ConversionCache(tmp_path, 1024 * 1024)
+    assert cache.get("k") is None
+    cache.put("k", "# cached")
+    assert cache.get("k") == "# cached"
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+@patch("requests.Session.get")
+def test_cli_converts_identical_content_once(mock_get, capsys, tmp_path):
+    """URLs serving byte-identical HTML are converted only once per batch."""
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://a.example/doc\nhttp://b.example/doc?utm_source=x\n",
+                     encoding="utf-8")
+    mock_get.side_effect = lambda url, **kw: _response(200, b"<h1>Same</h1>")
+
+    with patch("markdownify.markdownify", return_value="# Same") as mock_md:
+        ret = cli.main(["--batch", str(batch), "--cache-dir", str(tmp_path / "cache")])
+
+    assert ret == 0
+    assert mock_md.call_count == 1
+    outerr = capsys.readouterr()
+    assert outerr.out.count("# Same") == 2
+    assert "Identical content already converted; using cached Markdown." in outerr.out
+    assert "Conversion cache: 1 hits, 1 misses" in outerr.err
@@ -0,0 +1,204 @@
+"""Tests for concurrent --batch execution."""
+
+import io
+import os
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from html2md import cli
+from html2md.batch import HostLimiter, UrlFeed, run_concurrent
+
+
+def _response(html: bytes) -> MagicMock:
+    response = MagicMock()
+    response.headers = {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = [html]
+    response.raise_for_status.return_value = None
+    return response
+
+
+@patch("requests.Session.get")
+def test_batch_jobs_processes_every_url(mock_get, capsys, tmp_path):
+    """--jobs N converts every batch URL and keeps each URL's output together."""
+    batch = tmp_path / "urls.txt"
+    urls = [f"http://host{i % 3}.example/page{i}" for i in range(12)]
+    batch.write_text("\n".join(urls) + "\n", encoding="utf-8")
+    mock_get.side_effect = lambda url, **kw: _response(f"<h1>{url}</h1>".encode())
+
+    ret = cli.main(["--batch", str(batch), "--jobs", "4"])
+
+    assert ret == 0
+    out = capsys.readouterr().out
+    assert mock_get.call_count == len(urls)
+    for url in urls:
+        block = f"Processing URL: {url}\nFetching content...\nConverting to Markdown...\n# {url}"
+        assert block in out
+
+
+@patch("requests.Session.get")
+def test_batch_jobs_ors_exit_codes(mock_get, capsys, tmp_path):
+    """A single failing URL makes the concurrent batch exit non-zero."""
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://a.example/ok\nftp://b.example/bad\nhttp://c.example/ok\n",
+                     encoding="utf-8")
+    mock_get.side_effect = lambda url, **kw: _response(b"<p>ok</p>")
+
+    ret = cli.main(["--batch", str(batch), "--jobs", "3"])
+
+    assert ret == 1
+    assert "Unsupported URL scheme 'ftp'" in capsys.readouterr().err
+    assert mock_get.call_count == 2
+
+
+def test_jobs_must_be_positive(capsys):
+    """--jobs 0 is rejected up front."""
+    assert cli.main(["--url", "http://example.com", "--jobs", "0"]) == 1
+    assert "--jobs must be at least 1" in capsys.readouterr().err
+
+
+def test_host_limiter_caps_in_flight_per_host():
+    """No more than per_host workers hold a slot for the same host at once."""
+    limiter = HostLimiter(2)
+    lock = threading.Lock()
+    active = {"a": 0, "b": 0}
+    peak = {"a": 0, "b": 0}
+
+    def worker(url, out, err):
+        host = url.split("/")[2]
+        with limiter.slot(host):
+            with lock:
+                active[host] += 1
+                peak[host] = max(peak[host], active[host])
+            time.sleep(0.01)
+            with lock:
+                active[host] -= 1
+        return 0
+
+    urls = [f"http://{'a' if i % 2 else 'b'}/{i}" for i in range(20)]
+    assert run_concurrent(urls, worker, jobs=8) == 0
+    assert peak == {"a": 2, "b": 2}
+
+
+def test_host_limiter_per_host_overrides():
+    """limits(host) replaces the default cap for the hosts it covers."""
+    limiter = HostLimiter(3, lambda host: 1 if host == "slow" else 3)
+    lock = threading.Lock()
+    active = {"slow": 0, "fast": 0}
+    peak = {"slow": 0, "fast": 0}
+
+    def worker(url, out, err):
+        host = url.split("/")[2]
+        with limiter.slot(host):
+            with lock:
+                active[host] += 1
+                peak[host] = max(peak[host], active[host])
+            time.sleep(0.01)
+            with lock:
+                active[host] -= 1
+        return 0
+
+    urls = [f"http://{'slow' if i % 2 else 'fast'}/{i}" for i in range(24)]
+    assert run_concurrent(urls, worker, jobs=8) == 0
+    assert peak == {"slow": 1, "fast": 3}
+
+
+class _SlowLines:
+    """Line iterator that blocks after ``first`` lines until ``release`` is set."""
+
+    def __init__(self, lines, first):
+        self.lines = lines
+        self.first = first
+        self.release = threading.Event()
+
+    def __iter__(self):
+        for i, line in enumerate(self.lines):
+            if i == self.first:
+                assert self.release.wait(5)
+            yield line
+
+
+def test_url_feed_is_bounded_and_skips_blank_lines():
+    source = _SlowLines([f"http://a.example/{i}\n" for i in range(50)] + ["\n", "  \n"], 50)
+    source.release.set()
+    feed = UrlFeed(source, maxsize=4)
+    time.sleep(0.1)
+    assert feed._queue.qsize() <= 4  # pylint: disable=protected-access
+    assert list(feed) == [f"http://a.example/{i}" for i in range(50)]
+    assert feed.ready()
+    feed.close()
+
+
+def test_url_feed_raises_read_errors_after_earlier_urls():
+    def lines():
+        yield "http://a.example/1\n"
+        raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+    feed = UrlFeed(lines())
+    it = iter(feed)
+    assert next(it) == "http://a.example/1"
+    with pytest.raises(UnicodeDecodeError):
+        next(it)
+
+
+def test_run_concurrent_starts_before_input_ends():
+    source = _SlowLines(["http://a.example/1\n", "http://a.example/2\n"], 1)
+    feed = UrlFeed(source)
+    seen = []
+
+    def worker(url, out, err):
+        seen.append(url)
+        source.release.set()
+        return 0
+
+    assert run_concurrent(feed, worker, 2, feed.ready) == 0
+    assert seen == ["http://a.example/1", "http://a.example/2"]
+    feed.close()
+
+
+@patch("requests.Session.get")
+def test_batch_reads_urls_from_stdin(mock_get, monkeypatch, capsys):
+    mock_get.side_effect = lambda url, **kw: _response(f"<h1>{url}</h1>".encode())
+    monkeypatch.setattr("sys.stdin", io.StringIO("http://a.example/1\n\nhttp://b.example/2\n"))
+
+    assert cli.main(["--batch", "-", "--jobs", "2"]) == 0
+
+    assert sorted(c.args[0] for c in mock_get.call_args_list) == \
+        ["http://a.example/1", "http://b.example/2"]
+    assert "# http://b.example/2" in capsys.readouterr().out
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="named pipes need POSIX")
+@patch("requests.Session.get")
+def test_batch_reads_named_pipe_as_lines_arrive(mock_get, tmp_path):
+    fifo = tmp_path / "urls.fifo"
+    os.mkfifo(fifo)
+    fetched = threading.Event()
+
+    def respond(url, **kw):
+        fetched.set()
+        return _response(b"<p>ok</p>")
+
+    mock_get.side_effect = respond
+
+    def produce():
+        with open(fifo, "w", encoding="utf-8") as f:
+            f.write("http://a.example/1\n")
+            f.flush()
+            # The second line is only written once the first URL was fetched.
+            assert fetched.wait(5)
+            f.write("http://a.example/2\n")
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    assert cli.main(["--batch", str(fifo)]) == 0
+    producer.join()
+    assert mock_get.call_count == 2
+
+
+def test_batch_file_not_found(tmp_path, capsys):
+    assert cli.main(["--batch", str(tmp_path / "missing.txt")]) == 1
+    assert "Batch file not found" in capsys.readouterr().err
@@ -0,0 +1,73 @@
+"""Tests for URL canonicalization and batch dedupe."""
+
+import hashlib
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from html2md import cli
+from html2md.dedupe import BloomFilter, Deduper, canonicalize, unique_urls
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTP://Example.COM:80/a#top", "http://example.com/a"),
+    ("https://example.com:443", "https://example.com/"),
+    ("https://example.com:8443/A/?b=1", "https://example.com:8443/A?b=1"),
+    ("https://example.com/p?utm_source=x&id=7&UTM_Medium=y&fbclid=z",
+     "https://example.com/p?id=7"),
+    ("https://example.com/p?utm_source=x", "https://example.com/p"),
+    ("https://user:pw@Example.com/p", "https://user:pw@example.com/p"),
+    ("http://[::1]:8080/x", "http://[::1]:8080/x"),
+    ("  ftp://Example.com/x#y ", "ftp://Example.com/x#y"),
+    ("http://[bad/x", "http://[bad/x"),
+])
+def test_canonicalize(url, expected):
+    assert canonicalize(url) == expected
+
+
+def test_canonicalize_rules_are_configurable():
+    url = "https://example.com/p?b=2&utm_source=x&a=1&ref=home"
+    assert canonicalize(url, strip_params=()) == url
+    assert canonicalize(url, strip_params=("ref", "utm_*"), sort_query=True) == \
+        "https://example.com/p?a=1&b=2"
+
+
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    digests = [hashlib.blake2b(str(i).encode(), digest_size=16).digest() for i in range(20000)]
+    for d in digests[:10000]:
+        bloom.add(d)
+    assert all(bloom.add(d) for d in digests[:10000])
+    false_positives = sum(d in bloom for d in digests[10000:])
+    assert false_positives < 10000 * 0.03
+
+
+@pytest.mark.parametrize("mode", ["exact", "bloom", "auto"])
+def test_unique_urls_counts_duplicates(mode):
+    deduper = Deduper(mode, capacity=1000, error_rate=1e-6, max_exact=3)
+    urls = [f"https://Example.com/{i % 5}?utm_campaign={i}#f{i}" for i in range(20)]
+    assert list(unique_urls(urls, deduper)) == [f"https://example.com/{i}" for i in range(5)]
+    assert (deduper.unique, deduper.duplicates) == (5, 15)
+    assert deduper.structure == ("exact" if mode == "exact" else "bloom")
+
+
+@patch("requests.Session.get")
+def test_cli_dedupe_skips_variants_before_fetching(mock_get, tmp_path, capsys):
+    def respond(url, **kw):
+        response = MagicMock()
+        response.headers = {}
+        response.encoding = "utf-8"
+        response.iter_content.return_value = [b"<p>ok</p>"]
+        return response
+
+    mock_get.side_effect = respond
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://a.example/x\nHTTP://A.example:80/x#frag\n"
+                     "http://a.example/x?utm_source=news\nhttp://a.example/y?ref=1\n"
+                     "http://a.example/y?ref=1&gclid=abc\n", encoding="utf-8")
+
+    assert cli.main(["--batch", str(batch), "--dedupe"]) == 0
+
+    assert [c.args[0] for c in mock_get.call_args_list] == \
+        ["http://a.example/x", "http://a.example/y?ref=1"]
+    assert "Dedupe: 3 duplicate URLs skipped, 2 unique (exact)" in capsys.readouterr().err
@@ -0,0 +1,81 @@
+"""Parity tests for the pluggable conversion engines."""
+
+import re
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from html2md import cli
+from html2md.convert import ENGINES, Engine, FastEngine, MarkdownifyEngine, convert_html, get_engine
+from html2md.stream import convert as convert_with_stdlib
+
+CORPUS = sorted((Path(__file__).parent / "fixtures" / "parity").glob("*.html"))
+
+
+def _normalize(markdown: str) -> str:
+    # markdownify leaves extra blank lines around HTML5 sectioning elements;
+    # they do not change the rendered document.
+    return re.sub(r"\n{3,}", "\n\n", markdown.strip())
+
+
+def test_parity_corpus_is_not_empty():
+    """The corpus ships with the tests."""
+    assert len(CORPUS) >= 5
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=lambda p: p.stem)
+def test_fast_engine_matches_markdownify(path):
+    """The fast engine renders every corpus document like markdownify."""
+    html = path.read_text(encoding="utf-8")
+    expected = _normalize(MarkdownifyEngine().convert(html))
+    assert _normalize(FastEngine().convert(html)) == expected
+    # The stdlib fallback must agree too, whether or not lxml is installed.
+    assert _normalize(convert_with_stdlib(html)) == expected
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=lambda p: p.stem)
+def test_fast_engine_lxml_backend_matches_markdownify(path):
+    """The lxml parser target renders every corpus document like markdownify."""
+    pytest.importorskip("lxml")
+    engine = FastEngine()
+    assert engine.backend == "lxml"
+    html = path.read_text(encoding="utf-8")
+    expected = _normalize(MarkdownifyEngine().convert(html))
+    assert _normalize(engine.convert(html)) == expected
+
+
+def test_engine_requires_convert():
+    """An engine without convert cannot be instantiated."""
+
+    class Partial(Engine):
+        name = "partial"
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_get_engine_and_worker_entry_point():
+    """Engines are looked up by name and usable from worker processes."""
+    assert set(ENGINES) == {"markdownify", "fast"}
+    assert get_engine("fast").name == "fast"
+    assert convert_html("<h1>x</h1>", engine="fast") == "# x"
+    with pytest.raises(KeyError):
+        get_engine("nope")
+
+
+@patch("requests.Session.get")
+def test_cli_engine_fast_skips_markdownify(mock_get, capsys):
+    """--engine fast converts without calling markdownify."""
+    response = MagicMock()
+    response.headers = {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = [b"<h1>Title</h1><p>Body</p>"]
+    mock_get.return_value = response
+
+    with patch("markdownify.markdownify") as mock_md:
+        ret = cli.main(["--url", "http://example.com", "--engine", "fast"])
+
+    assert ret == 0
+    mock_md.assert_not_called()
+    assert "# Title\n\nBody" in capsys.readouterr().out
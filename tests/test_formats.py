@@ -0,0 +1,152 @@
+"""Tests for parse-once multi-format output (--formats)."""
+
+import json
+from concurrent.futures import Future
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from html2md import cli
+from html2md.convert import FastEngine
+from html2md.formats import Document, blocks, parse_formats, render_markdown, render_text
+
+HTML = """<html><head><title>Doc &amp; Co</title><style>p {}</style></head><body>
+<h1>Hello <em>world</em></h1>
+<p>Some <b>bold</b> and <a href="http://example.com/">a link</a>.<br>Next line</p>
+<ul><li>one</li><li>two<ol><li>inner</li></ol></li></ul>
+<pre>code
+  indented</pre>
+<table><tr><th>A</th><th>B</th></tr><tr><td>1</td><td>2</td></tr></table>
+</body></html>"""
+
+
+def test_parse_formats():
+    assert parse_formats("md, TXT,md,pdf") == ["md", "txt", "pdf"]
+    with pytest.raises(ValueError):
+        parse_formats("md,docx")
+    with pytest.raises(ValueError):
+        parse_formats(" , ")
+
+
+def test_markdown_matches_fast_engine():
+    assert render_markdown(Document.parse(HTML)) == FastEngine().convert(HTML)
+
+
+def test_text_and_blocks_come_from_the_same_parse():
+    doc = Document.parse(HTML)
+    assert doc.title() == "Doc & Co"
+    assert [b.kind for b in blocks(doc)] == ["heading", "para", "item", "item", "item",
+                                             "pre", "table"]
+    assert render_text(doc) == (
+        "Hello world\n===========\n\n"
+        "Some bold and a link.\nNext line\n\n"
+        "• one\n• two\n  1. inner\n\n"
+        "code\n  indented\n\n"
+        "A\tB\n1\t2\n"
+    )
+
+
+def _respond(url, **kw):
+    response = MagicMock()
+    response.headers = {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = [HTML.encode()]
+    return response
+
+
+@patch("requests.Session.get")
+def test_cli_writes_every_format_from_one_fetch(mock_get, tmp_path):
+    mock_get.side_effect = _respond
+
+    assert cli.main(["--url", "http://example.com/page", "--outdir", str(tmp_path),
+                     "--formats", "md,txt,pdf"]) == 0
+
+    assert mock_get.call_count == 1
+    assert (tmp_path / "page.md").read_text(encoding="utf-8").startswith("Doc & Co")
+    assert (tmp_path / "page.txt").read_text(encoding="utf-8").startswith("Hello world")
+    assert (tmp_path / "page.pdf").read_bytes().startswith(b"%PDF")
+    assert not list(tmp_path.glob("*.part"))
+
+
+@patch("requests.Session.get")
+def test_cli_text_only_to_stdout(mock_get, capsys):
+    mock_get.side_effect = _respond
+
+    assert cli.main(["--url", "http://example.com/page", "--formats", "txt"]) == 0
+
+    out = capsys.readouterr().out
+    assert "• one" in out
+    assert "**bold**" not in out
+
+
+@patch("requests.Session.get")
+def test_cli_failed_pdf_is_retried_on_resume(mock_get, tmp_path, capsys):
+    mock_get.side_effect = _respond
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://example.com/doc\n", encoding="utf-8")
+    outdir = tmp_path / "out"
+    (outdir / "doc.pdf").mkdir(parents=True)  # the PDF cannot replace a directory
+    args = ["--batch", str(batch), "--outdir", str(outdir), "--formats", "md,pdf", "--resume"]
+
+    assert cli.main(args) == 1
+    assert "PDF rendering failed" in capsys.readouterr().err
+    assert (outdir / "doc.md").exists()
+
+    (outdir / "doc.pdf").rmdir()
+    assert cli.main(args) == 0
+    assert "Resume: 0 URLs already done" in capsys.readouterr().err
+    assert (outdir / "doc.pdf").read_bytes().startswith(b"%PDF")
+
+
+class _HeldPdfs:
+    """PdfWriter stand-in whose PDFs only finish when it is closed."""
+
+    def __init__(self, workers):
+        self.submitted = []
+
+    def submit(self, doc, path):
+        future = Future()
+        self.submitted.append((future, path))
+        return future
+
+    def close(self):
+        for future, path in self.submitted:
+            if not future.done():
+                path.write_bytes(b"%PDF-held")
+                future.set_result(None)
+        return 0
+
+
+@patch("requests.Session.get")
+def test_cli_pages_move_on_while_their_pdf_renders(mock_get, tmp_path):
+    mock_get.side_effect = _respond
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://example.com/a\nhttp://example.com/b\n", encoding="utf-8")
+    outdir = tmp_path / "out"
+    log = tmp_path / "run.jsonl"
+    writers = []
+
+    def held(workers):
+        writers.append(_HeldPdfs(workers))
+        return writers[-1]
+
+    with patch("html2md.cli.PdfWriter", side_effect=held):
+        assert cli.main(["--batch", str(batch), "--outdir", str(outdir), "--formats", "md,pdf",
+                         "--log", str(log)]) == 0
+
+    # Page b was converted and its PDF queued while a's PDF was still pending.
+    assert [path.name for _, path in writers[0].submitted] == ["a.pdf", "b.pdf"]
+    records = [json.loads(line) for line in log.read_text(encoding="utf-8").splitlines()]
+    assert [(r["input"][-1], r["status"]) for r in records] == [("a", "ok"), ("b", "ok")]
+
+
+@pytest.mark.parametrize("args, message", [
+    (["--formats", "md,rtf"], "unknown format 'rtf'"),
+    (["--formats", "pdf"], "--formats pdf needs --outdir"),
+    (["--formats", "md", "--stream"], "cannot be combined with --stream"),
+    (["--formats", "md", "--outdir", "o", "--sink", "tar"], "cannot be combined with --sink"),
+    (["--formats", "md", "--engine", "markdownify"], "cannot be combined with --engine"),
+])
+def test_cli_formats_validation(args, message, capsys):
+    assert cli.main(["--url", "http://example.com/"] + args) == 1
+    assert message in capsys.readouterr().err
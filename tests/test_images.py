@@ -0,0 +1,225 @@
+"""Tests for local, content-addressed page images (--images)."""
+
+import hashlib
+import io
+import threading
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from PIL import Image
+
+from html2md import cli
+from html2md.images import (BudgetExceeded, ByteBudget, ImageStore, image_format,
+                            process_image)
+
+
+def _png(width=4, height=4, color=(255, 0, 0)):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+LOGO = _png()
+
+
+def _response(body, headers=None):
+    response = MagicMock()
+    response.headers = headers or {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = [body[i:i + 8192] for i in range(0, len(body), 8192)]
+    return response
+
+
+class _Session:
+    """Serves fixed bodies by URL and counts requests."""
+
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.calls = []
+
+    def get(self, url, **kw):
+        self.calls.append(url)
+        return _response(self.bodies[url])
+
+
+def test_image_format_and_budget():
+    assert image_format(LOGO) == "png"
+    assert image_format(b"\xff\xd8\xff\xe0....") == "jpg"
+    assert image_format(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "webp"
+    assert image_format(b"<svg/>") is None
+    budget = ByteBudget(10)
+    assert budget.take(6) and not budget.take(5) and budget.take(4)
+    assert ByteBudget(None).take(10 ** 12)
+
+
+def test_process_image_downscales_large_images():
+    big = _png(3000, 1000)
+    with Image.open(io.BytesIO(process_image(big, "png", 1600, 85))) as image:
+        assert image.size == (1600, 533)
+    assert process_image(LOGO, "png", 1600, 85) == LOGO
+
+
+def test_store_fetches_each_url_once_and_dedupes_content(tmp_path):
+    session = _Session({
+        "http://cdn.example/logo.png": LOGO,
+        "http://other.example/copy.png": LOGO,
+        "http://cdn.example/page.html": b"<html></html>",
+    })
+    store = ImageStore(tmp_path / "images", session, max_bytes=1 << 20)
+    digest = hashlib.sha256(LOGO).hexdigest()
+    local = f"images/{digest[:2]}/{digest}.png"
+    try:
+        first = store.localize('![logo](/logo.png "Logo") ![x](http://cdn.example/page.html)',
+                               "http://cdn.example/a")
+        second = store.localize("![a](http://cdn.example/logo.png) "
+                                "![b](http://other.example/copy.png) ![c](data:x)",
+                                "http://cdn.example/b")
+    finally:
+        store.close()
+
+    assert first == f'![logo]({local} "Logo") ![x](http://cdn.example/page.html)'
+    assert second == f"![a]({local}) ![b]({local}) ![c](data:x)"
+    assert sorted(session.calls) == ["http://cdn.example/logo.png",
+                                     "http://cdn.example/page.html",
+                                     "http://other.example/copy.png"]
+    assert (tmp_path / local).read_bytes() == LOGO
+    assert (store.fetched, store.stored) == (3, 1)
+
+
+def test_store_budgets_and_size_cap_keep_remote_links(tmp_path):
+    big = _png(64, 64, (1, 2, 3)) + b"\0" * 5000
+    session = _Session({"http://a/big.png": big, "http://a/small.png": LOGO})
+    store = ImageStore(tmp_path, session, max_bytes=1 << 20, page_budget=len(LOGO) + 100)
+    capped = ImageStore(tmp_path, session, max_bytes=len(LOGO) - 1)
+    try:
+        markdown = "![](http://a/big.png) ![](http://a/small.png)"
+        result = store.localize(markdown, "http://a/")
+        assert "(http://a/big.png)" in result
+        assert "(http://a/small.png)" not in result
+        assert store.skipped == 1
+        assert capped.localize("![](http://a/small.png)", "http://a/") == \
+            "![](http://a/small.png)"
+    finally:
+        store.close()
+        capped.close()
+
+
+def test_total_budget_refusal_does_not_charge_the_page(tmp_path):
+    session = _Session({"http://a/logo.png": LOGO})
+    store = ImageStore(tmp_path, session, max_bytes=1 << 20, page_budget=1 << 20,
+                       total_budget=len(LOGO) - 1)
+    try:
+        budget = ByteBudget(1 << 20)
+        with pytest.raises(BudgetExceeded):
+            store._download("http://a/logo.png", budget)
+        assert budget.used == 0
+    finally:
+        store.close()
+
+
+def test_waiters_retry_a_download_over_another_pages_budget(tmp_path):
+    release = threading.Event()
+
+    class Held(_Session):
+        def get(self, url, **kw):
+            release.wait(5)
+            return super().get(url, **kw)
+
+    session = Held({"http://a/logo.png": LOGO})
+    store = ImageStore(tmp_path, session, max_bytes=1 << 20)
+    try:
+        small, roomy = ByteBudget(1), ByteBudget(None)
+        owned = store._lookup("http://a/logo.png", small)
+        joined = store._lookup("http://a/logo.png", roomy)
+        assert (owned[1], joined[1]) == (True, False)
+        release.set()
+        assert store._resolve("http://a/logo.png", small, *owned) is None
+        assert store._resolve("http://a/logo.png", roomy, *joined).endswith(".png")
+    finally:
+        store.close()
+    assert len(session.calls) == 2
+
+
+def test_transient_failures_are_not_remembered(tmp_path):
+    class Dropping(_Session):
+        def get(self, url, **kw):
+            if not self.calls:
+                self.calls.append(url)
+                raise requests.exceptions.ConnectionError("reset")
+            return super().get(url, **kw)
+
+    session = Dropping({"http://a/logo.png": LOGO})
+    store = ImageStore(tmp_path, session, max_bytes=1 << 20)
+    try:
+        assert store.localize("![](http://a/logo.png)", "http://a/") == \
+            "![](http://a/logo.png)"
+        assert store.failed == 1
+        assert "images/" in store.localize("![](http://a/logo.png)", "http://a/")
+    finally:
+        store.close()
+
+
+def test_store_honours_robots_and_host_slots(tmp_path):
+    session = _Session({"http://a/logo.png": LOGO, "http://b/logo.png": LOGO})
+    slots = []
+
+    @contextmanager
+    def slot(url):
+        slots.append(url)
+        yield
+
+    store = ImageStore(tmp_path, session, max_bytes=1 << 20,
+                       allowed=lambda url: not url.startswith("http://b/"), slot=slot)
+    try:
+        result = store.localize("![](http://a/logo.png) ![](http://b/logo.png)", "http://a/")
+    finally:
+        store.close()
+
+    assert "(http://b/logo.png)" in result and "(http://a/logo.png)" not in result
+    assert session.calls == slots == ["http://a/logo.png"]
+    assert store.disallowed == 1
+
+
+@patch("requests.Session.get")
+def test_cli_images_rewrites_links_to_local_copies(mock_get, tmp_path, capsys):
+    pages = {
+        "http://example.com/a": b'<p>A</p><img src="/logo.png" alt="logo">',
+        "http://example.com/b": b'<p>B</p><img src="http://example.com/logo.png" alt="logo">',
+        "http://example.com/logo.png": LOGO,
+    }
+    mock_get.side_effect = lambda url, **kw: _response(pages[url])
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://example.com/a\nhttp://example.com/b\n", encoding="utf-8")
+    outdir = tmp_path / "out"
+
+    assert cli.main(["--batch", str(batch), "--outdir", str(outdir), "--images",
+                     "--engine", "fast"]) == 0
+
+    digest = hashlib.sha256(LOGO).hexdigest()
+    for name in ("a.md", "b.md"):
+        assert f"![logo](images/{digest[:2]}/{digest}.png)" in \
+            (outdir / name).read_text(encoding="utf-8")
+    assert [c.args[0] for c in mock_get.call_args_list].count("http://example.com/logo.png") == 1
+    assert "Images: 1 fetched, 1 stored" in capsys.readouterr().err
+
+
+def test_cli_closes_the_image_store_when_a_later_resource_fails(tmp_path, capsys):
+    with patch("html2md.cli.ImageStore") as store, \
+            patch("html2md.cli.PdfWriter", side_effect=OSError("no workers")):
+        assert cli.main(["--url", "http://example.com/", "--outdir", str(tmp_path),
+                         "--images", "--formats", "md,pdf"]) == 1
+
+    assert "Error opening 'PDF workers': no workers" in capsys.readouterr().err
+    store.return_value.close.assert_called_once_with()
+
+
+@pytest.mark.parametrize("args, message", [
+    (["--images"], "--images needs --outdir"),
+    (["--images", "--outdir", "o", "--stream"], "cannot be combined with --stream"),
+    (["--images", "--outdir", "o", "--image-quality", "0"], "between 1 and 95"),
+])
+def test_cli_images_validation(args, message, capsys):
+    assert cli.main(["--url", "http://example.com/"] + args) == 1
+    assert message in capsys.readouterr().err
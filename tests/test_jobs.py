@@ -0,0 +1,185 @@
+"""Tests for background batch jobs and the /jobs endpoints."""
+
+import json
+import sqlite3
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from html2md import app as app_module
+from html2md.jobs import JobRunner, JobStore, QueueFull
+
+
+def _wait_done(status_of, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = status_of()
+        if status["status"] == "done":
+            return status
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_runner_records_results_and_errors(tmp_path):
+    """Each URL gets its Markdown or the error its conversion raised."""
+    def convert(url):
+        if "bad" in url:
+            raise ValueError("boom")
+        return f"# {url}"
+
+    runner = JobRunner(JobStore(tmp_path / "jobs.sqlite3"), convert, workers=2)
+    job_id = runner.submit(["http://a/1", "http://a/bad", "http://a/3"])
+    status = _wait_done(lambda: runner.store.status(job_id))
+
+    assert (status["total"], status["completed"], status["failed"]) == (3, 3, 1)
+    assert status["results"][1] == {"url": "http://a/bad", "status": "error", "error": "boom"}
+    outputs = list(runner.store.outputs(job_id, batch=2))
+    assert [o["markdown"] for o in outputs] == ["# http://a/1", None, "# http://a/3"]
+
+
+def test_runner_rejects_jobs_beyond_queue_depth(tmp_path):
+    """Jobs that would overflow max_pending are refused until the queue drains."""
+    release = threading.Event()
+    runner = JobRunner(JobStore(tmp_path / "jobs.sqlite3"),
+                       lambda url: release.wait() and "", workers=1, max_pending=2)
+    first = runner.submit(["http://a/1", "http://a/2"])
+    with pytest.raises(QueueFull):
+        runner.submit(["http://a/3", "http://a/4"])
+    release.set()
+    _wait_done(lambda: runner.store.status(first))
+    assert runner.pending == 0
+    runner.submit(["http://a/3", "http://a/4"])
+
+
+def test_runner_resumes_jobs_of_a_runner_that_went_away(tmp_path):
+    """Pending URLs of a job whose runner stopped heartbeating are run again."""
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    # "gone" has no heartbeat on record, "alive" has a current one.
+    job_id = store.create(["http://a/1", "http://a/2"], owner="gone")
+    store.finish(job_id, 0, "# done before the restart")
+    live = store.create(["http://a/3"], owner="alive")
+    store.beat("alive")
+    converted = []
+
+    def convert(url):
+        converted.append(url)
+        return f"# {url}"
+
+    runner = JobRunner(store, convert)
+    status = _wait_done(lambda: store.status(job_id))
+
+    assert converted[0] == "http://a/2"
+    assert status["results"][0]["status"] == "ok"
+    assert [o["markdown"] for o in store.outputs(job_id)] == \
+        ["# done before the restart", "# http://a/2"]
+    assert runner.pending == 0
+    # A runner that keeps heartbeating keeps its jobs.
+    assert store.adopt(runner.id, lease=60) == []
+    assert store.status(live)["status"] == "queued"
+
+
+def test_runner_retries_failed_result_writes(tmp_path):
+    """A result that cannot be stored is retried, then the URL is marked failed."""
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    real_finish = store.finish
+    calls = []
+
+    def flaky_finish(job_id, idx, markdown, error=None):
+        calls.append(idx)
+        if idx == 1 or len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        real_finish(job_id, idx, markdown, error)
+
+    store.finish = flaky_finish
+    runner = JobRunner(store, lambda url: f"# {url}", workers=1)
+    job_id = runner.submit(["http://a/1"])
+    assert _wait_done(lambda: store.status(job_id))["results"][0]["status"] == "ok"
+
+    def failing_finish(job_id, idx, markdown, error=None):
+        if markdown is not None:
+            raise sqlite3.DataError("string or blob too big")
+        real_finish(job_id, idx, markdown, error)
+
+    store.finish = failing_finish
+    job_id = runner.submit(["http://a/2"])
+    result = _wait_done(lambda: store.status(job_id))["results"][0]
+    assert result["status"] == "error"
+    assert result["error"] == "Could not store the result: string or blob too big"
+
+
+def test_store_purges_old_jobs(tmp_path):
+    """Jobs past the retention period are deleted with their results."""
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    old = store.create(["http://a/1"])
+    assert store.purge(time.time() - 60) == 0
+    assert store.purge(time.time() + 1) == 1
+    assert store.status(old) is None
+    assert list(store.outputs(old)) == []
+
+
+@pytest.fixture(name="client")
+def client_fixture(tmp_path, monkeypatch):
+    monkeypatch.setenv("HTML2MD_JOB_DB", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(app_module, "_job_runner", None)
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        yield client
+
+
+def _response(html: bytes) -> MagicMock:
+    response = MagicMock()
+    response.headers = {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = [html]
+    response.raise_for_status.return_value = None
+    return response
+
+
+def test_job_api_round_trip(client):
+    """POST /jobs queues URLs; status and streamed outputs report per-URL results."""
+    with patch.object(app_module.session, "get",
+                      side_effect=lambda url, **kw: _response(f"<h1>{url}</h1>".encode())):
+        resp = client.post("/jobs", json={"urls": ["http://a.example/x", "ftp://b.example/y"]})
+        assert resp.status_code == 202
+        job_id = resp.get_json()["id"]
+        assert resp.headers["Location"] == f"/jobs/{job_id}"
+        status = _wait_done(lambda: client.get(f"/jobs/{job_id}").get_json())
+
+    assert (status["completed"], status["failed"]) == (2, 1)
+    assert "Unsupported URL scheme 'ftp'" in status["results"][1]["error"]
+
+    resp = client.get(f"/jobs/{job_id}/output")
+    assert resp.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert lines[0]["markdown"] == "# http://a.example/x"
+    assert lines[1]["status"] == "error"
+
+
+def test_job_api_returns_429_when_saturated(client, monkeypatch):
+    """A full queue answers 429 with Retry-After while /health keeps working."""
+    monkeypatch.setenv("HTML2MD_JOB_QUEUE", "1")
+    monkeypatch.setenv("HTML2MD_JOB_WORKERS", "1")
+    release = threading.Event()
+    monkeypatch.setattr(app_module, "convert_url", lambda url: release.wait() and "")
+    try:
+        assert client.post("/jobs", json={"urls": ["http://a/1"]}).status_code == 202
+        # Wait for the only worker thread to pick the first URL up.
+        while app_module.get_job_runner().pending:
+            time.sleep(0.01)
+        assert client.post("/jobs", json={"urls": ["http://a/2"]}).status_code == 202
+        resp = client.post("/jobs", json={"urls": ["http://a/3"]})
+        assert resp.status_code == 429
+        assert resp.headers["Retry-After"] == "30"
+        assert client.get("/health").status_code == 200
+    finally:
+        release.set()
+
+
+def test_job_api_validates_input(client):
+    """Malformed bodies and unknown ids are client errors."""
+    assert client.post("/jobs", json={"urls": []}).status_code == 400
+    assert client.post("/jobs", json={"urls": "http://a"}).status_code == 400
+    assert client.get("/jobs/nope").status_code == 404
+    assert client.get("/jobs/nope/output").status_code == 404
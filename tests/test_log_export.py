@@ -1,7 +1,14 @@
 """Tests for log export functionality."""
 
+import argparse
 import json
 import csv
+import sqlite3
+import threading
+import time
+
+import pytest
+
 from html2md.log_export import main  # type: ignore
 
 
@@ -201,3 +208,349 @@ def test_log_export_sanitizes_leading_whitespace_formula(tmp_path):
         rows = list(reader)
         assert len(rows) == 1
         assert rows[0]['safe'] == "'\t=1+1"
+
+
+def test_log_export_workers_output_is_byte_identical(tmp_path, monkeypatch):
+    """--workers N writes exactly the serial CSV, in input order."""
+    from html2md import log_export  # type: ignore  # pylint: disable=import-outside-toplevel
+
+    input_file = tmp_path / "big.jsonl"
+    lines = []
+    for i in range(200):
+        lines.append(json.dumps({"ts": str(i), "input": f"=cmd{i}", "status": "ok",
+                                 "reason": "café ✓" if i % 7 else None}))
+        if i % 13 == 0:
+            lines.append("not valid json")
+        if i % 17 == 0:
+            lines.append("")
+        if i % 19 == 0:
+            lines.append("[1, 2]")
+    # Mixed line endings and no trailing newline.
+    input_file.write_bytes(("\r\n".join(lines[:100]) + "\n" + "\n".join(lines[100:]))
+                           .encode("utf-8"))
+
+    serial = tmp_path / "serial.csv"
+    parallel = tmp_path / "parallel.csv"
+    assert main(["--in", str(input_file), "--out", str(serial)]) == 0
+    # Tiny shards so the file is split into many newline-aligned ranges.
+    monkeypatch.setattr(log_export, "_SHARD_BYTES", 97)
+    assert main(["--in", str(input_file), "--out", str(parallel), "--workers", "3"]) == 0
+
+    assert parallel.read_bytes() == serial.read_bytes()
+
+
+def test_log_export_shard_ranges_are_newline_aligned():
+    """Shard ranges cover the input exactly and end after a newline."""
+    from html2md.log_export import _shard_ranges  # type: ignore  # pylint: disable=import-outside-toplevel
+
+    data = b"aa\nbbbbbbbb\nc\n\nddd"
+    ranges = _shard_ranges(data, len(data), 4)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert all(data[end - 1:end] == b"\n" for _, end in ranges[:-1])
+
+
+def test_log_export_workers_empty_input(tmp_path):
+    """An empty log exports just the header in parallel mode too."""
+    input_file = tmp_path / "empty.jsonl"
+    input_file.write_bytes(b"")
+    output_file = tmp_path / "empty.csv"
+    assert main(["--in", str(input_file), "--out", str(output_file), "--workers", "2"]) == 0
+    assert output_file.read_text(encoding="utf-8") == "ts,input,output,status,reason\n"
+
+
+def _rows(path):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.reader(f))
+
+
+def _append(path, *records, raw=""):
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+        f.write(raw)
+
+
+def test_log_export_since_checkpoint_appends_only_new_rows(tmp_path):
+    """Later runs append rows for new complete lines, without a second header."""
+    log = tmp_path / "run.jsonl"
+    out = tmp_path / "run.csv"
+    argv = ["--in", str(log), "--out", str(out), "--fields", "ts", "--since-checkpoint"]
+    _append(log, {"ts": "1"}, {"ts": "2"})
+    assert main(argv) == 0
+    assert _rows(out) == [["ts"], ["1"], ["2"]]
+    state = json.loads((tmp_path / "run.csv.checkpoint.json").read_text(encoding="utf-8"))
+    assert state["offset"] == log.stat().st_size
+
+    _append(log, {"ts": "3"}, raw='{"ts": "4"')  # last line still being written
+    assert main(argv) == 0
+    assert _rows(out) == [["ts"], ["1"], ["2"], ["3"]]
+
+    _append(log, raw="}\n")
+    assert main(argv) == 0
+    assert _rows(out) == [["ts"], ["1"], ["2"], ["3"], ["4"]]
+
+
+def test_log_export_since_checkpoint_restarts_after_rotation(tmp_path):
+    """A truncated or rewritten log is exported again from its start."""
+    log = tmp_path / "run.jsonl"
+    out = tmp_path / "run.csv"
+    argv = ["--in", str(log), "--out", str(out), "--fields", "ts", "--since-checkpoint"]
+    _append(log, {"ts": "1"}, {"ts": "2"})
+    main(argv)
+
+    log.write_text(json.dumps({"ts": "9"}) + "\n", encoding="utf-8")  # truncated
+    main(argv)
+    assert _rows(out) == [["ts"], ["1"], ["2"], ["9"]]
+
+    # Same length, different content: the last-line hash no longer matches.
+    log.write_text(json.dumps({"ts": "8"}) + "\n", encoding="utf-8")
+    main(argv)
+    assert _rows(out) == [["ts"], ["1"], ["2"], ["9"], ["8"]]
+
+
+def test_log_export_since_checkpoint_drops_rows_after_checkpoint(tmp_path):
+    """Rows written by an interrupted run after its last checkpoint are replaced."""
+    log = tmp_path / "run.jsonl"
+    out = tmp_path / "run.csv"
+    argv = ["--in", str(log), "--out", str(out), "--fields", "ts", "--since-checkpoint"]
+    _append(log, {"ts": "1"})
+    main(argv)
+    with open(out, "a", encoding="utf-8", newline="") as f:
+        f.write("partial,row\r\n")
+    _append(log, {"ts": "2"})
+    main(argv)
+    assert _rows(out) == [["ts"], ["1"], ["2"]]
+
+
+def test_log_export_checkpoint_field_mismatch_is_an_error(tmp_path, capsys):
+    """A checkpoint cannot be resumed with a different field list."""
+    log = tmp_path / "run.jsonl"
+    out = tmp_path / "run.csv"
+    _append(log, {"ts": "1"})
+    main(["--in", str(log), "--out", str(out), "--fields", "ts", "--since-checkpoint"])
+    with pytest.raises(SystemExit):
+        main(["--in", str(log), "--out", str(out), "--fields", "ts,status",
+              "--since-checkpoint"])
+    assert "written for --fields ts" in capsys.readouterr().err
+
+
+def test_log_export_follow_tails_and_survives_rotation(tmp_path):
+    """--follow exports new lines as they arrive, across a rotation."""
+    from html2md import log_export  # type: ignore  # pylint: disable=import-outside-toplevel
+
+    log = tmp_path / "run.jsonl"
+    out = tmp_path / "run.csv"
+    _append(log, {"ts": "1"})
+    args = argparse.Namespace(checkpoint=None, follow=True, poll=0.01, workers=1)
+    stop = threading.Event()
+    thread = threading.Thread(target=log_export._export_incremental, args=(
+        args, log, out, ["ts"], ["ts"], ["ts"], stop.is_set))
+    thread.start()
+
+    def wait_rows(expected):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if out.exists() and _rows(out) == expected:
+                return
+            time.sleep(0.01)
+        raise AssertionError(_rows(out))
+
+    try:
+        wait_rows([["ts"], ["1"]])
+        _append(log, {"ts": "2"})
+        wait_rows([["ts"], ["1"], ["2"]])
+        _append(log, {"ts": "3"})
+        log.rename(tmp_path / "run.jsonl.1")
+        _append(log, {"ts": "4"})
+        wait_rows([["ts"], ["1"], ["2"], ["3"], ["4"]])
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_log_export_since_checkpoint_with_workers(tmp_path):
+    """Incremental runs can parse the new range in worker processes."""
+    log = tmp_path / "run.jsonl"
+    out = tmp_path / "run.csv"
+    argv = ["--in", str(log), "--out", str(out), "--fields", "ts", "--since-checkpoint",
+            "--workers", "2"]
+    _append(log, *({"ts": str(i)} for i in range(5)))
+    main(argv)
+    _append(log, *({"ts": str(i)} for i in range(5, 9)), raw='{"ts": "9"')
+    main(argv)
+    assert _rows(out) == [["ts"]] + [[str(i)] for i in range(9)]
+
+
+def _write_compressed(path, records):
+    import bz2  # pylint: disable=import-outside-toplevel
+    import gzip  # pylint: disable=import-outside-toplevel
+    import lzma  # pylint: disable=import-outside-toplevel
+
+    opener = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}.get(path.suffix, open)
+    with opener(path, "wt", encoding="utf-8") as f:
+        for rec in records:
+            f.write((rec if isinstance(rec, str) else json.dumps(rec)) + "\n")
+
+
+def test_log_export_globs_and_compressed_inputs(tmp_path):
+    """Globs expand in sorted order and compressed files are read in place."""
+    _write_compressed(tmp_path / "run.1.jsonl.gz", [{"ts": "1"}, "garbage"])
+    _write_compressed(tmp_path / "run.2.jsonl.bz2", [{"ts": "2"}])
+    _write_compressed(tmp_path / "run.3.jsonl.xz", [{"ts": "3"}, [1]])
+    _write_compressed(tmp_path / "current.jsonl", [{"ts": "4"}])
+    out = tmp_path / "out.csv"
+
+    assert main(["--in", str(tmp_path / "run.*.jsonl.*"), str(tmp_path / "current.jsonl"),
+                 "--out", str(out), "--fields", "ts"]) == 0
+
+    assert _rows(out) == [["ts"], ["1"], ["2"], ["3"], ["4"]]
+
+
+def test_log_export_merge_by_ts(tmp_path):
+    """--merge-by-ts interleaves ordered inputs by ts, keeping input order on ties."""
+    _write_compressed(tmp_path / "a.jsonl.gz", [
+        {"ts": "2024-01-01T00:00:01", "input": "a1"},
+        {"ts": "2024-01-01T00:00:03", "input": "a3"},
+        {"ts": "2024-01-01T00:00:05", "input": "a5"},
+    ])
+    _write_compressed(tmp_path / "b.jsonl", [
+        {"ts": "2024-01-01T00:00:02", "input": "b2"},
+        "not json",
+        {"ts": "2024-01-01T00:00:03", "input": "b3"},
+        {"ts": "2024-01-01T00:00:09", "input": "=b9"},
+    ])
+    out = tmp_path / "out.csv"
+
+    assert main(["--in", str(tmp_path / "a.jsonl.gz"), str(tmp_path / "b.jsonl"),
+                 "--out", str(out), "--fields", "input", "--merge-by-ts"]) == 0
+
+    assert [r[0] for r in _rows(out)] == ["input", "a1", "b2", "a3", "b3", "a5", "'=b9"]
+
+
+def test_log_export_rejects_unmatched_glob_and_bad_combinations(tmp_path, capsys):
+    """Empty globs and unsupported option combinations are usage errors."""
+    out = str(tmp_path / "out.csv")
+    with pytest.raises(SystemExit):
+        main(["--in", str(tmp_path / "none-*.jsonl"), "--out", out])
+    assert "no input matches" in capsys.readouterr().err
+
+    _write_compressed(tmp_path / "a.jsonl.gz", [{"ts": "1"}])
+    with pytest.raises(SystemExit):
+        main(["--in", str(tmp_path / "a.jsonl.gz"), "--out", out, "--workers", "2"])
+    with pytest.raises(SystemExit):
+        main(["--in", str(tmp_path / "a.jsonl.gz"), "--out", out, "--since-checkpoint"])
+
+
+def _dict_rows(path):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_log_export_group_by_aggregates_in_one_pass(tmp_path):
+    inp = tmp_path / "run.jsonl"
+    out = tmp_path / "summary.csv"
+    records = [
+        {"input": f"https://a.example/{i}", "status": "ok", "reason": "",
+         "fetch_ms": float(i + 1), "convert_ms": 2.0}
+        for i in range(100)
+    ] + [
+        {"input": "https://b.example/x", "status": "error", "reason": "=timeout",
+         "fetch_ms": 30000.0},
+        {"input": "https://b.example/x", "status": "error", "reason": "=timeout",
+         "fetch_ms": True},
+    ]
+    _append(inp, *records)
+
+    assert main(['--in', str(inp), '--out', str(out), '--group-by', 'status,reason,host']) == 0
+    rows = _dict_rows(out)
+    assert list(rows[0]) == ['status', 'reason', 'host', 'count', 'errors', 'error_rate',
+                             'fetch_ms_p50', 'fetch_ms_p95', 'fetch_ms_p99',
+                             'convert_ms_p50', 'convert_ms_p95', 'convert_ms_p99',
+                             'distinct_input']
+    ok, err = rows
+    assert (ok['host'], ok['count'], ok['errors'], ok['distinct_input']) == \
+        ('a.example', '100', '0', '100')
+    assert abs(float(ok['fetch_ms_p50']) - 50.5) <= 1.0
+    assert abs(float(ok['fetch_ms_p99']) - 99) <= 1.5
+    assert abs(float(ok['convert_ms_p95']) - 2.0) <= 0.02
+    # Formula-like values are escaped; booleans are not latencies.
+    assert (err['reason'], err['count'], err['error_rate']) == ("'=timeout", '2', '1.0')
+    assert abs(float(err['fetch_ms_p50']) - 30000) <= 300
+    assert err['convert_ms_p50'] == '' and err['distinct_input'] == '1'
+
+
+def test_log_export_group_by_folds_extra_groups(tmp_path, capsys):
+    inp = tmp_path / "run.jsonl"
+    out = tmp_path / "summary.csv"
+    _append(inp, *({"input": f"https://h{i % 3}.example/", "status": "ok"}
+                   for i in range(9)))
+
+    assert main(['--in', str(inp), '--out', str(out), '--group-by', 'host',
+                 '--max-groups', '2', '--latency-fields', '', '--distinct-field', '']) == 0
+    rows = _dict_rows(out)
+    assert list(rows[0]) == ['host', 'count', 'errors', 'error_rate']
+    assert sorted((r['host'], r['count']) for r in rows) == \
+        [('(other)', '3'), ('h0.example', '3'), ('h1.example', '3')]
+
+    with pytest.raises(SystemExit):
+        main(['--in', str(inp), '--out', str(out), '--group-by', 'host', '--workers', '2'])
+    assert '--group-by cannot be combined' in capsys.readouterr().err
+
+
+def test_log_export_sqlite_appends_and_indexes(tmp_path):
+    inp = tmp_path / "run.jsonl"
+    db = tmp_path / "runs.sqlite3"
+    _append(inp, {"ts": "1", "input": "=a", "status": "ok", "bytes": 10, "extra": {"k": 1}},
+            {"ts": "2", "input": "b", "status": "error", "reason": "timeout"},
+            raw="not json\n")
+    argv = ['--in', str(inp), '--out', str(db), '--format', 'sqlite',
+            '--fields', 'ts,input,status,reason,bytes,extra,ts']
+    assert main(argv) == 0
+    assert main(argv[:-1] + ['ts,input,status,reason,bytes,extra,ts,http_status']) == 0
+
+    con = sqlite3.connect(str(db))
+    try:
+        columns = [row[1] for row in con.execute('PRAGMA table_info(runs)')]
+        assert columns == ['record_sha256', 'ts', 'input', 'status', 'reason', 'bytes', 'extra',
+                           'ts_1', 'http_status']
+        rows = con.execute('SELECT input, status, reason, bytes, extra FROM runs').fetchall()
+        # Values are stored as-is: no CSV formula escaping, NULL for missing fields.
+        # The second export found every record already stored.
+        assert rows == [("=a", "ok", None, 10, '{"k": 1}'),
+                        ("b", "error", "timeout", None, None)]
+        indexes = {row[1] for row in con.execute('PRAGMA index_list(runs)')}
+        assert indexes == {'runs_record_sha256', 'runs_ts', 'runs_status', 'runs_input'}
+        plan = con.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM runs WHERE status = 'error'").fetchall()
+        assert 'runs_status' in str(plan)
+    finally:
+        con.close()
+
+
+def test_log_export_sqlite_rerun_adds_only_new_records(tmp_path):
+    inp = tmp_path / "run.jsonl"
+    db = tmp_path / "runs.sqlite3"
+    _append(inp, {"ts": "1", "input": "a"}, {"ts": "2", "input": "b"})
+    argv = ['--in', str(inp), '--out', str(db), '--format', 'sqlite']
+
+    def count():
+        con = sqlite3.connect(str(db))
+        try:
+            return con.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
+        finally:
+            con.close()
+
+    assert main(argv) == 0 and count() == 2
+    assert main(argv) == 0 and count() == 2
+    _append(inp, {"ts": "3", "input": "c"})
+    assert main(argv) == 0 and count() == 3
+
+
+def test_log_export_sqlite_rejects_unsupported_modes(tmp_path, capsys):
+    inp = tmp_path / "run.jsonl"
+    _append(inp, {"ts": "1"})
+    with pytest.raises(SystemExit):
+        main(['--in', str(inp), '--out', str(tmp_path / "x.db"), '--format', 'sqlite',
+              '--workers', '2'])
+    assert '--format sqlite cannot be combined' in capsys.readouterr().err
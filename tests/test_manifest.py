@@ -0,0 +1,87 @@
+"""Tests for the resumable batch manifest (--resume)."""
+
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from html2md import cli
+from html2md.manifest import DEFAULT_NAME, Manifest
+
+
+def _responder(failing=()):
+    def respond(url, **kw):
+        response = MagicMock()
+        response.headers = {}
+        response.encoding = "utf-8"
+        response.iter_content.return_value = [f"<p>{url}</p>".encode()]
+        if url in failing:
+            response.raise_for_status.side_effect = requests.HTTPError("500 Server Error")
+        return response
+    return respond
+
+
+def _batch(tmp_path, count=3):
+    batch = tmp_path / "urls.txt"
+    batch.write_text("".join(f"http://a.example/p{i}\n" for i in range(count)),
+                     encoding="utf-8")
+    return batch
+
+
+def test_manifest_records_and_checks_outputs(tmp_path):
+    out = tmp_path / "page.md"
+    out.write_text("hello", encoding="utf-8")
+    manifest = Manifest(tmp_path / "m.sqlite3")
+    manifest.record("http://a/ok", "ok", str(out), 5, "abc")
+    manifest.record("http://a/bad", "error", reason="HTTP 500")
+    manifest.record("http://a/robots", "skipped", reason="robots.txt")
+
+    assert manifest.is_done("http://a/ok")
+    assert not manifest.is_done("http://a/bad")
+    assert manifest.is_done("http://a/robots")
+    assert not manifest.is_done("http://a/never")
+    out.write_text("hel", encoding="utf-8")
+    assert not manifest.is_done("http://a/ok")
+    manifest.close()
+
+
+@patch("requests.Session.get")
+def test_resume_skips_completed_urls_and_retries_failures(mock_get, tmp_path, capsys):
+    batch = _batch(tmp_path)
+    outdir = tmp_path / "out"
+    mock_get.side_effect = _responder(failing={"http://a.example/p1"})
+
+    assert cli.main(["--batch", str(batch), "--outdir", str(outdir), "--resume"]) == 1
+    assert (outdir / DEFAULT_NAME).exists()
+    assert not list(outdir.glob("*.part"))
+
+    mock_get.reset_mock()
+    mock_get.side_effect = _responder()
+    assert cli.main(["--batch", str(batch), "--outdir", str(outdir), "--resume"]) == 0
+    assert [c.args[0] for c in mock_get.call_args_list] == ["http://a.example/p1"]
+    assert "Resume: 2 URLs already done, skipped." in capsys.readouterr().err
+
+    mock_get.reset_mock()
+    assert cli.main(["--batch", str(batch), "--outdir", str(outdir), "--resume"]) == 0
+    mock_get.assert_not_called()
+
+
+@patch("requests.Session.get")
+def test_resume_redoes_missing_or_truncated_outputs(mock_get, tmp_path):
+    batch = _batch(tmp_path)
+    outdir = tmp_path / "out"
+    mock_get.side_effect = _responder()
+    assert cli.main(["--batch", str(batch), "--outdir", str(outdir), "--resume"]) == 0
+
+    outputs = sorted(p for p in outdir.glob("*.md"))
+    assert len(outputs) == 3
+    outputs[0].unlink()
+    outputs[1].write_text(outputs[1].read_text(encoding="utf-8")[:3], encoding="utf-8")
+
+    mock_get.reset_mock()
+    assert cli.main(["--batch", str(batch), "--outdir", str(outdir), "--resume"]) == 0
+    assert mock_get.call_count == 2
+
+
+def test_resume_needs_a_manifest_location(tmp_path, capsys):
+    assert cli.main(["--batch", str(_batch(tmp_path)), "--resume"]) == 1
+    assert "--resume needs --outdir or --manifest" in capsys.readouterr().err
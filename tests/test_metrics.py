@@ -0,0 +1,101 @@
+"""Tests for service metrics and the CLI --stats summary."""
+
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+from html2md import app as app_module
+from html2md import cli
+from html2md.metrics import Registry, collect, render, write_snapshot
+
+
+def test_render_prometheus_histogram_and_labels():
+    """Histograms render cumulative buckets, sum and count; labels are escaped."""
+    registry = Registry()
+    registry.observe("html2md_fetch_seconds", 0.02)
+    registry.observe("html2md_fetch_seconds", 3.0)
+    registry.inc("html2md_requests_total", endpoint='x"y', status="200")
+    text = render(collect(registry))
+
+    assert "# TYPE html2md_fetch_seconds histogram" in text
+    assert 'html2md_fetch_seconds_bucket{le="0.025"} 1' in text
+    assert 'html2md_fetch_seconds_bucket{le="5"} 2' in text
+    assert 'html2md_fetch_seconds_bucket{le="+Inf"} 2' in text
+    assert "html2md_fetch_seconds_count 2" in text
+    assert 'html2md_requests_total{endpoint="x\\"y",status="200"} 1' in text
+
+
+def test_quantile_interpolates_within_bucket():
+    """Quantiles are estimated from bucket counts like histogram_quantile."""
+    registry = Registry()
+    assert registry.quantile("html2md_convert_seconds", 0.5) is None
+    for _ in range(4):
+        registry.observe("html2md_convert_seconds", 0.07)
+    assert abs(registry.quantile("html2md_convert_seconds", 0.5) - 0.075) < 1e-9
+
+
+def test_collect_sums_worker_snapshots(tmp_path):
+    """Other workers' snapshots are added up; stale gauges are dropped."""
+    registry = Registry()
+    registry.share(tmp_path, interval=3600)
+    registry.inc("html2md_bytes_in_total", 10)
+    registry.inc("html2md_conversions_in_flight")
+
+    other = Registry()
+    other.inc("html2md_bytes_in_total", 5)
+    other.inc("html2md_conversions_in_flight", 2)
+    write_snapshot(other.snapshot(), tmp_path / "metrics-1-live.json")
+    stale = other.snapshot()
+    stale["time"] = time.time() - 3600
+    write_snapshot(stale, tmp_path / "metrics-2-dead.json")
+
+    merged = collect(registry)["scalars"]
+    assert merged["html2md_bytes_in_total"][()] == 20
+    assert merged["html2md_conversions_in_flight"][()] == 3
+
+
+def test_metrics_endpoint_reports_conversions():
+    """/metrics exposes request counts and conversion latency after /convert."""
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        assert client.post("/convert", json={"html": "<p>hi</p>"}).status_code == 200
+        resp = client.get("/metrics")
+    text = resp.get_data(as_text=True)
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("text/plain; version=0.0.4")
+    assert 'html2md_requests_total{endpoint="convert",status="200"}' in text
+    assert "html2md_convert_seconds_count" in text
+    assert "html2md_http_pool_idle_connections" in text
+
+
+def _response(html: bytes) -> MagicMock:
+    response = MagicMock()
+    response.headers = {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = [html]
+    response.raise_for_status.return_value = None
+    return response
+
+
+@patch("requests.Session.get")
+def test_cli_stats_summary(mock_get, capsys, tmp_path):
+    """--stats prints counts, bytes and latency percentiles after the batch."""
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://a.example/1\nftp://a.example/2\n", encoding="utf-8")
+    mock_get.return_value = _response(b"<h1>Hi</h1>")
+
+    cli.main(["--batch", str(batch), "--stats"])
+    err = capsys.readouterr().err
+
+    assert "Stats: 2 URLs (1 ok, 1 failed), 11 bytes in, 4 bytes out" in err
+    assert "  fetch    p50 " in err
+    assert "HTTP pool:" in err
+
+
+def test_snapshot_is_json(tmp_path):
+    """Snapshots written for other workers are plain JSON."""
+    registry = Registry()
+    registry.observe("html2md_request_seconds", 0.1, endpoint="convert")
+    path = tmp_path / "metrics-1-x.json"
+    write_snapshot(registry.snapshot(), path)
+    assert json.loads(path.read_text(encoding="utf-8"))["histograms"]
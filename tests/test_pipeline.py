@@ -0,0 +1,79 @@
+"""Tests for the staged fetch/convert/write batch pipeline."""
+
+from unittest.mock import MagicMock, patch
+
+from html2md import cli
+from html2md.pipeline import Page, run_pipeline
+
+
+def _response(html: bytes) -> MagicMock:
+    response = MagicMock()
+    response.headers = {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = [html]
+    response.raise_for_status.return_value = None
+    return response
+
+
+def test_run_pipeline_converts_in_worker_processes(capsys):
+    """Every fetched page is converted out of process and written once."""
+    written = []
+
+    def fetch(url, out, err):
+        if url.endswith("bad"):
+            print("fetch failed", file=err)
+            return None
+        return Page(url, f"page {url}")
+
+    def write(page, md_content, out, err):
+        written.append((page.url, md_content))
+        print(f"wrote {page.url}", file=out)
+        return 0
+
+    urls = [f"u{i}" for i in range(10)] + ["bad"]
+    # str.upper is a picklable stand-in for the markdownify converter.
+    ret = run_pipeline(urls, fetch, str.upper, write, jobs=3, convert_workers=2)
+
+    assert ret == 1
+    assert sorted(written) == sorted((u, f"PAGE {u.upper()}") for u in urls[:-1])
+    outerr = capsys.readouterr()
+    assert "fetch failed" in outerr.err
+    for url in urls[:-1]:
+        assert f"Converting to Markdown...\nwrote {url}\n" in outerr.out
+
+
+def test_run_pipeline_reports_worker_conversion_errors(capsys):
+    """An exception raised inside a conversion worker fails only that URL."""
+    written = []
+
+    def fetch(url, out, err):
+        return Page(url, url)
+
+    def write(page, md_content, out, err):
+        written.append(page.url)
+        return 0
+
+    # int() raises ValueError in the worker for non-numeric input.
+    ret = run_pipeline(["1", "x", "2"], fetch, int, write, jobs=2, convert_workers=1)
+
+    assert ret == 1
+    assert sorted(written) == ["1", "2"]
+    assert "Conversion failed" in capsys.readouterr().err
+
+
+@patch("requests.Session.get")
+def test_cli_batch_convert_workers(mock_get, capsys, tmp_path):
+    """--convert-workers runs the batch through the process-pool pipeline."""
+    batch = tmp_path / "urls.txt"
+    outdir = tmp_path / "out"
+    urls = [f"http://example.com/page{i}" for i in range(6)]
+    batch.write_text("\n".join(urls) + "\n", encoding="utf-8")
+    mock_get.side_effect = lambda url, **kw: _response(b"<h1>Title</h1><p>Body</p>")
+
+    ret = cli.main(["--batch", str(batch), "--outdir", str(outdir),
+                    "--jobs", "3", "--convert-workers", "2"])
+
+    assert ret == 0
+    assert capsys.readouterr().out.count("Success! Saved to:") == len(urls)
+    for i in range(len(urls)):
+        assert (outdir / f"page{i}.md").read_text(encoding="utf-8").startswith("# Title")
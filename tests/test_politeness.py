@@ -0,0 +1,187 @@
+"""Tests for the per-domain rate policy and politeness scheduler."""
+
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from html2md import cli
+from html2md.politeness import (HostPolicy, PolicyError, RatePolicy, TokenBucket, interleave,
+                                load_policy, plan)
+
+POLICY = """
+window: 100
+default:
+  rate: 10
+  burst: 2
+domains:
+  example.com:
+    rate: 1
+    concurrency: 1
+  api.example.com:
+    rate: 5
+"""
+
+
+def _response(html: bytes) -> MagicMock:
+    response = MagicMock()
+    response.headers = {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = [html]
+    response.raise_for_status.return_value = None
+    return response
+
+
+def test_load_policy_matches_most_specific_domain(tmp_path):
+    path = tmp_path / "policy.yaml"
+    path.write_text(POLICY, encoding="utf-8")
+    policy = load_policy(path)
+
+    assert policy.window == 100
+    assert policy.key("www.Example.com") == "example.com"
+    assert policy.key("v2.api.example.com") == "api.example.com"
+    assert policy.key("other.org") == "other.org"
+    # Domain settings inherit unset keys from the default.
+    api = policy.for_key("api.example.com")
+    assert (api.rate, api.burst, api.concurrency) == (5.0, 2, None)
+    assert policy.concurrency("example.com", fallback=4) == 1
+    assert policy.concurrency("other.org", fallback=4) == 4
+
+
+@pytest.mark.parametrize("text", [
+    "- a list",
+    "default: {rate: 0}",
+    "default: {burst: 1.5}",
+    "domains: {example.com: {speed: 1}}",
+    "window: -1",
+    "default: [unclosed",
+])
+def test_load_policy_rejects_malformed_files(tmp_path, text):
+    path = tmp_path / "policy.yaml"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(PolicyError):
+        load_policy(path)
+
+
+def test_token_bucket_spaces_reservations():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, burst=2, clock=lambda: now[0])
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    now[0] = 10.0
+    assert bucket.reserve() == 0.0
+
+
+def test_token_bucket_ready_in_does_not_take_a_token():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, burst=1, clock=lambda: now[0])
+    assert bucket.ready_in() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.ready_in() == bucket.ready_in() == 0.5
+    now[0] = 0.25
+    assert bucket.ready_in() == 0.25
+    assert bucket.reserve() == 0.25
+
+
+def test_interleave_round_robins_within_window():
+    urls = ["a1", "a2", "a3", "a4", "b1", "b2", "c1"]
+    assert list(interleave(urls, lambda u: u[0])) == ["a1", "b1", "c1", "a2", "b2", "a3", "a4"]
+    # A small window only interleaves what it has read so far.
+    assert list(interleave(urls, lambda u: u[0], window=2)) == \
+        ["a1", "a2", "a3", "a4", "b1", "b2", "c1"]
+
+
+def test_interleave_does_not_wait_for_a_full_window_on_a_slow_source():
+    read = []
+
+    def source():
+        for url in ["a1", "a2", "b1"]:
+            read.append(url)
+            yield url
+
+    it = interleave(source(), lambda u: u[0], ready=lambda: False)
+    assert next(it) == "a1"
+    assert read == ["a1"]
+    assert list(it) == ["a2", "b1"]
+
+
+def test_plan_offsets_follow_rate_limits():
+    policy = RatePolicy(HostPolicy(rate=None), {"slow.test": HostPolicy(rate=2)})
+    urls = ["http://slow.test/1", "http://slow.test/2", "http://fast.test/1",
+            "http://slow.test/3"]
+    schedule = list(plan(urls, policy, lambda u: u.split("/")[2]))
+    assert schedule == [
+        (0.0, "slow.test", "http://slow.test/1"),
+        (0.0, "fast.test", "http://fast.test/1"),
+        (0.5, "slow.test", "http://slow.test/2"),
+        (1.0, "slow.test", "http://slow.test/3"),
+    ]
+
+
+def test_cli_dry_run_prints_schedule_without_fetching(tmp_path, capsys):
+    policy = tmp_path / "policy.yaml"
+    policy.write_text(POLICY, encoding="utf-8")
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://www.example.com/1\nhttp://www.example.com/2\n"
+                     "http://www.example.com/3\nhttp://other.org/1\n", encoding="utf-8")
+
+    with patch("requests.Session.get") as mock_get:
+        ret = cli.main(["--batch", str(batch), "--rate-policy", str(policy), "--dry-run"])
+
+    assert ret == 0
+    assert mock_get.call_count == 0
+    assert capsys.readouterr().out.splitlines() == [
+        "+0.000s\texample.com\tconcurrency=1\thttp://www.example.com/1",
+        "+0.000s\tother.org\tconcurrency=2\thttp://other.org/1",
+        "+0.000s\texample.com\tconcurrency=1\thttp://www.example.com/2",
+        "+1.000s\texample.com\tconcurrency=1\thttp://www.example.com/3",
+    ]
+
+
+def test_cli_rejects_bad_policy_file(tmp_path, capsys):
+    policy = tmp_path / "policy.yaml"
+    policy.write_text("default: {rate: -1}", encoding="utf-8")
+    assert cli.main(["--url", "http://example.com", "--rate-policy", str(policy)]) == 1
+    assert "rate must be a positive number" in capsys.readouterr().err
+
+
+@patch("requests.Session.get")
+def test_cli_batch_interleaves_hosts_and_throttles(mock_get, tmp_path, capsys):
+    policy = tmp_path / "policy.yaml"
+    policy.write_text("domains: {a.test: {rate: 20}}", encoding="utf-8")
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://a.test/1\nhttp://a.test/2\nhttp://a.test/3\nhttp://b.test/1\n",
+                     encoding="utf-8")
+    mock_get.side_effect = lambda url, **kw: _response(b"<p>ok</p>")
+
+    start = time.monotonic()
+    ret = cli.main(["--batch", str(batch), "--rate-policy", str(policy)])
+    elapsed = time.monotonic() - start
+
+    assert ret == 0
+    capsys.readouterr()
+    assert [c.args[0] for c in mock_get.call_args_list] == \
+        ["http://a.test/1", "http://b.test/1", "http://a.test/2", "http://a.test/3"]
+    # Three a.test requests at 20/s with a burst of one: two 50 ms gaps.
+    assert elapsed >= 0.09
+
+
+@patch("requests.Session.get")
+def test_cli_throttled_host_does_not_park_the_workers(mock_get, tmp_path, capsys):
+    """URLs waiting for a token are put off, so other hosts keep both workers."""
+    policy = tmp_path / "policy.yaml"
+    # A window of one keeps the batch order: the b.test URL comes last.
+    policy.write_text("window: 1\ndomains: {a.test: {rate: 4}}", encoding="utf-8")
+    batch = tmp_path / "urls.txt"
+    batch.write_text("".join(f"http://a.test/{i}\n" for i in range(1, 5)) + "http://b.test/1\n",
+                     encoding="utf-8")
+    mock_get.side_effect = lambda url, **kw: _response(b"<p>ok</p>")
+
+    ret = cli.main(["--batch", str(batch), "--rate-policy", str(policy), "--jobs", "2"])
+
+    assert ret == 0
+    capsys.readouterr()
+    fetched = [c.args[0] for c in mock_get.call_args_list]
+    assert sorted(fetched) == sorted(f"http://a.test/{i}" for i in range(1, 5)) + \
+        ["http://b.test/1"]
+    # Sleeping for tokens, both workers would hold a.test URLs until 0.5s.
+    assert fetched.index("http://b.test/1") < fetched.index("http://a.test/2")
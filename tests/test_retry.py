@@ -0,0 +1,183 @@
+"""Tests for retries, Retry-After handling and per-host circuit breakers."""
+
+import contextlib
+import json
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from html2md import cli
+from html2md.retry import Backoff, CircuitBreaker, parse_retry_after
+
+
+class _FlakyHandler(BaseHTTPRequestHandler):
+    """Answer each path from its script of outcomes, then with 200.
+
+    An outcome is ``(status, headers)`` or ``"reset"`` to drop the connection.
+    """
+
+    scripts = {}
+    seen = []
+    lock = threading.Lock()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        with self.lock:
+            self.seen.append(self.path)
+            script = self.scripts.get(self.path, [])
+            outcome = script.pop(0) if len(script) > 1 else (script[0] if script else None)
+        if outcome == "reset":
+            self.close_connection = True
+            return
+        status, headers = outcome or (200, {})
+        body = b"<h1>ok</h1>" if status == 200 else b"busy"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@contextlib.contextmanager
+def flaky_origin(scripts):
+    handler = type("Handler", (_FlakyHandler,),
+                   {"scripts": scripts, "seen": [], "lock": threading.Lock()})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", handler.seen
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _run(tmp_path, base, paths, *extra):
+    batch = tmp_path / "urls.txt"
+    batch.write_text("".join(f"{base}{p}\n" for p in paths), encoding="utf-8")
+    log = tmp_path / "run.jsonl"
+    code = cli.main(["--batch", str(batch), "--outdir", str(tmp_path / "out"),
+                     "--log", str(log), *extra])
+    records = [json.loads(line) for line in log.read_text(encoding="utf-8").splitlines()]
+    return code, {r["input"][len(base):]: r for r in records}
+
+
+@pytest.fixture(autouse=True)
+def _no_proxy(monkeypatch):
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1")
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after(formatdate(1000.0 + 30, usegmt=True), now=1000.0) == 30.0
+    assert parse_retry_after(formatdate(1000.0, usegmt=True), now=2000.0) == 0.0
+    for bad in (None, "", "soon", "-5"):
+        assert parse_retry_after(bad) is None
+
+
+def test_backoff_full_jitter_is_capped():
+    assert Backoff(base=1, cap=5, rng=lambda: 1.0).delay(10) == 5
+    assert Backoff(base=1, cap=5, rng=lambda: 0.5).delay(2) == 2.0
+    assert Backoff(cap=5).delay(0, retry_after=3.0) == 3.0
+    assert Backoff(cap=5).delay(0, retry_after=60.0) is None
+
+
+def test_circuit_breaker_opens_and_probes():
+    now = [0.0]
+    breaker = CircuitBreaker(threshold=2, cooldown=10, clock=lambda: now[0])
+    breaker.failure("a")
+    assert breaker.allow("a")
+    breaker.failure("a")
+    assert not breaker.allow("a") and breaker.allow("b")
+    now[0] = 4.0
+    assert breaker.wait("a") == 6.0 and breaker.wait("b") == 0.0
+    now[0] = 10.0
+    assert breaker.allow("a")          # one probe after the cool-down
+    assert not breaker.allow("a")
+    assert breaker.wait("a") == 10     # a full cool-down while the probe is out
+    breaker.failure("a")               # failed probe: open again
+    assert not breaker.allow("a")
+    now[0] = 20.0
+    assert breaker.allow("a")
+    breaker.success("a")
+    assert breaker.allow("a") and not breaker.is_open("a")
+
+
+def test_cli_retries_transient_failures(tmp_path, capsys):
+    scripts = {
+        "/busy": [(503, {"Retry-After": "0"}), (429, {}), (200, {})],
+        "/reset": ["reset", (200, {})],
+        "/missing": [(404, {})],
+    }
+    with flaky_origin(scripts) as (base, seen):
+        code, records = _run(tmp_path, base, ["/busy", "/reset", "/missing"],
+                             "--retries", "3", "--retry-backoff", "0.01")
+
+    assert code == 1
+    assert (records["/busy"]["status"], records["/busy"]["retries"]) == ("ok", 2)
+    assert (records["/reset"]["status"], records["/reset"]["retries"]) == ("ok", 1)
+    # Permanent errors are not retried.
+    assert (records["/missing"]["status"], records["/missing"]["retries"]) == ("error", 0)
+    assert seen.count("/busy") == 3 and seen.count("/missing") == 1
+    err = capsys.readouterr().err
+    assert f"Retrying {base}/busy in 0.0s (retry 1/3)." in err
+    assert f"Retrying {base}/busy" in err and "(retry 2/3)" in err
+
+
+def test_cli_gives_up_with_final_reason(tmp_path, capsys):
+    scripts = {"/down": [(503, {})], "/later": [(503, {"Retry-After": "3600"})]}
+    with flaky_origin(scripts) as (base, seen):
+        code, records = _run(tmp_path, base, ["/down", "/later"],
+                             "--retries", "2", "--retry-backoff", "0.01")
+
+    assert code == 1
+    down = records["/down"]
+    assert (down["status"], down["retries"], down["http_status"]) == ("error", 2, 503)
+    assert down["reason"].endswith("(after 3 attempts)")
+    # A Retry-After beyond --retry-max-wait is respected by not retrying at all.
+    assert records["/later"]["retries"] == 0 and seen.count("/later") == 1
+    err = capsys.readouterr().err
+    assert f"Giving up on {base}/down after 3 attempts." in err
+    assert "exceeds --retry-max-wait" in err
+
+
+@pytest.mark.parametrize("mode", [[], ["--convert-workers", "1"]])
+def test_cli_retry_wait_does_not_block_other_urls(tmp_path, mode):
+    scripts = {"/slow": [(503, {"Retry-After": "1"}), (200, {})]}
+    paths = ["/slow", "/a", "/b", "/c"]
+    with flaky_origin(scripts) as (base, seen):
+        start = time.monotonic()
+        code, records = _run(tmp_path, base, paths, "--retries", "1", "--jobs", "1", *mode)
+        elapsed = time.monotonic() - start
+
+    assert code == 0
+    assert seen == ["/slow", "/a", "/b", "/c", "/slow"]
+    assert records["/slow"]["retries"] == 1
+    assert elapsed >= 1.0
+
+
+def test_cli_circuit_breaker_holds_back_a_failing_host(tmp_path, capsys):
+    scripts = {f"/p{i}": [(503, {}), (200, {})] for i in range(3)}
+    paths = [f"/p{i}" for i in range(6)]
+    with flaky_origin(scripts) as (base, seen):
+        start = time.monotonic()
+        code, records = _run(tmp_path, base, paths, "--retries", "1", "--retry-backoff", "0",
+                             "--circuit-breaker", "2", "--circuit-cooldown", "0.3")
+        elapsed = time.monotonic() - start
+
+    # URLs held back by the open circuit were put off, not failed, and
+    # did not use up their retry.
+    assert code == 0
+    assert all(r["status"] == "ok" for r in records.values())
+    assert [records[p]["retries"] for p in paths] == [1, 1, 1, 0, 0, 0]
+    assert len(seen) == 9
+    assert elapsed >= 0.3
+    assert "Circuit open for 127.0.0.1" in capsys.readouterr().err
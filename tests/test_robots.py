@@ -0,0 +1,185 @@
+"""Tests for robots.txt caching and meta-robots handling."""
+
+import contextlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from html2md import cli
+from html2md.robots import RobotsCache, header_directives, page_directives, strip_links
+
+# The html2md group replaces the "*" group for our agent.
+ROBOTS = ("User-agent: *\nDisallow: /\n\n"
+          "User-agent: html2md\nDisallow: /private\nDisallow: /no-html2md\n")
+
+
+class _OriginHandler(BaseHTTPRequestHandler):
+    pages = {}
+    seen = []
+    agents = []
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.seen.append(self.path)
+        self.agents.append(self.headers.get("User-Agent", ""))
+        page = self.pages.get(self.path)
+        if page is None:
+            self.send_error(404)
+            return
+        body, headers = page
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@contextlib.contextmanager
+def origin(pages):
+    handler = type("Handler", (_OriginHandler,), {"pages": pages, "seen": [], "agents": []})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", handler
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def _no_proxy(monkeypatch):
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1")
+
+
+def test_page_directives_read_only_the_head():
+    html = ('<html><head><META name="Robots" content="NoIndex, follow">'
+            '<meta name="description" content="noindex"></head>'
+            '<body><meta name="robots" content="nofollow"></body></html>')
+    assert page_directives(html) == {"noindex", "follow"}
+    assert page_directives('<meta name=html2md content=none><body>') == {"none", "noindex",
+                                                                          "nofollow"}
+    assert page_directives("<p>no head at all</p>") == set()
+
+
+def test_header_directives_respect_agent_prefixes():
+    assert header_directives("noindex, nofollow") == {"noindex", "nofollow"}
+    assert header_directives("googlebot: noindex, html2md: nofollow") == {"nofollow"}
+    assert header_directives("unavailable_after: 25 Jun 2030 15:00:00 PST") == set()
+    assert header_directives(None) == set()
+
+
+def test_strip_links_keeps_text_and_images():
+    md = 'See [the docs](http://x/a "Docs") and ![logo](http://x/l.png) [b](http://x/(1))'
+    assert strip_links(md) == "See the docs and ![logo](http://x/l.png) b"
+    assert strip_links("[![logo](/logo.png)](https://example.com/home) go!") == \
+        "![logo](/logo.png) go!"
+
+
+def test_robots_cache_fetches_each_origin_once(tmp_path):
+    calls = []
+    lock = threading.Lock()
+
+    def fetch(url):
+        with lock:
+            calls.append(url)
+        return 200, ROBOTS
+
+    now = [1000.0]
+    db = tmp_path / "robots.sqlite3"
+    cache = RobotsCache(fetch, ttl=60, path=db, clock=lambda: now[0])
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        cache.allowed("http://a.test/private/x"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [False] * 8
+    assert cache.allowed("http://a.test/public")
+    assert not cache.allowed("http://a.test/no-html2md")
+    assert calls == ["http://a.test/robots.txt"]
+    cache.close()
+
+    # A second cache (another run or process) reuses the rules on disk until they expire.
+    again = RobotsCache(fetch, ttl=60, path=db, clock=lambda: now[0])
+    assert not again.allowed("http://a.test/private")
+    assert len(calls) == 1
+    now[0] += 61
+    assert not again.allowed("http://a.test/private")
+    assert len(calls) == 2
+    again.close()
+
+
+@pytest.mark.parametrize("status, allowed", [(404, True), (503, False), (None, False)])
+def test_robots_cache_unavailable_and_unreachable(status, allowed):
+    cache = RobotsCache(lambda url: (status, ""))
+    assert cache.allowed("https://b.test/page") is allowed
+
+
+def test_cli_respects_robots_and_meta(tmp_path):
+    pages = {
+        "/robots.txt": (ROBOTS.encode(), {}),
+        "/open": (b'<head><title>t</title></head><body><a href="/x">link</a></body>', {}),
+        "/private/secret": (b"<p>secret</p>", {}),
+        "/noindex": (b'<head><meta name="robots" content="noindex"></head><p>hidden</p>', {}),
+        "/header": (b"<p>hidden</p>", {"X-Robots-Tag": "html2md: noindex"}),
+        "/nofollow": (b'<head><meta name="robots" content="nofollow"></head>'
+                      b'<p><a href="http://elsewhere.test/">away</a></p>', {}),
+    }
+    with origin(pages) as (base, handler):
+        seen = handler.seen
+        batch = tmp_path / "urls.txt"
+        paths = ["/open", "/private/secret", "/noindex", "/header", "/nofollow"]
+        batch.write_text("".join(f"{base}{p}\n" for p in paths), encoding="utf-8")
+        log = tmp_path / "run.jsonl"
+        out = tmp_path / "out"
+        ret = cli.main(["--batch", str(batch), "--outdir", str(out), "--log", str(log),
+                        "--respect-robots", "--jobs", "3", "--cache-dir", str(tmp_path / "c")])
+
+    assert ret == 0
+    assert seen.count("/robots.txt") == 1
+    # Every request, robots.txt included, names the token the rules were matched on.
+    assert all("(compatible; html2md)" in agent for agent in handler.agents)
+    assert "/private/secret" not in seen
+    records = {json.loads(line)["input"][len(base):]: json.loads(line)
+               for line in log.read_text(encoding="utf-8").splitlines()}
+    assert {p: (r["status"], r["reason"]) for p, r in records.items()} == {
+        "/open": ("ok", ""),
+        "/private/secret": ("skipped", "disallowed by robots.txt"),
+        "/noindex": ("skipped", "noindex"),
+        "/header": ("skipped", "noindex"),
+        "/nofollow": ("ok", ""),
+    }
+    assert sorted(p.name for p in out.iterdir()) == ["nofollow.md", "open.md"]
+    assert "[link](/x)" in (out / "open.md").read_text(encoding="utf-8")
+    nofollow = (out / "nofollow.md").read_text(encoding="utf-8")
+    assert "away" in nofollow and "elsewhere.test" not in nofollow
+
+
+
+def test_cli_robots_fetch_is_throttled(tmp_path):
+    """The robots.txt request takes a --rate-policy token like the pages do."""
+    pages = {"/robots.txt": (b"User-agent: *\nAllow: /\n", {}),
+             "/a": (b"<p>a</p>", {}), "/b": (b"<p>b</p>", {})}
+    policy = tmp_path / "policy.yaml"
+    policy.write_text("domains: {127.0.0.1: {rate: 20}}", encoding="utf-8")
+    with origin(pages) as (base, handler):
+        batch = tmp_path / "urls.txt"
+        batch.write_text(f"{base}/a\n{base}/b\n", encoding="utf-8")
+        start = time.monotonic()
+        ret = cli.main(["--batch", str(batch), "--outdir", str(tmp_path / "out"),
+                        "--respect-robots", "--rate-policy", str(policy)])
+        elapsed = time.monotonic() - start
+
+    assert ret == 0
+    assert handler.seen == ["/robots.txt", "/a", "/b"]
+    # Three requests at 20/s with a burst of one: two 50 ms gaps.
+    assert elapsed >= 0.09
@@ -0,0 +1,108 @@
+"""Tests for the structured JSONL run log (--log)."""
+
+import csv
+import json
+from unittest.mock import MagicMock, patch
+
+from html2md import cli
+from html2md.log_export import main as export_main
+from html2md.runlog import RunLog, RunRecord
+
+
+def _response(status: int, html: bytes = b"") -> MagicMock:
+    response = MagicMock()
+    response.status_code = status
+    response.headers = {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = [html]
+    response.raise_for_status.return_value = None
+    return response
+
+
+def _records(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_run_log_batches_writes(tmp_path):
+    """Records are held back until a batch is full or the log is closed."""
+    path = tmp_path / "run.jsonl"
+    log = RunLog(path, flush_lines=3, flush_interval=3600)
+    for i in range(4):
+        record = RunRecord(f"http://example.com/{i}")
+        record.finish(0)
+        log.write(record)
+        if i == 1:
+            assert path.read_text(encoding="utf-8") == ""
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 3
+    log.close()
+    assert [r["input"] for r in _records(path)] == [f"http://example.com/{i}" for i in range(4)]
+
+
+def test_run_record_keeps_first_failure_reason():
+    """The earliest failure explains the record; later ones do not overwrite it."""
+    record = RunRecord("http://example.com/")
+    record.add("fetch", 0.0125)
+    record.fail("Network error: boom")
+    record.fail("Conversion failed: later")
+    record.finish(1)
+    rec = record.as_dict()
+    assert (rec["status"], rec["reason"]) == ("error", "Network error: boom")
+    assert rec["fetch_ms"] == 12.5
+    assert rec["write_ms"] == 0.0
+
+
+@patch("requests.Session.get")
+def test_cli_log_records_every_url(mock_get, capsys, tmp_path):
+    """--log writes one record per URL with status, size and stage timings."""
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://a.example/ok\nftp://b.example/bad\n", encoding="utf-8")
+    mock_get.return_value = _response(200, b"<h1>Hi</h1>")
+    log_path = tmp_path / "run.jsonl"
+
+    ret = cli.main(["--batch", str(batch), "--outdir", str(tmp_path / "out"),
+                    "--log", str(log_path)])
+    capsys.readouterr()
+
+    assert ret == 1
+    ok, bad = _records(log_path)
+    assert ok["input"] == "http://a.example/ok"
+    assert ok["output"] == str(tmp_path / "out" / "ok.md")
+    assert (ok["status"], ok["reason"], ok["http_status"], ok["bytes"]) == ("ok", "", 200, 11)
+    assert all(ok[f"{stage}_ms"] >= 0 for stage in ("fetch", "decode", "convert", "write"))
+    assert bad["status"] == "error"
+    assert "Unsupported URL scheme 'ftp'" in bad["reason"]
+    assert bad["http_status"] is None
+
+
+@patch("requests.Session.get")
+def test_cli_log_is_readable_by_log_export(mock_get, capsys, tmp_path):
+    """The run log feeds html2md-log-export without any conversion."""
+    mock_get.return_value = _response(200, b"<p>x</p>")
+    log_path = tmp_path / "run.jsonl"
+    cli.main(["--url", "http://example.com/doc", "--log", str(log_path)])
+    capsys.readouterr()
+
+    csv_path = tmp_path / "run.csv"
+    assert export_main(["--in", str(log_path), "--out", str(csv_path),
+                        "--fields", "input,output,status,http_status"]) == 0
+    with csv_path.open(encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert rows == [{"input": "http://example.com/doc", "output": "<stdout>",
+                     "status": "ok", "http_status": "200"}]
+
+
+@patch("requests.Session.get")
+def test_cli_log_with_convert_workers(mock_get, capsys, tmp_path):
+    """Pages converted in worker processes are logged with their conversion time."""
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://a.example/one\nhttp://a.example/two\n", encoding="utf-8")
+    mock_get.return_value = _response(200, b"<h1>Hi</h1>")
+    log_path = tmp_path / "run.jsonl"
+
+    ret = cli.main(["--batch", str(batch), "--convert-workers", "1", "--log", str(log_path)])
+    capsys.readouterr()
+
+    assert ret == 0
+    records = _records(log_path)
+    assert sorted(r["input"] for r in records) == ["http://a.example/one", "http://a.example/two"]
+    assert all(r["status"] == "ok" and r["convert_ms"] > 0 for r in records)
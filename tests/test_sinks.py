@@ -0,0 +1,109 @@
+"""Tests for the sharded and archive output sinks (--sink)."""
+
+import json
+import tarfile
+import zipfile
+from unittest.mock import MagicMock, patch
+
+from html2md import cli
+from html2md.sinks import JsonlShards, TarShards, ZipShards
+
+
+def test_jsonl_shards_rotate_by_size(tmp_path):
+    shards = JsonlShards(tmp_path, max_bytes=100)
+    paths = [shards.put(f"http://a/{i}", f"http://a/{i}", "x.md", "m" * 60, "h")
+             for i in range(3)]
+    assert not (tmp_path / "html2md-00002.jsonl").exists()  # still being written
+    shards.close()
+
+    assert [p.name for p in paths] == \
+        ["html2md-00000.jsonl", "html2md-00001.jsonl", "html2md-00002.jsonl"]
+    assert not list(tmp_path.glob("*.part"))
+    row = json.loads((tmp_path / "html2md-00001.jsonl").read_text(encoding="utf-8"))
+    assert row == {"url": "http://a/1", "final_url": "http://a/1", "markdown": "m" * 60,
+                   "sha256": "h"}
+    # A new writer continues the numbering instead of overwriting.
+    again = JsonlShards(tmp_path, max_bytes=100)
+    assert again.put("http://a/9", "http://a/9", "x.md", "m", "h").name == \
+        "html2md-00003.jsonl"
+    again.close()
+
+
+def test_tar_shard_keeps_entries_with_the_same_name(tmp_path):
+    shards = TarShards(tmp_path, max_bytes=1 << 20)
+    shards.put("http://a/x/index", "http://a/x/index", "index.md", "# A", "ha")
+    path = shards.put("http://b/y/index", "http://b/y/", "index.md", "# B", "hb")
+    shards.close()
+
+    with tarfile.open(path) as tar:
+        members = tar.getmembers()
+        assert [m.name for m in members] == ["index.md", "index-2.md"]
+        assert tar.extractfile(members[1]).read() == b"# B"
+        assert members[1].pax_headers["HTML2MD.final_url"] == "http://b/y/"
+
+
+def test_zip_shard_entries(tmp_path):
+    shards = ZipShards(tmp_path, max_bytes=1 << 20)
+    path = shards.put("http://a/p", "http://a/p", "p.md", "café", "h")
+    shards.close()
+
+    with zipfile.ZipFile(path) as zf:
+        assert zf.read("p.md").decode("utf-8") == "café"
+        assert zf.getinfo("p.md").comment == b"http://a/p"
+
+
+def _respond(url, **kw):
+    response = MagicMock()
+    response.headers = {}
+    response.encoding = "utf-8"
+    response.url = url + "?redirected"
+    response.iter_content.return_value = [f"<h1>{url}</h1>".encode()]
+    return response
+
+
+@patch("requests.Session.get")
+def test_cli_resume_redoes_urls_of_an_unfinished_shard(mock_get, tmp_path, capsys):
+    mock_get.side_effect = _respond
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://a.example/1\nhttp://a.example/2\n", encoding="utf-8")
+    outdir = tmp_path / "out"
+    args = ["--batch", str(batch), "--outdir", str(outdir), "--sink", "jsonl", "--resume"]
+
+    # A run killed mid-shard never renames its .part file.
+    with patch("html2md.cli._close_shards", return_value=0):
+        assert cli.main(args) == 0
+    assert [p.name for p in outdir.glob("*.jsonl*")] == ["html2md-00000.jsonl.part"]
+    capsys.readouterr()
+
+    assert cli.main(args) == 0
+    assert "Resume: 0 URLs already done" in capsys.readouterr().err
+    assert mock_get.call_count == 4
+    assert (outdir / "html2md-00001.jsonl").read_text(encoding="utf-8").count("\n") == 2
+
+
+@patch("requests.Session.get")
+def test_cli_batch_writes_jsonl_shards(mock_get, tmp_path, capsys):
+    mock_get.side_effect = _respond
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://a.example/index\nhttp://b.example/index\n", encoding="utf-8")
+    outdir = tmp_path / "out"
+
+    assert cli.main(["--batch", str(batch), "--outdir", str(outdir), "--sink", "jsonl"]) == 0
+
+    assert [p.name for p in outdir.iterdir()] == ["html2md-00000.jsonl"]
+    rows = [json.loads(line) for line in
+            (outdir / "html2md-00000.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [(r["url"], r["final_url"]) for r in rows] == [
+        ("http://a.example/index", "http://a.example/index?redirected"),
+        ("http://b.example/index", "http://b.example/index?redirected"),
+    ]
+    assert rows[1]["markdown"].strip() == "# http://b.example/index"
+    assert "Saved to: " in capsys.readouterr().out
+
+
+def test_cli_sink_validation(capsys):
+    assert cli.main(["--url", "http://a.example/", "--sink", "tar"]) == 1
+    assert "--sink tar needs --outdir" in capsys.readouterr().err
+    assert cli.main(["--url", "http://a.example/", "--outdir", "o", "--sink", "zip",
+                     "--stream"]) == 1
+    assert "--stream cannot be combined with --sink" in capsys.readouterr().err
@@ -0,0 +1,40 @@
+"""Tests for the streaming sketches."""
+
+import random
+
+from html2md.sketches import HyperLogLog, QuantileSketch
+
+
+def test_quantile_sketch_is_within_relative_accuracy():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(3, 1) for _ in range(20000))
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for v in values:
+        sketch.add(v)
+
+    assert sketch.count == len(values)
+    for q in (0.5, 0.95, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * exact
+
+
+def test_quantile_sketch_empty_zeros_and_bucket_cap():
+    sketch = QuantileSketch(max_buckets=8)
+    assert sketch.quantile(0.5) is None
+    for v in [0, 0, 0] + [10 ** i for i in range(12)]:
+        sketch.add(v)
+    assert sketch.quantile(0.0) == 0.0
+    assert len(sketch._buckets) <= 8  # pylint: disable=protected-access
+    assert abs(sketch.quantile(1.0) - 1e11) <= 0.01 * 1e11
+
+
+def test_hyperloglog_estimates_distinct_values():
+    small = HyperLogLog()
+    for i in range(100):
+        small.add(f'https://example.com/{i % 50}')
+    assert small.estimate() == 50
+
+    large = HyperLogLog()
+    for i in range(100000):
+        large.add(f'https://example.com/{i}')
+    assert abs(large.estimate() - 100000) <= 5000
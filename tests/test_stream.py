@@ -0,0 +1,130 @@
+"""Tests for the incremental HTML to Markdown converter."""
+
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+from markdownify import markdownify
+
+from html2md import cli
+from html2md.stream import StreamingConverter, convert
+
+DOCUMENT = (
+    "<html><head><title>T</title><style>p {}</style></head><body>"
+    "<h1>Café  guide</h1><p>Para <b>bold</b> and <i>it</i> <a href='/x' title='tt'>link</a>.</p>"
+    "<ul><li>a</li><li>b<ul><li>c</li></ul></li></ul>"
+    "<blockquote><p>q1</p><p>q2</p></blockquote><hr>"
+    "<pre><code>x = 1\n  y</code></pre>"
+    "<table><tr><th>A</th><th>B</th></tr><tr><td>1</td><td>2</td></tr></table>"
+    "<p>a_b *c* <code>d_e</code> <img src='i.png' alt='A'><br>end</p>"
+    "</body></html>"
+)
+
+
+@pytest.mark.parametrize("html", [
+    DOCUMENT,
+    "<ol start='3'><li>one</li><li>two</li></ol><p>after</p>",
+    "<div>text in div</div><span>span</span><h2>H2</h2>",
+    "<p>x</p>\n\n<p>y</p> tail <div><p>in</p></div>",
+])
+def test_convert_matches_markdownify(html):
+    """Ordinary documents render like markdownify with ATX headings."""
+    assert convert(html) == markdownify(html, heading_style="ATX").strip()
+
+
+def test_streaming_handles_arbitrary_chunk_boundaries():
+    """Splitting the bytes anywhere, even inside a character, gives the same output."""
+    data = DOCUMENT.encode("utf-8")
+    parts = []
+    converter = StreamingConverter(parts.append, "utf-8")
+    for i in range(len(data)):
+        converter.feed(data[i:i + 1])
+    converter.close()
+    assert "".join(parts) == convert(DOCUMENT)
+
+
+def test_streaming_emits_blocks_before_the_document_ends():
+    """Finished blocks are written as soon as they close."""
+    parts = []
+    converter = StreamingConverter(parts.append)
+    converter.feed(b"<h1>First</h1><p>still open")
+    assert parts == ["# First"]
+    converter.feed(b"</p>")
+    converter.close()
+    assert "".join(parts) == "# First\n\nstill open"
+
+
+def _response(chunks) -> MagicMock:
+    response = MagicMock()
+    response.headers = {}
+    response.encoding = "utf-8"
+    response.iter_content.return_value = chunks
+    response.raise_for_status.return_value = None
+    return response
+
+
+@patch("requests.Session.get")
+def test_cli_stream_writes_outdir_file(mock_get, capsys, tmp_path):
+    """--stream converts into --outdir without calling markdownify."""
+    mock_get.return_value = _response([b"<h1>Ti", b"tle</h1><p>Bo", b"dy</p>"])
+
+    with patch("markdownify.markdownify") as mock_md:
+        ret = cli.main(["--url", "http://example.com/doc", "--outdir", str(tmp_path), "--stream"])
+
+    assert ret == 0
+    mock_md.assert_not_called()
+    assert (tmp_path / "doc.md").read_text(encoding="utf-8") == "# Title\n\nBody"
+    assert "Success! Saved to:" in capsys.readouterr().out
+
+
+@patch("requests.Session.get")
+def test_cli_stream_unknown_charset_leaves_no_part_file(mock_get, capsys, tmp_path):
+    response = _response([b"<h1>Title</h1>"])
+    response.encoding = "x-bogus"
+    mock_get.return_value = response
+
+    ret = cli.main(["--url", "http://example.com/doc", "--outdir", str(tmp_path), "--stream"])
+
+    assert ret == 1
+    assert list(tmp_path.iterdir()) == []
+    assert "x-bogus" in capsys.readouterr().err
+
+
+@patch("requests.Session.get")
+def test_cli_stream_same_file_name_from_two_threads(mock_get, capsys, tmp_path):
+    """Concurrent pages with one output name write their own part files."""
+    both_open = threading.Barrier(2, timeout=5)
+
+    def body(text):
+        yield f"<h1>{text}</h1>".encode()
+        both_open.wait()
+        yield f"<p>{text} body</p>".encode()
+
+    def get(url, **kwargs):
+        response = _response(None)
+        response.iter_content.return_value = body(url.split("//")[1].split(".")[0])
+        return response
+
+    mock_get.side_effect = get
+    batch = tmp_path / "urls.txt"
+    batch.write_text("http://a.example/doc\nhttp://b.example/doc\n", encoding="utf-8")
+    out = tmp_path / "out"
+
+    ret = cli.main(["--batch", str(batch), "--outdir", str(out), "--stream", "--jobs", "2"])
+
+    assert ret == 0, capsys.readouterr().err
+    assert [p.name for p in out.iterdir()] == ["doc.md"]
+    assert (out / "doc.md").read_text(encoding="utf-8") in ("# a\n\na body", "# b\n\nb body")
+
+
+@patch("requests.Session.get")
+def test_cli_stream_enforces_max_size(mock_get, capsys, tmp_path):
+    """Oversized streamed bodies fail and leave no partial output behind."""
+    chunk = b"<p>" + b"x" * (1024 * 1024) + b"</p>"
+    mock_get.return_value = _response([chunk] * 11)
+
+    ret = cli.main(["--url", "http://example.com/big", "--outdir", str(tmp_path), "--stream"])
+
+    assert ret == 1
+    assert "exceeds maximum allowed size" in capsys.readouterr().err
+    assert not list(tmp_path.iterdir())